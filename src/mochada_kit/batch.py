@@ -0,0 +1,308 @@
+"""
+Functions to generate the plantuml code of CHADA tables for all json
+and yaml files in a folder tree. The files are converted by a pool of
+processes, one file per task, and the result of each file (success or
+error, and timings) is reported. The puml code of each file can be
+rendered as soon as it has been written, while the remaining files are
+still being converted.
+"""  # noqa: D400
+
+import collections
+import concurrent.futures
+import pathlib
+import re
+import time
+import traceback
+
+from mochada_kit.concurrency import auto_workers, available_cpus
+from mochada_kit.running import run_plantuml_code
+from mochada_kit.tables import ChadaDocument, _load_data
+from mochada_kit.validation import _problem, compile_chada_schema, validate_chada
+
+_CHADA_SUFFIXES = (".json", ".yaml")
+_NAMED_START_RE = re.compile(r"^@start\w+[ \t]+(\S+)", re.MULTILINE)
+
+
+def find_chada_sources(source_dir):
+    """
+    List the json and yaml files in a folder and all its subfolders.
+
+    Hidden files and folders (starting with ".") are ignored.
+
+    Parameters
+    ----------
+    source_dir : STR or pathlib.Path
+        The folder to search.
+
+    Returns
+    -------
+    files : LIST
+        Sorted list of pathlib.Path pointing to the files.
+    """
+    source_dir = pathlib.Path(source_dir)
+    return sorted(
+        f
+        for f in source_dir.rglob("*")
+        if f.is_file()
+        and f.suffix in _CHADA_SUFFIXES
+        and not any(p.startswith(".") for p in f.relative_to(source_dir).parts)
+    )
+
+
+def validate_chada_tree(source_dir):
+    """
+    Check every json and yaml file in a folder tree against the structure
+    of the CHADA tables templates (see validation.validate_chada()),
+    without writing any plantuml code.
+
+    Parameters
+    ----------
+    source_dir : STR or pathlib.Path
+        The folder containing the json and yaml files, which may be in
+        subfolders (see find_chada_sources()).
+
+    Returns
+    -------
+    report : DICT
+        Dict where the keys are the paths of the files as strings, in the
+        order of find_chada_sources(), and the values are the lists of
+        problems of each file. A file which cannot be read has one error
+        at the path "$".
+    """
+    schema = compile_chada_schema()
+    report = {}
+    for f in find_chada_sources(source_dir):
+        try:
+            data = _load_data(f, f.suffix[1:])
+        except Exception as e:
+            report[str(f)] = [_problem("$", "json or yaml", _error_message(e))]
+        else:
+            report[str(f)] = validate_chada(data, schema)
+    return report
+
+
+def convert_chada_file(
+    data_path, out_path=None, linked=True, single_file=False, **kwargs
+):
+    """
+    Write the plantuml code of all eleven CHADA table diagrams for one
+    json or yaml file (see tables.ChadaDocument.write_all()), catching
+    any error.
+
+    Parameters
+    ----------
+    data_path : STR or pathlib.Path
+        The json or yaml file.
+    out_path : STR, pathlib.Path or None, optional
+        The folder for the puml code, see tables.ChadaDocument.
+        The default is None.
+    linked : BOOL, optional
+        See tables.ChadaDocument.linked_puml().
+        The default is True.
+    single_file : BOOL, optional
+        If True, write all eleven diagrams to one puml code file (see
+        tables.ChadaDocument.write_combined()).
+        The default is False.
+    **kwargs
+        Further arguments of tables.ChadaDocument, and theme_names (see
+        tables.ChadaDocument.puml_variants()).
+
+    Returns
+    -------
+    result : DICT
+        Dict with the keys "path" (data_path as a string), "ok" (True if
+        the file was converted), "outputs" (list of the paths of the puml
+        code files as strings), "changed" (the outputs which were written
+        because their content changed), "duration" (seconds) and "error"
+        (None, or the error message).
+    """
+    start = time.perf_counter()
+    theme_names = kwargs.pop("theme_names", None)
+    result = {
+        "path": str(data_path),
+        "ok": False,
+        "outputs": [],
+        "changed": [],
+        "error": None,
+    }
+    try:
+        doc = ChadaDocument(data_path, out_path=out_path, **kwargs)
+        if single_file:
+            changed = doc.write_combined(linked=linked, theme_names=theme_names)
+        else:
+            changed = doc.write_all(linked=linked, theme_names=theme_names)
+        result["outputs"] = [str(p) for p in changed]
+        result["changed"] = [str(p) for p, c in changed.items() if c]
+        result["ok"] = True
+    except Exception as e:
+        result["error"] = _error_message(e)
+    result["duration"] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def _image_stems(puml_path):
+    # plantuml names the image of a block "@startjson name" after the name
+    names = _NAMED_START_RE.findall(puml_path.read_text(encoding="utf-8"))
+    return names or [puml_path.stem]
+
+
+def _error_message(e):
+    return "".join(traceback.format_exception_only(type(e), e)).strip()
+
+
+def _render_outputs(result, render_opts):
+    # render the puml code files of one converted source file which have
+    # changed, or whose images do not all exist yet
+    start = time.perf_counter()
+    extension = render_opts.get("output_type", "-tsvg")[2:]
+    output_dir = render_opts.get("output_dir")
+    try:
+        for f in map(pathlib.Path, result["outputs"]):
+            images = [
+                pathlib.Path(output_dir or f.parent).joinpath(f"{n}.{extension}")
+                for n in _image_stems(f)
+            ]
+            if str(f) in result["changed"] or not all(i.exists() for i in images):
+                run_plantuml_code(f, **render_opts)
+        result["rendered"] = True
+    except Exception as e:
+        result["rendered"] = False
+        result["error"] = _error_message(e)
+    result["render_duration"] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def convert_chada_tree(
+    source_dir,
+    out_dir=None,
+    workers=None,
+    linked=True,
+    render=False,
+    render_opts=None,
+    progress=None,
+    **kwargs,
+):
+    """
+    Write the plantuml code of the CHADA table diagrams for every json
+    and yaml file in a folder tree, using a pool of processes.
+
+    Parameters
+    ----------
+    source_dir : STR or pathlib.Path
+        The folder containing the json and yaml files, which may be in
+        subfolders (see find_chada_sources()).
+    out_dir : STR, pathlib.Path or None, optional
+        The folder for the puml code. The subfolders of source_dir are
+        created in out_dir as needed. If None, the puml code of each file
+        is written to the folder containing it. The puml code files are
+        named as in tables.ChadaDocument.puml_variants(), except that a
+        json and a yaml file with the same name in the same folder get
+        the stems "<name>_json" and "<name>_yaml".
+        The default is None.
+    workers : INT or None, optional
+        The number of processes converting files. If None, one per
+        available CPU is used.
+        The default is None.
+    linked : BOOL, optional
+        See tables.ChadaDocument.linked_puml().
+        The default is True.
+    render : BOOL, optional
+        If True, the puml code of each file is rendered with
+        running.run_plantuml_code() as soon as it has been written. Puml
+        code files which were not changed (see convert_chada_file()) are
+        only rendered if their image does not exist.
+        The default is False.
+    render_opts : DICT or None, optional
+        Arguments for running.run_plantuml_code(), e.g. plantuml_path or
+        output_type.
+        The default is None.
+    progress : CALLABLE or None, optional
+        Called with the result of each file as soon as it is finished.
+        The default is None.
+    **kwargs
+        Further arguments for convert_chada_file(), e.g. single_file,
+        theme_name, title or theme_names.
+
+    Returns
+    -------
+    results : LIST
+        The result of each file, see convert_chada_file(), in the order
+        of find_chada_sources(). If render is True, the results also have
+        the keys "rendered" (True if all diagrams were rendered) and
+        "render_duration" (seconds); a rendering error is stored in
+        "error".
+    """
+    source_dir = pathlib.Path(source_dir).absolute()
+    files = find_chada_sources(source_dir)
+    if not files:
+        return []
+
+    # a json and a yaml file with the same name would write the same puml
+    # code files, so their outputs are named after the file type as well
+    stems = collections.Counter((f.parent, f.stem) for f in files)
+
+    jobs = {}
+    for f in files:
+        out_path = None
+        if out_dir is not None:
+            out_path = (
+                pathlib.Path(out_dir)
+                .absolute()
+                .joinpath(f.parent.relative_to(source_dir))
+            )
+            out_path.mkdir(parents=True, exist_ok=True)
+        out_name = None
+        if stems[(f.parent, f.stem)] > 1:
+            out_name = f"{f.stem}_{f.suffix[1:]}"
+        jobs[f] = (out_path, out_name)
+
+    workers = min(workers or available_cpus(), len(files))
+    render_pool = None
+    if render:
+        render_pool = concurrent.futures.ThreadPoolExecutor(
+            auto_workers(max_workers=len(files))
+        )
+
+    results = {}
+    renders = []
+
+    def _finish(f, result):
+        results[f] = result
+        if render_pool and result["ok"]:
+            renders.append(
+                render_pool.submit(_render_outputs, result, dict(render_opts or {}))
+            )
+        elif progress:
+            progress(result)
+
+    try:
+        if workers == 1:
+            for f, (out_path, out_name) in jobs.items():
+                result = convert_chada_file(
+                    f, out_path, out_name=out_name, linked=linked, **kwargs
+                )
+                _finish(f, result)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+                futures = {
+                    pool.submit(
+                        convert_chada_file,
+                        f,
+                        out_path,
+                        out_name=out_name,
+                        linked=linked,
+                        **kwargs,
+                    ): f
+                    for f, (out_path, out_name) in jobs.items()
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    _finish(futures[future], future.result())
+
+        for future in concurrent.futures.as_completed(renders):
+            if progress:
+                progress(future.result())
+    finally:
+        if render_pool:
+            render_pool.shutdown()
+
+    return [results[f] for f in files]
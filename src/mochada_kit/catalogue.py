@@ -0,0 +1,463 @@
+"""
+Functions to build a static web site for a catalogue of CHADA documents
+in a folder tree: an index page listing all documents, which can be
+searched and filtered in the browser, and a page for each document
+linking the html pages and svg images of its tables and the workflow
+diagrams which link to them. The tables are produced in pure Python (see
+export and drawing), every file of the site is also written compressed
+with gzip for web servers which serve pre-compressed files, and only the
+documents whose source file has changed are built again.
+"""  # noqa: D400
+
+import collections
+import contextlib
+import gzip
+import html
+import json
+import os
+import pathlib
+import re
+import time
+
+from mochada_kit.batch import _error_message, find_chada_sources
+from mochada_kit.drawing import chada_svg_variants, parse_creole
+from mochada_kit.export import _scalar, export_html, theme_css
+from mochada_kit.fileio import (
+    write_bytes_atomic,
+    write_text_atomic,
+    write_text_if_changed,
+)
+from mochada_kit.tables import _SECTION_TITLES, ChadaDocument
+
+_STATE_FILE = ".catalogue_state.json"
+_STATE_VERSION = 1
+_DOCUMENTS_DIR = "documents"
+_WORKFLOWS_DIR = "workflows"
+_HREF_RE = re.compile(r'((?:xlink:)?href=")([^"#?]*)')
+
+_SITE_CSS = """\
+body{font-family:sans-serif;font-size:14px;margin:1em 2em}
+.filters{margin:0 0 1em}
+.filters input{width:24em}
+.filters input,.filters select{font-size:14px;padding:2px 4px;margin-right:1em}
+.documents tbody tr[hidden]{display:none}
+.documents td,.documents th{vertical-align:top}
+.files td,.files th{vertical-align:top}"""
+
+_SITE_JS = """\
+const query = document.getElementById("query");
+const folder = document.getElementById("folder");
+const count = document.getElementById("count");
+const rows = Array.from(document.querySelectorAll(".documents tbody tr"));
+function update() {
+  const words = query.value.toLowerCase().split(/\\s+/).filter(Boolean);
+  let shown = 0;
+  for (const row of rows) {
+    const show = (!folder.value || row.dataset.folder === folder.value)
+      && words.every((w) => row.dataset.search.includes(w));
+    row.hidden = !show;
+    shown += show;
+  }
+  count.textContent = `${shown} of ${rows.length} documents`;
+}
+query.value = new URLSearchParams(location.search).get("q") || "";
+query.addEventListener("input", update);
+folder.addEventListener("change", update);
+update();
+"""
+
+
+def _plain(text):
+    # the text of a key or value without Creole markup, on one line
+    return " ".join(
+        "".join(run for run, _ in line).strip() for line in parse_creole(text)
+    ).strip()
+
+
+def _values_text(value):
+    # the plain text of all values, for searching; the keys are left out,
+    # since most of them are the same in every document
+    if isinstance(value, (dict, list)):
+        values = value.values() if isinstance(value, dict) else value
+        return " ".join(_values_text(v) for v in values)
+    return _plain(_scalar(value))
+
+
+def _summary(doc):
+    # the rows of the "overview" section (without its title) as plain
+    # text, shown in the index
+    overview = doc.data["overview"]
+    if not isinstance(overview, dict):
+        return {}
+    rows = list(overview.items())[1:]
+    return {_plain(k): _values_text(v) for k, v in rows}
+
+
+def _relative(path, start):
+    # a relative url from the folder start to path, both relative to the
+    # site folder
+    return pathlib.PurePosixPath(os.path.relpath(path, start)).as_posix()
+
+
+def _page(title, css_href, body):
+    return (
+        '<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="utf-8">\n'
+        f"<title>{html.escape(title)}</title>\n"
+        f'<link rel="stylesheet" href="{css_href}">\n</head>\n'
+        f'<body class="chada">\n{body}\n</body>\n</html>\n'
+    )
+
+
+def _write(site_dir, name, text, written, changed):
+    # write a file of the site and its gzip version, if either is missing
+    # or the file has changed; name is relative to the site folder
+    path = site_dir.joinpath(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    gz_path = path.with_name(path.name + ".gz")
+    if write_text_if_changed(path, text) or not gz_path.exists():
+        write_bytes_atomic(gz_path, gzip.compress(text.encode("utf-8"), 9, mtime=0))
+        changed.append(name)
+    written.add(name)
+
+
+def _site_names(source_dir, files):
+    # the folder and stem of each document in the site; a json and a yaml
+    # file with the same name in the same folder get the stems
+    # "<name>_json" and "<name>_yaml", as in batch.convert_chada_tree()
+    stems = collections.Counter((f.parent, f.stem) for f in files)
+    names = {}
+    for f in files:
+        rel = f.relative_to(source_dir)
+        name = f.stem
+        if stems[(f.parent, f.stem)] > 1:
+            name = f"{f.stem}_{f.suffix[1:]}"
+        folder = pathlib.PurePosixPath(_DOCUMENTS_DIR, *rel.parent.parts, name)
+        names[f] = (folder.as_posix(), name)
+    return names
+
+
+def _build_document(f, folder, name, options, site_dir, written, changed):
+    # write the html pages and svg images of the tables of one document
+    # and return its entry in the state
+    doc = ChadaDocument(
+        f,
+        out_path=site_dir.joinpath(folder),
+        out_name=name,
+        theme_name=options["theme_name"],
+    )
+    files = dict(export_html(doc, linked=options["linked"]))
+    files.update(chada_svg_variants(doc, linked=options["linked"]))
+    for file_name, text in files.items():
+        _write(site_dir, f"{folder}/{file_name}", text, written, changed)
+    return {
+        "folder": folder,
+        "name": name,
+        "files": sorted(f"{folder}/{n}" for n in files),
+        "summary": _summary(doc),
+        "search": " ".join(_values_text(doc.data).lower().split()),
+    }
+
+
+def _rewrite_links(svg, workflow_folder, targets):
+    # point the hyperlinks of a workflow diagram to the images of the
+    # documents in the site, and return the documents it links to
+    linked = set()
+
+    def _target(m):
+        target = targets.get(pathlib.PurePosixPath(m.group(2)).name)
+        if not target:
+            return m.group(0)
+        linked.add(target[0])
+        return m.group(1) + html.escape(_relative(target[1], workflow_folder))
+
+    return _HREF_RE.sub(_target, svg), linked
+
+
+def _document_page(entry, source, workflows):
+    # the page of a document, linking the pages and images of its tables
+    folder, name = entry["folder"], entry["name"]
+    rows = []
+    for s, t in _SECTION_TITLES.items():
+        label = html.escape(_plain(t))
+        rows.append(
+            f'<tr class="chada-{s}"><th>{label}</th>'
+            f'<td><a href="{name}_{s}.html">html</a></td>'
+            f'<td><a href="{name}_{s}.svg">svg</a></td>'
+            f'<td><a href="{name}_single_{s}.svg">single table (svg)</a></td></tr>'
+        )
+    rows.append(
+        "<tr><th>All sections</th>"
+        f'<td><a href="{name}_all.html">html</a></td>'
+        f'<td><a href="{name}_all.svg">svg</a></td><td></td></tr>'
+    )
+    body = [
+        f'<p><a href="{_relative("index.html", folder)}">Catalogue</a></p>',
+        f"<h1>{html.escape(name)}</h1>",
+        f"<p>Source: <code>{html.escape(source)}</code></p>",
+        f'<table class="files">{"".join(rows)}</table>',
+    ]
+    if workflows:
+        items = "".join(
+            f'<li><a href="{html.escape(_relative(w, folder))}">'
+            f"{html.escape(pathlib.PurePosixPath(w).stem)}</a></li>"
+            for w in workflows
+        )
+        body.append(f"<h2>Workflow diagrams</h2>\n<ul>{items}</ul>")
+    return _page(name, _relative("catalogue.css", folder), "\n".join(body))
+
+
+def _index_page(title, entries, workflows, summary_keys):
+    # the index page with all documents, searched and filtered by
+    # catalogue.js
+    folders = sorted({e["source_folder"] for e in entries.values()})
+    options = "".join(
+        f'<option value="{html.escape(f)}">{html.escape(f or ".")}</option>'
+        for f in folders
+    )
+    header = "".join(f"<th>{html.escape(k)}</th>" for k in summary_keys)
+    rows = []
+    for source, e in entries.items():
+        cells = "".join(
+            f"<td>{html.escape(e['summary'].get(k, ''))}</td>" for k in summary_keys
+        )
+        rows.append(
+            f'<tr data-folder="{html.escape(e["source_folder"])}" '
+            f'data-search="{html.escape(e["name"].lower() + " " + e["search"])}">'
+            f'<td><a href="{html.escape(e["folder"])}/index.html">'
+            f"{html.escape(e['name'])}</a></td>"
+            f"<td>{html.escape(source)}</td>{cells}</tr>"
+        )
+    body = [
+        f"<h1>{html.escape(title)}</h1>",
+        '<div class="filters">'
+        '<input id="query" type="search" placeholder="Search" aria-label="Search">'
+        f'<select id="folder" aria-label="Folder"><option value="">All folders'
+        f'</option>{options}</select><span id="count"></span></div>',
+        '<table class="documents"><thead><tr><th>Document</th><th>Source</th>'
+        f"{header}</tr></thead><tbody>\n" + "\n".join(rows) + "\n</tbody></table>",
+    ]
+    if workflows:
+        items = "".join(
+            f'<li><a href="{html.escape(w)}">'
+            f"{html.escape(pathlib.PurePosixPath(w).stem)}</a></li>"
+            for w in workflows
+        )
+        body.append(f"<h2>Workflow diagrams</h2>\n<ul>{items}</ul>")
+    body.append('<script src="catalogue.js"></script>')
+    return _page(title, "catalogue.css", "\n".join(body))
+
+
+def _read_state(site_dir, options):
+    # the state of the last build, or an empty state if it was built with
+    # other options
+    try:
+        state = json.loads(site_dir.joinpath(_STATE_FILE).read_text("utf-8"))
+    except (OSError, ValueError):
+        state = {}
+    if state.get("version") != _STATE_VERSION or state.get("options") != options:
+        return {"documents": {}, "files": []}
+    return state
+
+
+def _is_current(entry, stat, site_dir):
+    # whether a document was built from the same version of its source
+    # file and all its files still exist
+    return (
+        entry is not None
+        and entry["stat"] == [stat.st_mtime_ns, stat.st_size]
+        and all(site_dir.joinpath(f).exists() for f in entry["files"])
+    )
+
+
+def _remove_stale(site_dir, names):
+    # remove files of an earlier build which are no longer part of the
+    # site, with their gzip versions and any folders left empty
+    removed = []
+    for name in sorted(names):
+        path = site_dir.joinpath(name)
+        for p in (path, path.with_name(path.name + ".gz")):
+            with contextlib.suppress(FileNotFoundError):
+                p.unlink()
+        removed.append(name)
+        for parent in path.parents:
+            if parent == site_dir or not parent.exists() or any(parent.iterdir()):
+                break
+            parent.rmdir()
+    return removed
+
+
+def build_catalogue(
+    source_dir,
+    site_dir,
+    workflow_dir=None,
+    title="CHADA catalogue",
+    theme_name="plasma",
+    linked=True,
+    progress=None,
+):
+    """
+    Build a static web site for all CHADA documents (json and yaml files)
+    in a folder tree.
+
+    The site contains:
+
+    - "index.html", listing all documents with the rows of their
+      overview, which can be searched (all text of the documents) and
+      filtered by folder in the browser. The search can also be given in
+      the url, e.g. "index.html?q=ebsd".
+    - "documents/<folder>/<name>/", for each document, with the html
+      pages of export.export_html(), the svg images of
+      drawing.chada_svg_variants() and "index.html" linking them and the
+      workflow diagrams which link to the document.
+    - "workflows/", with the svg images of the workflow diagrams in
+      workflow_dir. Hyperlinks to the images of the tables of a document
+      (e.g. "chada_tables_SEM-EBSD_experiment.svg", or
+      "chada_tables_SEM-EBSD.svg" as written by
+      tables.write_chada_tables_whole_plantuml()) are changed to point to
+      the images in the site.
+
+    Each file is also written compressed with gzip, as "<file>.gz". Files
+    whose content has not changed are not rewritten, and the tables of a
+    document are only built again if its source file has changed (or the
+    site was built with other options), so the site can be updated
+    incrementally. Files of documents which no longer exist are removed.
+
+    Parameters
+    ----------
+    source_dir : STR or pathlib.Path
+        The folder containing the json and yaml files, which may be in
+        subfolders (see batch.find_chada_sources()).
+    site_dir : STR or pathlib.Path
+        The folder of the site.
+    workflow_dir : STR, pathlib.Path or None, optional
+        A folder containing rendered svg images of workflow diagrams,
+        which may be in subfolders. If None, the site has no workflow
+        diagrams.
+        The default is None.
+    title : STR, optional
+        The title of the index page.
+        The default is "CHADA catalogue".
+    theme_name : STR, optional
+        The MOCHADA theme of the tables, without "MOCHADA-".
+        The default is "plasma".
+    linked : BOOL, optional
+        If True, the contents of the tables link the pages and images of
+        the sections of a document, see export.export_html().
+        The default is True.
+    progress : CALLABLE or None, optional
+        Called with the path of each source file (as a string) and its
+        status, "built", "unchanged" or the error message, as soon as it
+        is finished.
+        The default is None.
+
+    Returns
+    -------
+    report : DICT
+        Dict with the keys "built" and "unchanged" (lists of the source
+        files as strings), "failed" (dict of the source files which could
+        not be built and their error messages), "written" (list of the
+        files of the site which were written, relative to site_dir),
+        "removed" (list of the files which were removed) and "duration"
+        (seconds).
+    """
+    start = time.perf_counter()
+    source_dir = pathlib.Path(source_dir).absolute()
+    site_dir = pathlib.Path(site_dir).absolute()
+    site_dir.mkdir(parents=True, exist_ok=True)
+    options = {"theme_name": theme_name, "linked": linked}
+    state = _read_state(site_dir, options)
+    report = {"built": [], "unchanged": [], "failed": {}}
+    written, changed = set(), []
+
+    files = find_chada_sources(source_dir)
+    entries = {}
+    for f, (folder, name) in _site_names(source_dir, files).items():
+        source = f.relative_to(source_dir).as_posix()
+        stat = f.stat()
+        entry = state["documents"].get(source)
+        if _is_current(entry, stat, site_dir) and entry["folder"] == folder:
+            written.update(entry["files"])
+            status = "unchanged"
+        else:
+            try:
+                entry = _build_document(
+                    f, folder, name, options, site_dir, written, changed
+                )
+            except Exception as e:
+                report["failed"][str(f)] = status = _error_message(e)
+                if progress:
+                    progress(str(f), status)
+                continue
+            entry["stat"] = [stat.st_mtime_ns, stat.st_size]
+            status = "built"
+        entry["source_folder"] = pathlib.PurePosixPath(source).parent.as_posix()
+        entries[source] = entry
+        report[status].append(str(f))
+        if progress:
+            progress(str(f), status)
+
+    # the names of the images of the tables, as used in the hyperlinks of
+    # workflow diagrams, and the source and site path of each image; the
+    # images of "<name>_json" and "<name>_yaml" are also found under the
+    # names of the source file, those of the json file first
+    targets, aliases = {}, {}
+    for source, e in entries.items():
+        stem = pathlib.PurePosixPath(source).stem
+        for name in e["files"]:
+            if name.endswith(".svg"):
+                image = pathlib.PurePosixPath(name).name
+                targets[image] = (source, name)
+                aliases.setdefault(stem + image[len(e["name"]) :], (source, name))
+        whole = (source, f"{e['folder']}/{e['name']}_all.svg")
+        targets[f"{e['name']}.svg"] = whole
+        aliases.setdefault(f"{stem}.svg", whole)
+    targets = {**aliases, **targets}
+
+    workflows = []
+    document_workflows = collections.defaultdict(list)
+    if workflow_dir is not None:
+        workflow_dir = pathlib.Path(workflow_dir).absolute()
+        for f in sorted(workflow_dir.rglob("*.svg")):
+            rel = f.relative_to(workflow_dir)
+            if any(p.startswith(".") for p in rel.parts):
+                continue
+            name = pathlib.PurePosixPath(_WORKFLOWS_DIR, *rel.parts).as_posix()
+            svg, linked_sources = _rewrite_links(
+                f.read_text(encoding="utf-8"),
+                pathlib.PurePosixPath(name).parent.as_posix(),
+                targets,
+            )
+            _write(site_dir, name, svg, written, changed)
+            workflows.append(name)
+            for source in linked_sources:
+                document_workflows[source].append(name)
+
+    for source, e in entries.items():
+        page = _document_page(e, source, document_workflows[source])
+        _write(site_dir, f"{e['folder']}/index.html", page, written, changed)
+
+    summary_keys = []
+    for e in entries.values():
+        summary_keys += [k for k in e["summary"] if k not in summary_keys]
+    css = f"{theme_css(theme_name)}\n{_SITE_CSS}\n"
+    _write(site_dir, "catalogue.css", css, written, changed)
+    _write(site_dir, "catalogue.js", _SITE_JS, written, changed)
+    index = _index_page(title, entries, workflows, summary_keys)
+    _write(site_dir, "index.html", index, written, changed)
+
+    report["removed"] = _remove_stale(site_dir, set(state["files"]) - written)
+    write_text_atomic(
+        site_dir.joinpath(_STATE_FILE),
+        json.dumps(
+            {
+                "version": _STATE_VERSION,
+                "options": options,
+                "documents": entries,
+                "files": sorted(written),
+            },
+            ensure_ascii=False,
+        ),
+    )
+    report["written"] = changed
+    report["duration"] = round(time.perf_counter() - start, 4)
+    return report
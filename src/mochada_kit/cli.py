@@ -5,7 +5,12 @@
 import argparse
 
 import mochada_kit as mck
+from mochada_kit.batch import convert_chada_tree, validate_chada_tree
+from mochada_kit.catalogue import build_catalogue
 from mochada_kit.config import write_config
+from mochada_kit.linkcheck import check_links
+from mochada_kit.themestore import list_placements, sync_themes
+from mochada_kit.validation import format_problems
 
 
 def cli():
@@ -33,7 +38,282 @@ def cli():
         help="Full path to plantuml.jar (default: %(default)s)",
     )
 
+    tables_help = (
+        "Write the plantuml code of the CHADA tables for every json and "
+        "yaml file in a folder and its subfolders, using several processes. "
+        "Optionally render the diagrams with --render."
+    )
+
+    tables_parser = sub_parsers.add_parser(name="tables", help=tables_help)
+
+    tables_parser.add_argument(
+        "source_dir", type=str, help="Folder containing the json/yaml files"
+    )
+    tables_parser.add_argument(
+        "-o",
+        "--out_dir",
+        type=str,
+        default=None,
+        help="Folder for the puml code (default: next to each source file)",
+    )
+    tables_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of processes (default: one per available CPU)",
+    )
+    tables_parser.add_argument(
+        "-t",
+        "--theme_name",
+        type=str,
+        default="plasma",
+        help="MOCHADA theme, without 'MOCHADA-' (default: %(default)s)",
+    )
+    tables_parser.add_argument(
+        "--no_links",
+        action="store_true",
+        help="Do not add hyperlinks to the contents element",
+    )
+    tables_parser.add_argument(
+        "--single_file",
+        action="store_true",
+        help="Write all diagrams of each source file to one puml code file",
+    )
+    tables_parser.add_argument(
+        "--render",
+        action="store_true",
+        help="Run the puml code against plantuml.jar as soon as it is written",
+    )
+    tables_parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Only check the structure of the files, reporting all problems",
+    )
+    tables_parser.add_argument(
+        "-f",
+        "--output_format",
+        type=str,
+        default="svg",
+        choices=["svg", "png"],
+        help="Format of the rendered diagrams (default: %(default)s)",
+    )
+
+    themes_help = (
+        "Manage the themes placed in output folders from the shared theme "
+        "store: 'sync' updates all of them to the current version of their "
+        "theme, 'list' shows them."
+    )
+
+    themes_parser = sub_parsers.add_parser(name="themes", help=themes_help)
+
+    themes_parser.add_argument(
+        "themes_action", choices=["sync", "list"], metavar="{sync,list}"
+    )
+    themes_parser.add_argument(
+        "--store_dir",
+        type=str,
+        default=None,
+        help="Folder of the theme store (default: from the configuration)",
+    )
+    themes_parser.add_argument(
+        "--no_prune",
+        action="store_true",
+        help="Keep stored theme versions which are no longer used",
+    )
+
+    catalogue_help = (
+        "Build a static web site for the CHADA tables of every json and yaml "
+        "file in a folder and its subfolders, with a searchable index. Only "
+        "changed files are built again."
+    )
+
+    catalogue_parser = sub_parsers.add_parser(name="catalogue", help=catalogue_help)
+
+    catalogue_parser.add_argument(
+        "catalogue_source",
+        metavar="source_dir",
+        type=str,
+        help="Folder containing the json/yaml files",
+    )
+    catalogue_parser.add_argument("site_dir", type=str, help="Folder of the site")
+    catalogue_parser.add_argument(
+        "--workflow_dir",
+        type=str,
+        default=None,
+        help="Folder containing svg images of workflow diagrams (default: none)",
+    )
+    catalogue_parser.add_argument(
+        "--title",
+        type=str,
+        default="CHADA catalogue",
+        help="Title of the index page (default: %(default)s)",
+    )
+    catalogue_parser.add_argument(
+        "-t",
+        "--theme_name",
+        type=str,
+        default="plasma",
+        help="MOCHADA theme, without 'MOCHADA-' (default: %(default)s)",
+    )
+    catalogue_parser.add_argument(
+        "--no_links",
+        action="store_true",
+        help="Do not link the sections of a document to each other",
+    )
+
+    links_help = (
+        "Check the hyperlinks between the diagrams in a folder and its "
+        "subfolders, reporting links to missing files, diagrams which no "
+        "other diagram links to and cycles of links."
+    )
+
+    links_parser = sub_parsers.add_parser(name="links", help=links_help)
+
+    links_parser.add_argument(
+        "links_dir", metavar="root_dir", type=str, help="Output folder to check"
+    )
+    links_parser.add_argument(
+        "-s",
+        "--sources",
+        nargs="+",
+        default=["puml", "svg"],
+        choices=["puml", "svg"],
+        help="Read plantuml code and/or svg images (default: both)",
+    )
+    links_parser.add_argument(
+        "-r",
+        "--root",
+        action="append",
+        default=None,
+        help="Pattern of diagrams which are entry points, e.g. '*_overview.svg' "
+        "(may be repeated)",
+    )
+
     args = parser.parse_args()
 
     if "puml_path" in args:
         write_config(args.puml_path)
+    elif "source_dir" in args:
+        tables(args)
+    elif "themes_action" in args:
+        themes(args)
+    elif "site_dir" in args:
+        catalogue(args)
+    elif "links_dir" in args:
+        links(args)
+
+
+def check_tables(args):
+    report = validate_chada_tree(args.source_dir)
+    invalid = 0
+    for path, problems in report.items():
+        errors = any(p["severity"] == "error" for p in problems)
+        invalid += errors
+        status = "ERROR" if errors else "ok"
+        print(f"{status:6} {path}")
+        if problems:
+            print(
+                "\n".join(
+                    f"       {line}" for line in format_problems(problems).splitlines()
+                )
+            )
+    print(f"{len(report) - invalid} of {len(report)} files valid, {invalid} invalid.")
+    if invalid:
+        raise SystemExit(1)
+
+
+def tables(args):
+    if args.check:
+        check_tables(args)
+        return
+
+    def _report(result):
+        status = "ok" if result["ok"] and result.get("rendered", True) else "FAILED"
+        timing = f"{result['duration']:.3f}s"
+        if "render_duration" in result:
+            timing += f" + {result['render_duration']:.3f}s render"
+        changed = f"{len(result['changed'])}/{len(result['outputs'])} changed"
+        print(f"{status:6} {timing:24} {changed:14} {result['path']}")
+        if result["error"]:
+            print(f"       {result['error']}")
+
+    results = convert_chada_tree(
+        args.source_dir,
+        out_dir=args.out_dir,
+        workers=args.workers,
+        linked=not args.no_links,
+        single_file=args.single_file,
+        render=args.render,
+        render_opts={"output_type": f"-t{args.output_format}"},
+        progress=_report,
+        theme_name=args.theme_name,
+    )
+
+    failed = [r for r in results if not r["ok"] or not r.get("rendered", True)]
+    print(
+        f"{len(results) - len(failed)} of {len(results)} files converted"
+        f"{' and rendered' if args.render else ''}, {len(failed)} failed."
+    )
+    if failed:
+        raise SystemExit(1)
+
+
+def themes(args):
+    try:
+        if args.themes_action == "list":
+            for path, mode in list_placements(args.store_dir).items():
+                print(f"{mode:9} {path}")
+            return
+        report = sync_themes(args.store_dir, prune=not args.no_prune)
+    except ValueError as e:
+        raise SystemExit(str(e)) from e
+    for path, status in report.items():
+        if status != "unchanged":
+            print(f"{status:9} {path}")
+    counts = {s: list(report.values()).count(s) for s in ("updated", "removed")}
+    print(
+        f"{len(report)} placed themes: {counts['updated']} updated, "
+        f"{counts['removed']} removed."
+    )
+
+
+def catalogue(args):
+    def _report(path, status):
+        if status not in ("built", "unchanged"):
+            print(f"FAILED {path}\n       {status}")
+
+    report = build_catalogue(
+        args.catalogue_source,
+        args.site_dir,
+        workflow_dir=args.workflow_dir,
+        title=args.title,
+        theme_name=args.theme_name,
+        linked=not args.no_links,
+        progress=_report,
+    )
+    print(
+        f"{len(report['built'])} documents built, {len(report['unchanged'])} "
+        f"unchanged, {len(report['failed'])} failed; {len(report['written'])} "
+        f"files written, {len(report['removed'])} removed in "
+        f"{report['duration']:.3f}s."
+    )
+    if report["failed"]:
+        raise SystemExit(1)
+
+
+def links(args):
+    report = check_links(args.links_dir, sources=args.sources, roots=args.root)
+    for d in report["dangling"]:
+        print(f"DANGLING {d['source']} -> {d['target']}")
+    for orphan in report["orphans"]:
+        print(f"ORPHAN   {orphan}")
+    for cycle in report["cycles"]:
+        print(f"CYCLE    {' <-> '.join(cycle)}")
+    print(
+        f"{report['diagrams']} diagrams, {report['links']} links: "
+        f"{len(report['dangling'])} dangling, {len(report['orphans'])} orphans, "
+        f"{len(report['cycles'])} cycles in {report['duration']:.3f}s."
+    )
+    if report["dangling"]:
+        raise SystemExit(1)
@@ -0,0 +1,276 @@
+"""
+Functions to decide how many instances of plantuml.jar to run in
+parallel. The number of workers is derived from the CPUs and memory
+available to the current process (respecting the limits of a container,
+if there are any) and the Java heap of each worker, and can be adjusted
+while a batch is running from the memory used by the workers and the
+throughput achieved.
+"""  # noqa: D400
+
+import os
+import pathlib
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# typical memory used by one plantuml.jar process if no heap is given
+_DEFAULT_WORKER_MB = 512
+# memory used by java in addition to the heap
+_JVM_OVERHEAD_MB = 256
+
+_CGROUP_DIR = pathlib.Path("/sys/fs/cgroup")
+
+
+def _read_cgroup(*names):
+    for name in names:
+        path = _CGROUP_DIR.joinpath(name)
+        try:
+            return path.read_text().split()
+        except OSError:
+            continue
+    return None
+
+
+def available_cpus():
+    """
+    Count the CPUs which the current process may use.
+
+    This takes into account the CPU affinity of the process and the CPU
+    quota of its cgroup (e.g. "docker run --cpus=2").
+
+    Returns
+    -------
+    cpus : INT
+        The number of CPUs, at least 1.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+
+    # cgroup v2, e.g. "200000 100000", or "max 100000" for no limit
+    if (quota := _read_cgroup("cpu.max")) and quota[0] != "max":
+        cpus = min(cpus, int(quota[0]) / int(quota[1]))
+    # cgroup v1, where a quota of -1 means no limit
+    elif (
+        (quota := _read_cgroup("cpu/cpu.cfs_quota_us", "cpu.cfs_quota_us"))
+        and (period := _read_cgroup("cpu/cpu.cfs_period_us", "cpu.cfs_period_us"))
+        and int(quota[0]) > 0
+    ):
+        cpus = min(cpus, int(quota[0]) / int(period[0]))
+
+    return max(1, int(cpus))
+
+
+def available_memory_mb():
+    """
+    Estimate the memory available to new processes in MB.
+
+    This is the smaller of the available memory of the system and the
+    remaining memory allowed by the cgroup of the current process.
+
+    Returns
+    -------
+    memory : FLOAT or None
+        The available memory in MB or None if it cannot be determined.
+    """
+    values = []
+
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    values.append(int(line.split()[1]) / 1024)
+                    break
+    except OSError:
+        if hasattr(os, "sysconf"):
+            try:
+                pages = os.sysconf("SC_AVPHYS_PAGES")
+                values.append(pages * os.sysconf("SC_PAGE_SIZE") / 2**20)
+            except (ValueError, OSError):
+                pass
+
+    limit = _read_cgroup("memory.max", "memory/memory.limit_in_bytes")
+    usage = _read_cgroup("memory.current", "memory/memory.usage_in_bytes")
+    # cgroup v1 reports a huge number if there is no limit
+    if limit and usage and limit[0] != "max" and int(limit[0]) < 2**60:
+        values.append((int(limit[0]) - int(usage[0])) / 2**20)
+
+    return max(0.0, min(values)) if values else None
+
+
+def worker_memory_mb(heap_mb=None):
+    """
+    Estimate the memory needed by one plantuml.jar process.
+
+    Parameters
+    ----------
+    heap_mb : INT or None, optional
+        The maximum Java heap given to the process (-Xmx) in MB, or None
+        if the Java default is used.
+        The default is None.
+
+    Returns
+    -------
+    memory : FLOAT
+        The estimated memory in MB.
+    """
+    if heap_mb:
+        return heap_mb + _JVM_OVERHEAD_MB
+    return _DEFAULT_WORKER_MB
+
+
+def auto_workers(heap_mb=None, max_workers=None):
+    """
+    Choose how many plantuml.jar processes to run in parallel.
+
+    One worker is used per available CPU, as long as the available memory
+    can hold that many workers (see worker_memory_mb()).
+
+    Parameters
+    ----------
+    heap_mb : INT or None, optional
+        The maximum Java heap of each worker in MB, or None if the Java
+        default is used.
+        The default is None.
+    max_workers : INT or None, optional
+        An upper limit for the number of workers.
+        The default is None.
+
+    Returns
+    -------
+    workers : INT
+        The number of workers, at least 1.
+    """
+    workers = available_cpus()
+    memory = available_memory_mb()
+    if memory is not None:
+        workers = min(workers, int(memory // worker_memory_mb(heap_mb)))
+    if max_workers:
+        workers = min(workers, max_workers)
+    return max(1, workers)
+
+
+def peak_child_rss_mb():
+    """
+    Return the largest resident memory used so far by any child process.
+
+    Returns
+    -------
+    rss : FLOAT or None
+        The peak resident memory in MB, or None where this is not
+        available (e.g. on Windows) or no child has finished yet.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if not rss:
+        return None
+    # ru_maxrss is in kB on Linux but in bytes on macOS
+    return rss / 2**20 if os.uname().sysname == "Darwin" else rss / 1024
+
+
+class AdaptiveLimit:
+    """
+    Limit the number of jobs running at the same time and adapt this
+    limit while a batch of jobs is running.
+
+    Call acquire() before starting each job and release() when it has
+    finished, or use an instance as a context manager around each job.
+    To start the jobs in a given order, call acquire() for each of them,
+    in that order, from the thread which submits them to the workers, so
+    that a job is only submitted once it may run. The pool of workers
+    needs as many threads as max_workers, which is the most the limit can
+    ever grow to. After every "limit" jobs have finished, the limit is
+    adjusted:
+
+    - it is reduced so that the workers, each using as much memory as the
+      largest plantuml.jar process seen so far, fit into the available
+      memory;
+    - otherwise it is increased by one (up to max_workers) while that
+      increases the throughput (jobs finished per second), and reduced by
+      one if the throughput dropped at the last increase.
+
+    Parameters
+    ----------
+    initial : INT
+        The number of jobs allowed to run at the same time at the start.
+    max_workers : INT
+        The largest number of jobs ever allowed to run at the same time.
+    """
+
+    def __init__(self, initial, max_workers):
+        self.max_workers = max(1, max_workers)
+        self.limit = max(1, min(initial, self.max_workers))
+        self.active = 0
+        self.history = []
+        self._cond = threading.Condition()
+        self._window_start = time.perf_counter()
+        self._window_done = 0
+        self._last_throughput = None
+        self._last_step = 0
+
+    def acquire(self):
+        """Wait until fewer than "limit" jobs are running and start one."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    def release(self):
+        """Record that a job has finished and adapt the limit if due."""
+        with self._cond:
+            self.active -= 1
+            self._window_done += 1
+            if self._window_done >= self.limit:
+                self._adapt()
+            self._cond.notify_all()
+
+    def __enter__(self):
+        """Wait until fewer than "limit" jobs are running."""
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        """Record that a job has finished and adapt the limit if due."""
+        self.release()
+        return False
+
+    def _adapt(self):
+        now = time.perf_counter()
+        throughput = self._window_done / max(now - self._window_start, 1e-9)
+        self._window_start = now
+        self._window_done = 0
+
+        new_limit = self.limit
+        rss = peak_child_rss_mb()
+        memory = available_memory_mb()
+        if rss and memory is not None:
+            # memory is what is left while "active" workers are running
+            fits = self.active + int(memory // rss)
+        else:
+            fits = self.max_workers
+
+        if fits < self.limit:
+            new_limit = fits
+        elif self._last_throughput is None or self._last_step == 0:
+            new_limit = self.limit + 1
+        elif throughput > self._last_throughput * 1.05:
+            new_limit = self.limit + self._last_step
+        elif throughput < self._last_throughput * 0.95:
+            new_limit = self.limit - self._last_step
+
+        new_limit = max(1, min(new_limit, fits, self.max_workers))
+        self._last_step = new_limit - self.limit
+        self._last_throughput = throughput
+        self.history.append(
+            {
+                "limit": self.limit,
+                "throughput": round(throughput, 4),
+                "peak_rss_mb": round(rss, 1) if rss else None,
+            }
+        )
+        self.limit = new_limit
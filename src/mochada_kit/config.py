@@ -3,24 +3,84 @@
 # ruff: noqa: D103
 
 import json
+import os
 import pathlib
 import warnings
 
+# environment variables which take precedence over the user's config file
+_CONFIG_PATH_ENV = "MOCHADA_KIT_CONFIG"
+_PUML_PATH_ENV = "MOCHADA_KIT_PUML_PATH"
+_CACHE_DIR_ENV = "MOCHADA_KIT_CACHE_DIR"
+_THEME_STORE_ENV = "MOCHADA_KIT_THEME_STORE"
+
+# config read by get_config(), re-read only when the file's mtime changes
+_config_cache = {"path": None, "mtime": None, "config": None}
+
+
+def get_config_path():
+    if env_path := os.environ.get(_CONFIG_PATH_ENV):
+        return pathlib.Path(env_path)
+    return pathlib.Path.home().joinpath(".mochada_kit", "config.json")
+
 
 def read_config():
-    if config_file_path := pathlib.Path.home().joinpath(".mochada_kit", "config.json"):
+    config_file_path = get_config_path()
+    if config_file_path.exists():
         with open(config_file_path) as handle:
             return json.load(handle)
     else:
         warning = (
             f"Cannot find configuration file at: {config_file_path}."
-            "To fix, please run: mochadakit config -p <path to plantuml.jar>"
+            "To fix, please run: mochada_kit config -p <path to plantuml.jar>"
         )
         warnings.warn(warning, stacklevel=2)
+        return {}
+
+
+def get_config():
+    config_file_path = get_config_path()
+    try:
+        mtime = config_file_path.stat().st_mtime_ns
+    except OSError:
+        mtime = None
+
+    if (
+        _config_cache["config"] is None
+        or _config_cache["path"] != config_file_path
+        or _config_cache["mtime"] != mtime
+    ):
+        _config_cache["config"] = read_config() if mtime is not None else {}
+        _config_cache["path"] = config_file_path
+        _config_cache["mtime"] = mtime
+
+    return _config_cache["config"]
+
+
+def get_puml_path():
+    if env_path := os.environ.get(_PUML_PATH_ENV):
+        return env_path
+    return get_config().get("puml_path")
+
+
+def get_cache_dir():
+    if env_path := os.environ.get(_CACHE_DIR_ENV):
+        return pathlib.Path(env_path)
+    if cache_dir := get_config().get("cache_dir"):
+        return pathlib.Path(cache_dir)
+    return get_config_path().parent.joinpath("cache")
+
+
+def get_theme_store_dir():
+    # the theme store is only used if it has been configured
+    if env_path := os.environ.get(_THEME_STORE_ENV):
+        return pathlib.Path(env_path)
+    if store_dir := get_config().get("theme_store"):
+        return pathlib.Path(store_dir)
+    return None
 
 
 def write_config(puml_path=None):
-    config_file_path = pathlib.Path.home().joinpath(".mochada_kit", "config.json")
+    config_file_path = get_config_path()
     if not config_file_path.exists():
         config_file_path.parent.mkdir(exist_ok=True, parents=True)
         with open(config_file_path, "w+") as handle:
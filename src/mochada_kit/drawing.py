@@ -0,0 +1,559 @@
+"""
+Functions to draw CHADA tables directly as svg images, without running
+plantuml.jar. The tables are laid out like the json diagrams which
+plantuml draws from the code of the tables module: each object is a
+table of key/value rows, nested objects are tables to its right joined
+to their row by an arrow, and highlighted rows are filled with the
+colours of the MOCHADA theme. The values may use a subset of the Creole
+syntax of plantuml (bold, italic, underline, subscript, superscript,
+line breaks, unicode characters and hyperlinks).
+
+Text widths are estimated from the character widths of a sans-serif
+font, so the images are close to, but not identical with, those drawn
+by plantuml.jar.
+"""  # noqa: D400
+
+import functools
+import json
+import math
+import pathlib
+import re
+from xml.sax.saxutils import escape, quoteattr
+
+from mochada_kit.fileio import write_text_if_changed
+from mochada_kit.inlining import read_theme
+from mochada_kit.retheming import theme_colours
+from mochada_kit.tables import _SECTION_TITLES, ChadaDocument
+
+_FONT_SIZE = 14
+_SCRIPT_FONT_SIZE = 10
+_LINE_HEIGHT = 17.6094
+_BASELINE = 16.5332
+_PAD_X = 5
+_PAD_Y = 2
+_MARGIN = 10
+_GAP_X = 37
+_GAP_Y = 15
+_NODE_COLOUR = "#F1F1F1"
+_LINE_COLOUR = "#000000"
+_TEXT_COLOUR = "#000000"
+_BOLD_FACTOR = 1.08
+
+# widths of the printable ascii characters, in 1/1000 of the font size
+_ASCII_WIDTHS = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278,
+    278, 556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584,
+    584, 556, 1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556,
+    833, 722, 778, 667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278,
+    278, 278, 469, 556, 333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222,
+    500, 222, 833, 556, 556, 556, 556, 333, 500, 278, 556, 500, 722, 500, 500,
+    500, 334, 260, 334, 584,
+)  # fmt: skip
+_CHAR_WIDTHS = {chr(32 + i): w for i, w in enumerate(_ASCII_WIDTHS)}
+_DEFAULT_WIDTH = 600
+
+_CREOLE_RE = re.compile(
+    r"(\*\*|(?<!:)//|__|\\n|\n|\[\[.*?\]\]|<U\+[0-9A-Fa-f]{4,6}>"
+    r"|</?(?:b|i|u|sub|sup)>)"
+)
+_LINK_RE = re.compile(r"^(\S+?)(?:\{([^}]*)\})?(?:\s+(.*))?$", re.DOTALL)
+_URL_SCHEME_RE = re.compile(r"^([a-zA-Z][a-zA-Z0-9+.-]*):")
+_SAFE_SCHEMES = ("http", "https", "mailto")
+_TAGS = {"b": "bold", "i": "italic", "u": "underline", "sub": "sub", "sup": "sup"}
+_MAX_WIDTH_RE = re.compile(r"jsonDiagram\s*\{[^}]*?MaximumWidth\s+(\d+)", re.DOTALL)
+
+
+def _text_width(text, bold=False, size=_FONT_SIZE):
+    width = sum(_CHAR_WIDTHS.get(c, _DEFAULT_WIDTH) for c in text) * size / 1000
+    return width * _BOLD_FACTOR if bold else width
+
+
+def _is_safe_href(href):
+    # whether a link is relative or has an allowed scheme; browsers ignore
+    # control characters and whitespace in the scheme, e.g. "java\tscript:"
+    m = _URL_SCHEME_RE.match(re.sub(r"[\x00-\x20\x7f]", "", href))
+    return not m or m.group(1).lower() in _SAFE_SCHEMES
+
+
+def parse_creole(text):
+    r"""
+    Split text using the Creole syntax of plantuml into lines of styled
+    runs of text.
+
+    The supported syntax is **bold**, //italic//, __underline__, the html
+    tags <b>, <i>, <u>, <sub> and <sup>, unicode characters such as
+    <U+03BC>, line breaks ("\n") and hyperlinks ("[[url]]",
+    "[[url label]]" or "[[url{tooltip} label]]"). Other markup is kept
+    as text. Only hyperlinks to http, https and mailto urls and relative
+    links are kept; others (e.g. "javascript:") are plain text, so that
+    untrusted data cannot add scripts to the exported images and pages.
+
+    Parameters
+    ----------
+    text : STR
+        The text.
+
+    Returns
+    -------
+    lines : LIST
+        List of the lines, where each line is a list of tuples (text,
+        style) and style is a dict with the keys "bold", "italic",
+        "underline", "sub", "sup" (BOOL) and "href" and "tooltip" (STR or
+        None).
+    """
+    style = dict.fromkeys(("bold", "italic", "underline", "sub", "sup"), False)
+    style.update(href=None, tooltip=None)
+    lines = [[]]
+    for part in _CREOLE_RE.split(text):
+        if not part:
+            continue
+        if part == "**":
+            style["bold"] = not style["bold"]
+        elif part == "//":
+            style["italic"] = not style["italic"]
+        elif part == "__":
+            style["underline"] = not style["underline"]
+        elif part in ("\\n", "\n"):
+            lines.append([])
+        elif part.startswith("[[") and part.endswith("]]"):
+            m = _LINK_RE.match(part[2:-2].strip())
+            if m is None:
+                # an empty link, which plantuml draws as it is
+                lines[-1].append((part, dict(style)))
+                continue
+            href, tooltip, label = m.groups()
+            if _is_safe_href(href):
+                link = dict(style, underline=True, href=href, tooltip=tooltip)
+            else:
+                link = dict(style)
+            lines[-1].append((label or href, link))
+        elif part.startswith("<U+"):
+            lines[-1].append((chr(int(part[3:-1], 16)), dict(style)))
+        elif m := re.fullmatch(r"<(/?)(\w+)>", part):
+            style[_TAGS[m.group(2)]] = not m.group(1)
+        else:
+            lines[-1].append((part, dict(style)))
+    return lines
+
+
+def _run_width(text, style, bold=False):
+    size = _SCRIPT_FONT_SIZE if style["sub"] or style["sup"] else _FONT_SIZE
+    return _text_width(text, bold=bold or style["bold"], size=size)
+
+
+def _wrap(lines, max_width, bold=False):
+    # break the lines of styled runs into words and fill lines of at most
+    # max_width; a word which is longer is put on a line of its own
+    wrapped = []
+    for line in lines:
+        current, width = [], 0.0
+        for text, style in line:
+            for word in re.findall(r"\S+|\s+", text):
+                w = _run_width(word, style, bold)
+                if max_width and current and width + w > max_width:
+                    if word.isspace():
+                        continue
+                    while current and current[-1][0].isspace():
+                        current.pop()
+                    wrapped.append(current)
+                    current, width = [], 0.0
+                current.append((word, style, w))
+                width += w
+        wrapped.append(current)
+    return wrapped
+
+
+class _Cell:
+    # the wrapped text of one cell of a table
+
+    def __init__(self, text, max_width, bold=False):
+        self.lines = _wrap(parse_creole(text), max_width, bold=bold)
+        self.bold = bold
+        self.width = max(sum(w for *_, w in line) for line in self.lines)
+        self.height = len(self.lines) * _LINE_HEIGHT
+
+    def svg(self, x, y, colour):
+        parts = []
+        for i, line in enumerate(self.lines):
+            baseline = y + _BASELINE + i * _LINE_HEIGHT
+            cx = x
+            # the words of a run share its style and are drawn together
+            runs = []
+            for text, style, w in line:
+                if runs and runs[-1][1] is style:
+                    runs[-1][0] += text
+                else:
+                    runs.append([text, style, cx])
+                cx += w
+            for text, style, run_x in runs:
+                parts.append(_text_svg(text, style, run_x, baseline, colour, self.bold))
+        return parts
+
+
+def _text_svg(text, style, x, baseline, colour, bold):
+    size = _FONT_SIZE
+    if style["sup"]:
+        size, baseline = _SCRIPT_FONT_SIZE, baseline - 5
+    elif style["sub"]:
+        size, baseline = _SCRIPT_FONT_SIZE, baseline + 3
+    attrs = [
+        f'fill="{colour}"',
+        'font-family="sans-serif"',
+        f'font-size="{size}"',
+    ]
+    if bold or style["bold"]:
+        attrs.append('font-weight="bold"')
+    if style["italic"]:
+        attrs.append('font-style="italic"')
+    if style["underline"]:
+        attrs.append('text-decoration="underline"')
+    attrs += [f'x="{_num(x)}"', f'y="{_num(baseline)}"']
+    content = escape(text).replace(" ", "&#160;")
+    element = f"<text {' '.join(attrs)}>{content}</text>"
+    if style["href"]:
+        title = style["tooltip"] or style["href"]
+        element = (
+            f'<a href={quoteattr(style["href"])} target="_top" '
+            f'title={quoteattr(title)} xlink:actuate="onRequest" '
+            f'xlink:href={quoteattr(style["href"])} xlink:show="new" '
+            f'xlink:title={quoteattr(title)} xlink:type="simple">'
+            f"{element}</a>"
+        )
+    return element
+
+
+def _num(value):
+    # numbers as plantuml writes them, without trailing zeros
+    return f"{value:.4f}".rstrip("0").rstrip(".")
+
+
+def _scalar(value):
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+class _Table:
+    # one object or array of the json data, with the tables of its nested
+    # objects and arrays as children
+
+    def __init__(self, value, path, highlights, colours, max_width):
+        if isinstance(value, dict) and value:
+            items = list(value.items())
+        elif isinstance(value, list) and value:
+            items = [(None, v) for v in value]
+        else:
+            # a string (e.g. " " for a section which has not been filled
+            # in), another scalar or an empty object or array is drawn as
+            # a single value
+            items = [(None, value)]
+        self.has_keys = isinstance(value, dict) and bool(value)
+        self.rows = []
+        for i, (key, v) in enumerate(items):
+            row_path = (*path, key if self.has_keys else i)
+            style = highlights.get(row_path)
+            row = {
+                "colours": colours[style] if style else None,
+                "key": _Cell(str(key), max_width, bold=bool(style))
+                if self.has_keys
+                else None,
+                "value": None,
+                "child": None,
+            }
+            if isinstance(v, (dict, list)) and v:
+                row["child"] = _Table(v, row_path, highlights, colours, max_width)
+                row["value"] = _Cell("   ", max_width)
+            else:
+                row["value"] = _Cell(_scalar(v), max_width)
+            self.rows.append(row)
+
+        self.key_width = 0
+        if self.has_keys:
+            self.key_width = max(r["key"].width for r in self.rows) + 2 * _PAD_X
+        self.value_width = max(r["value"].width for r in self.rows) + 2 * _PAD_X
+        self.width = math.ceil(self.key_width + self.value_width)
+        for row in self.rows:
+            cells = [row["value"]] + ([row["key"]] if self.has_keys else [])
+            row["height"] = max(c.height for c in cells) + 2 * _PAD_Y
+        self.height = sum(r["height"] for r in self.rows)
+
+        children = [r["child"] for r in self.rows if r["child"]]
+        self.children_height = sum(c.band for c in children)
+        self.children_height += _GAP_Y * max(len(children) - 1, 0)
+        self.band = max(self.height, self.children_height)
+
+    def place(self, x, y):
+        # place the table in the middle of the band of its children
+        self.x = x
+        self.y = y + (self.band - self.height) / 2
+        child_y = y + (self.band - self.children_height) / 2
+        for row in self.rows:
+            if row["child"]:
+                row["child"].place(x + self.width + _GAP_X, child_y)
+                child_y += row["child"].band + _GAP_Y
+
+    def extent(self):
+        right = self.x + self.width
+        for row in self.rows:
+            if row["child"]:
+                right = max(right, row["child"].extent())
+        return right
+
+    def svg(self):
+        x, y, w = self.x, self.y, self.width
+        parts = [
+            f'<rect fill="{_NODE_COLOUR}" height="{_num(self.height)}" rx="5" '
+            f'ry="5" style="stroke:{_NODE_COLOUR};stroke-width:1.5;" '
+            f'width="{_num(w)}" x="{_num(x)}" y="{_num(y)}"/>'
+        ]
+        arrows, children = [], []
+        row_y = y
+        for i, row in enumerate(self.rows):
+            h = row["height"]
+            colour = _TEXT_COLOUR
+            if row["colours"]:
+                background, colour = row["colours"]
+                parts.append(
+                    f'<rect fill="{background}" height="{_num(h)}" rx="2" ry="2" '
+                    f'style="stroke:{background};stroke-width:1.0;" '
+                    f'width="{_num(w - 2)}" x="{_num(x + 1.5)}" y="{_num(row_y)}"/>'
+                )
+            value_x = x + self.key_width
+            if self.has_keys:
+                parts += row["key"].svg(x + _PAD_X, row_y + _PAD_Y, colour)
+                parts.append(_line(value_x, row_y, value_x, row_y + h))
+            parts += row["value"].svg(value_x + _PAD_X, row_y + _PAD_Y, colour)
+            if i:
+                parts.append(_line(x, row_y, x + w, row_y))
+            if row["child"]:
+                start = (value_x + self.value_width / 2, row_y + h / 2)
+                arrows.append(_arrow(start, row["child"]))
+                children.append(row["child"])
+            row_y += h
+        for child in children:
+            parts += child.svg()
+        return parts + arrows
+
+
+def _line(x1, y1, x2, y2):
+    return (
+        f'<line style="stroke:{_LINE_COLOUR};stroke-width:1.0;" x1="{_num(x1)}" '
+        f'x2="{_num(x2)}" y1="{_num(y1)}" y2="{_num(y2)}"/>'
+    )
+
+
+def _arrow(start, child):
+    # a dashed curve from a dot in the row to the first row of the child
+    x1, y1 = start
+    x2, y2 = child.x, child.y + child.rows[0]["height"] / 2
+    mid = (x1 + x2) / 2
+    head = (
+        f"M{_num(x2 - 7.5)},{_num(y2 + 3)} L{_num(x2 - 5.2)},{_num(y2)} "
+        f"L{_num(x2 - 7.5)},{_num(y2 - 3)} L{_num(x2)},{_num(y2)} "
+        f"L{_num(x2 - 7.5)},{_num(y2 + 3)}"
+    )
+    return (
+        f'<path d="M{_num(x1)},{_num(y1)} C{_num(mid)},{_num(y1)} {_num(mid)},'
+        f'{_num(y2)} {_num(x2 - 5.2)},{_num(y2)}" fill="none" style="stroke:'
+        f'{_LINE_COLOUR};stroke-width:1.0;stroke-dasharray:3.0,3.0;"/>'
+        f'<path d="{head}" fill="{_LINE_COLOUR}" style="stroke:{_LINE_COLOUR};'
+        f'stroke-width:1.0;"/>'
+        f'<ellipse cx="{_num(x1)}" cy="{_num(y1)}" fill="{_LINE_COLOUR}" rx="3" '
+        f'ry="3" style="stroke:{_LINE_COLOUR};stroke-width:1.0;"/>'
+    )
+
+
+@functools.lru_cache(maxsize=32)
+def theme_style(theme_name):
+    """
+    Read the highlight colours and the maximum width of text in json
+    diagrams from a MOCHADA theme.
+
+    Parameters
+    ----------
+    theme_name : STR
+        The part of the theme name after "MOCHADA-", e.g. "plasma".
+
+    Returns
+    -------
+    colours : DICT
+        Dict where the keys are the highlight styles, e.g. "user_case",
+        and the values are tuples (background colour, font colour).
+    max_width : INT or None
+        The MaximumWidth of text in json diagrams, or None if the theme
+        does not set it.
+
+    Notes
+    -----
+    The result is cached and must not be modified.
+    """
+    hexes = theme_colours(theme_name)
+    colours = {}
+    for k, v in hexes.items():
+        if k.endswith("_BACKGROUNDCOLOR"):
+            style = k[: -len("_BACKGROUNDCOLOR")]
+            font = hexes.get(f"{style}_FONTCOLOR", [_TEXT_COLOUR])
+            colours[style.lower()] = (v[0], font[0])
+    m = _MAX_WIDTH_RE.search(read_theme(f"MOCHADA-{theme_name}"))
+    return colours, int(m.group(1)) if m else None
+
+
+def draw_json_svg(data, highlights=None, theme_name="plasma", title=None):
+    """
+    Draw json data as an svg image of tables, like a plantuml json
+    diagram.
+
+    Parameters
+    ----------
+    data : DICT or LIST
+        The json data.
+    highlights : DICT or None, optional
+        Dict where the keys are tuples of the keys (or list indices)
+        leading to a row, e.g. ("experiment", "2. Experiment"), and the
+        values are the highlight styles of the theme, e.g. "experiment".
+        The default is None.
+    theme_name : STR, optional
+        The part of the name of the MOCHADA theme after "MOCHADA-".
+        The default is "plasma".
+    title : STR, LIST or None, optional
+        A title for the image, where each string of a list is a line.
+        The default is None.
+
+    Returns
+    -------
+    svg : STR
+        The svg image.
+    """
+    colours, max_width = theme_style(theme_name)
+    table = _Table(data, (), highlights or {}, colours, max_width)
+
+    title_parts, top = [], _MARGIN
+    if title:
+        lines = [title] if isinstance(title, str) else list(title)
+        cells = [_Cell(t, None, bold=True) for t in lines]
+        title_width = max(c.width for c in cells)
+        table_width = table.width
+        for cell in cells:
+            x = _MARGIN + (max(title_width, table_width) - cell.width) / 2
+            title_parts += cell.svg(x, top, _TEXT_COLOUR)
+            top += cell.height
+        top += _MARGIN
+    else:
+        title_width = 0
+
+    table.place(_MARGIN, top)
+    width = math.ceil(max(table.extent(), _MARGIN + title_width) + _MARGIN)
+    height = math.ceil(top + table.band + _MARGIN)
+    body = "".join(title_parts + table.svg())
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" '
+        'xmlns:xlink="http://www.w3.org/1999/xlink" contentStyleType="text/css" '
+        f'height="{height}px" preserveAspectRatio="none" '
+        f'style="width:{width}px;height:{height}px;background:#FFFFFF;" '
+        f'version="1.1" viewBox="0 0 {width} {height}" width="{width}px" '
+        f'zoomAndPan="magnify"><defs/><g>{body}</g></svg>'
+    )
+
+
+def chada_svg_variants(doc, linked=True, theme_names=None):
+    """
+    Draw the eleven CHADA table diagrams of a document as svg images.
+
+    The images show the same tables as the diagrams of
+    tables.ChadaDocument.puml_variants() and have the same names, with
+    ".svg" instead of ".puml", so the hyperlinks of the "contents" element
+    lead from one image to the other.
+
+    Parameters
+    ----------
+    doc : tables.ChadaDocument, STR or pathlib.Path
+        The document, or the path to its json or yaml file.
+    linked : BOOL, optional
+        If True, the rows of the "contents" element of the linked diagrams
+        are hyperlinks to the images of the other sections.
+        The default is True.
+    theme_names : DICT or None, optional
+        The theme of each kind of diagram, see
+        tables.ChadaDocument.puml_variants().
+        The default is None.
+
+    Returns
+    -------
+    svgs : DICT
+        Dict where the keys are the filenames of the images and the values
+        are the svg images.
+    """
+    if not isinstance(doc, ChadaDocument):
+        doc = ChadaDocument(doc)
+    theme_names = theme_names or {}
+    stem = doc.out_base.name
+    titles = list(_SECTION_TITLES.values())
+
+    def _highlights(keys, shown):
+        highlights = {(k,): doc.sections[i] for i, k in enumerate(keys)}
+        for i in shown:
+            highlights[(keys[i], titles[i])] = doc.sections[i]
+        return highlights
+
+    svgs = {}
+    keys = doc._contents_keys(linked)
+    theme = theme_names.get("linked") or doc.theme_name
+    for i, s in enumerate(doc.sections):
+        data = {k: doc.data[s] if j == i else " " for j, k in enumerate(keys)}
+        svgs[f"{stem}_{s}.svg"] = draw_json_svg(
+            data, _highlights(keys, [i]), theme_name=theme, title=doc.title
+        )
+
+    data = {t: doc.data[doc.sections[i]] for i, t in enumerate(titles)}
+    svgs[f"{stem}_all.svg"] = draw_json_svg(
+        data,
+        _highlights(titles, range(len(titles))),
+        theme_name=theme_names.get("whole") or doc.theme_name,
+        title=doc.title,
+    )
+
+    theme = theme_names.get("single") or doc.theme_name
+    for s, t in _SECTION_TITLES.items():
+        svgs[f"{stem}_single_{s}.svg"] = draw_json_svg(
+            doc.data[s], {(t,): s}, theme_name=theme, title=doc.title
+        )
+    return svgs
+
+
+def write_chada_svgs(doc, linked=True, theme_names=None, output_dir=None):
+    """
+    Draw the eleven CHADA table diagrams of a document as svg images (see
+    chada_svg_variants()) and write them to files. Files which already
+    have the same content are not rewritten.
+
+    Parameters
+    ----------
+    doc : tables.ChadaDocument, STR or pathlib.Path
+        The document, or the path to its json or yaml file.
+    linked : BOOL, optional
+        See chada_svg_variants().
+        The default is True.
+    theme_names : DICT or None, optional
+        See chada_svg_variants().
+        The default is None.
+    output_dir : STR, pathlib.Path or None, optional
+        The folder for the images. If None, the output folder of the
+        document is used.
+        The default is None.
+
+    Returns
+    -------
+    changed : DICT
+        Dict where the keys are the pathlib.Path of the images and the
+        values are True if the file was written, or False if it already
+        had the same content and was left unchanged.
+    """
+    if not isinstance(doc, ChadaDocument):
+        doc = ChadaDocument(doc)
+    output_dir = pathlib.Path(output_dir or doc.output_path)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    changed = {}
+    for name, svg in chada_svg_variants(doc, linked, theme_names).items():
+        path = output_dir.joinpath(name)
+        changed[path] = write_text_if_changed(path, svg)
+    return changed
@@ -0,0 +1,123 @@
+"""
+Functions to encode plantuml code into the compact text format used
+in plantuml urls, and to decode it again. The code is compressed with
+deflate and written with plantuml's url-safe variant of base64, as
+described here: https://plantuml.com/text-encoding.
+An encoded diagram can be stored or embedded instead of an image and
+rendered on demand by a plantuml server, e.g. a local one started with
+"java -jar plantuml.jar -picoweb".
+"""  # noqa: D400
+
+import base64
+import zlib
+
+from mochada_kit.inlining import inline_puml_file
+
+_B64_ALPHABET = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+_PUML_ALPHABET = b"0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz-_"
+_TO_PUML = bytes.maketrans(_B64_ALPHABET, _PUML_ALPHABET)
+_FROM_PUML = bytes.maketrans(_PUML_ALPHABET, _B64_ALPHABET)
+
+
+def encode_puml(code):
+    """
+    Encode plantuml code in plantuml's text encoding.
+
+    Parameters
+    ----------
+    code : STR
+        The plantuml code.
+
+    Returns
+    -------
+    encoded : STR
+        The encoded code, which only contains the characters 0-9, A-Z,
+        a-z, "-" and "_".
+    """
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    data = compressor.compress(code.encode("utf-8")) + compressor.flush()
+    # plantuml pads the last group of 3 bytes with zeros instead of "="
+    data += b"\0" * (-len(data) % 3)
+    return base64.b64encode(data).translate(_TO_PUML).decode("ascii")
+
+
+def decode_puml(encoded):
+    """
+    Decode plantuml code from plantuml's text encoding.
+
+    Both the default deflate encoding and the hex encoding (starting
+    with "~h") are supported.
+
+    Parameters
+    ----------
+    encoded : STR
+        The encoded code.
+
+    Returns
+    -------
+    code : STR
+        The plantuml code.
+
+    Raises
+    ------
+    ValueError
+        Raised if encoded is not valid plantuml text encoding.
+    """
+    encoded = encoded.strip()
+    if encoded.startswith("~h"):
+        return bytes.fromhex(encoded[2:]).decode("utf-8")
+
+    data = encoded.encode("ascii").translate(_FROM_PUML)
+    data += b"=" * (-len(data) % 4)
+    try:
+        data = base64.b64decode(data, validate=True)
+        # trailing zero bytes used as padding are left in unused_data
+        return zlib.decompressobj(-15).decompress(data).decode("utf-8")
+    except (ValueError, zlib.error) as e:
+        raise ValueError(f"Not a valid plantuml text encoding: {e}") from e
+
+
+def encode_puml_file(code_path):
+    """
+    Encode a plantuml code file in plantuml's text encoding.
+
+    Themes, included files and json data loaded with "%load_json" are
+    first written into the code (see inlining.inline_puml_file()), so
+    that the encoded diagram can be rendered without access to the
+    folder containing code_path.
+
+    Parameters
+    ----------
+    code_path : STR or pathlib.Path
+        Path to the file containing the plantuml code.
+
+    Returns
+    -------
+    encoded : STR
+        The encoded, self-contained code.
+    """
+    return encode_puml(inline_puml_file(code_path, inline_json=True))
+
+
+def puml_url(encoded, server="http://localhost:8080", output_format="svg"):
+    """
+    Build the url at which a plantuml server renders an encoded diagram.
+
+    Parameters
+    ----------
+    encoded : STR
+        The encoded code, e.g. from encode_puml() or encode_puml_file().
+    server : STR, optional
+        The base url of the plantuml server. A local server can be
+        started with "java -jar plantuml.jar -picoweb:8080".
+        The default is "http://localhost:8080".
+    output_format : STR, optional
+        The output format, e.g. "svg", "png" or "txt".
+        The default is "svg".
+
+    Returns
+    -------
+    url : STR
+        The url of the rendered diagram.
+    """
+    return f"{server.rstrip('/')}/plantuml/{output_format}/{encoded}"
@@ -0,0 +1,377 @@
+"""
+Functions to export CHADA tables as html pages and Markdown files, for
+wikis and web pages which need the tables as searchable text rather
+than as images. The tables are produced directly from the data of the
+json or yaml file, without plantuml, with the colours of the MOCHADA
+theme applied by css and the contents of the five sections linking the
+pages of a document to each other.
+"""  # noqa: D400
+
+import functools
+import html
+import pathlib
+import re
+
+from mochada_kit.drawing import parse_creole, theme_style
+from mochada_kit.fileio import write_text_if_changed
+from mochada_kit.tables import _SECTION_NAMES, _SECTION_TITLES, ChadaDocument
+
+_MD_SPECIAL_RE = re.compile(r"([\\`*_\[\]|<>#])")
+_STYLE_TAGS = (("sub", "sub"), ("sup", "sup"), ("bold", "strong"), ("italic", "em"))
+
+
+def _creole_html(text):
+    # the text of a cell as html, with the Creole markup as html tags
+    lines = []
+    for line in parse_creole(text):
+        parts = []
+        for run, style in line:
+            part = html.escape(run)
+            for key, tag in _STYLE_TAGS:
+                if style[key]:
+                    part = f"<{tag}>{part}</{tag}>"
+            if style["href"]:
+                title = html.escape(style["tooltip"] or style["href"])
+                part = (
+                    f'<a href="{html.escape(style["href"])}" title="{title}">{part}</a>'
+                )
+            elif style["underline"]:
+                part = f"<u>{part}</u>"
+            parts.append(part)
+        lines.append("".join(parts))
+    return "<br>".join(lines)
+
+
+def _creole_markdown(text):
+    # the text of a table cell as Markdown; emphasis must not start or
+    # end with a space, so spaces are moved outside of the markers
+    lines = []
+    for line in parse_creole(text):
+        parts = []
+        for run, style in line:
+            core = run.strip()
+            if not core:
+                parts.append(run)
+                continue
+            part = _MD_SPECIAL_RE.sub(r"\\\1", core)
+            if style["sub"]:
+                part = f"<sub>{part}</sub>"
+            elif style["sup"]:
+                part = f"<sup>{part}</sup>"
+            if style["href"]:
+                tooltip = (style["tooltip"] or "").replace('"', "'")
+                title = f' "{tooltip}"' if tooltip else ""
+                part = f"[{part}]({style['href'].replace(' ', '%20')}{title})"
+            if style["italic"]:
+                part = f"*{part}*"
+            if style["bold"]:
+                part = f"**{part}**"
+            lead = run[: len(run) - len(run.lstrip())]
+            trail = run[len(run.rstrip()) :]
+            parts.append(f"{lead}{part}{trail}")
+        lines.append("".join(parts).strip())
+    return "<br>".join(lines)
+
+
+def _scalar(value):
+    if isinstance(value, str):
+        return value
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+@functools.lru_cache(maxsize=32)
+def theme_css(theme_name="plasma"):
+    """
+    Generate the css which applies the colours of a MOCHADA theme to the
+    html tables of export_html().
+
+    Parameters
+    ----------
+    theme_name : STR, optional
+        The part of the theme name after "MOCHADA-", e.g. "plasma".
+        The default is "plasma".
+
+    Returns
+    -------
+    css : STR
+        The css rules.
+    """
+    colours, max_width = theme_style(theme_name)
+    rules = [
+        ".chada{font-family:sans-serif;font-size:14px}",
+        ".chada table{border-collapse:collapse;background:#F1F1F1;margin:0 0 1em}",
+        ".chada th,.chada td{border:1px solid #000000;padding:2px 5px;"
+        "text-align:left;vertical-align:top}",
+        ".chada th{font-weight:normal}",
+        ".chada td table{margin:0}",
+        ".chada nav table th{font-weight:bold}",
+    ]
+    if max_width:
+        rules.append(f".chada th,.chada td{{max-width:{max_width}px}}")
+    for style in _SECTION_TITLES:
+        if style not in colours:
+            continue
+        background, font = colours[style]
+        rules.append(
+            f".chada tr.chada-{style}>*{{background:{background};color:{font};"
+            "font-weight:bold}"
+        )
+        rules.append(f".chada tr.chada-{style} a{{color:{font}}}")
+    return "\n".join(rules)
+
+
+def _html_table(value, highlight=None):
+    # an object as a table of key/value rows (arrays as rows without
+    # keys), with nested objects and arrays as tables in their row; the
+    # first row is highlighted with the class of the section
+    row_class = f' class="chada-{highlight}"' if highlight else ""
+    if not isinstance(value, (dict, list)) or not value:
+        # e.g. a section which is the string " "
+        cell = _creole_html(_scalar(value))
+        return f"<table><tr{row_class}><td>{cell}</td></tr></table>"
+    rows = []
+    items = value.items() if isinstance(value, dict) else enumerate(value)
+    for i, (key, v) in enumerate(items):
+        row_class = f' class="chada-{highlight}"' if highlight and not i else ""
+        if isinstance(v, (dict, list)) and v:
+            cell = _html_table(v)
+        else:
+            cell = _creole_html(_scalar(v))
+        if isinstance(value, dict):
+            rows.append(
+                f"<tr{row_class}><th>{_creole_html(str(key))}</th><td>{cell}</td></tr>"
+            )
+        else:
+            rows.append(f"<tr{row_class}><td>{cell}</td></tr>")
+    return f"<table>{''.join(rows)}</table>"
+
+
+def _html_title(title):
+    if not title:
+        return ""
+    lines = [title] if isinstance(title, str) else title
+    return f"<h1>{'<br>'.join(_creole_html(t) for t in lines)}</h1>"
+
+
+def _html_page(title, css, body):
+    head_title = html.escape(re.sub(r"<[^>]+>", "", title))
+    return (
+        '<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="utf-8">\n'
+        f"<title>{head_title}</title>\n<style>\n{css}\n</style>\n</head>\n"
+        f'<body class="chada">\n{body}\n</body>\n</html>\n'
+    )
+
+
+def _plain_title(doc):
+    if not doc.title:
+        return doc.out_base.name
+    lines = [doc.title] if isinstance(doc.title, str) else doc.title
+    return " ".join(lines)
+
+
+def export_html(doc, linked=True, theme_name=None):
+    """
+    Export the CHADA tables of a document as html pages.
+
+    There is one page for each section, showing the contents of the five
+    sections and the table of that section, like the linked diagrams of
+    tables.write_chada_tables_plantuml(), and one page showing all
+    sections, like tables.write_chada_tables_whole_plantuml(). The rows
+    of the contents are links to the pages of the sections (or, on the
+    page of all sections, to the tables of the sections on that page).
+
+    Parameters
+    ----------
+    doc : tables.ChadaDocument, STR or pathlib.Path
+        The document, or the path to its json or yaml file.
+    linked : BOOL, optional
+        If False, the rows of the contents are not links.
+        The default is True.
+    theme_name : STR or None, optional
+        The MOCHADA theme whose colours are used. If None, the theme of
+        the document is used.
+        The default is None.
+
+    Returns
+    -------
+    pages : DICT
+        Dict where the keys are the filenames of the pages,
+        "<stem>_<section>.html" and "<stem>_all.html", and the values are
+        the html pages.
+    """
+    if not isinstance(doc, ChadaDocument):
+        doc = ChadaDocument(doc)
+    css = theme_css(theme_name or doc.theme_name)
+    stem = doc.out_base.name
+    title = _plain_title(doc)
+    header = _html_title(doc.title)
+    tables = {
+        s: f'<section id="{s}">{_html_table(doc.data[s], highlight=s)}</section>'
+        for s in doc.sections
+    }
+
+    def _contents(href):
+        rows = []
+        for s, t in _SECTION_TITLES.items():
+            label = html.escape(t)
+            if linked:
+                label = (
+                    f'<a href="{href(s)}" title="View {_SECTION_NAMES[s]} table">'
+                    f"{label}</a>"
+                )
+            rows.append(f'<tr class="chada-{s}"><th>{label}</th></tr>')
+        return f"<nav><table>{''.join(rows)}</table></nav>"
+
+    pages = {}
+    nav = _contents(lambda s: f"{stem}_{s}.html")
+    for s in doc.sections:
+        body = f"{header}{nav}\n{tables[s]}"
+        pages[f"{stem}_{s}.html"] = _html_page(
+            f"{title} - {_SECTION_NAMES[s]}", css, body
+        )
+    nav = _contents(lambda s: f"#{s}")
+    body = f"{header}{nav}\n" + "\n".join(tables.values())
+    pages[f"{stem}_all.html"] = _html_page(title, css, body)
+    return pages
+
+
+def _markdown_rows(value, depth=0):
+    # the rows of a Markdown table for an object; nested objects and
+    # arrays follow their row, with their keys indented
+    if not isinstance(value, (dict, list)):
+        # e.g. a section which is the string " "
+        return [("", _creole_markdown(_scalar(value)))]
+    rows = []
+    indent = "&emsp;" * depth
+    items = value.items() if isinstance(value, dict) else enumerate(value, 1)
+    for key, v in items:
+        key = _creole_markdown(str(key)) if isinstance(value, dict) else f"{key}."
+        if isinstance(v, (dict, list)) and v:
+            rows.append((f"{indent}{key}", ""))
+            rows += _markdown_rows(v, depth + 1)
+        else:
+            rows.append((f"{indent}{key}", _creole_markdown(_scalar(v))))
+    return rows
+
+
+def _markdown_table(value):
+    rows = _markdown_rows(value)
+    if isinstance(value, dict) and value:
+        header, rows = rows[0], rows[1:]
+        header = (f"**{header[0]}**" if header[0] else " ", header[1] or " ")
+    else:
+        header = (" ", " ")
+    lines = [f"| {header[0]} | {header[1]} |", "| --- | --- |"]
+    lines += [f"| {k} | {v} |" for k, v in rows]
+    return "\n".join(lines)
+
+
+def export_markdown(doc, linked=True):
+    """
+    Export the CHADA tables of a document as Markdown files.
+
+    The files correspond to the pages of export_html(): one file for each
+    section, starting with the contents of the five sections as links to
+    the files of the sections, and one file for all sections. The first
+    row of each section (e.g. "2. Experiment") is the header of its
+    table, and nested objects are shown as rows with indented keys
+    following the row of their key. Markdown has no colours, so the
+    theme is not applied.
+
+    Parameters
+    ----------
+    doc : tables.ChadaDocument, STR or pathlib.Path
+        The document, or the path to its json or yaml file.
+    linked : BOOL, optional
+        If False, the contents are not links.
+        The default is True.
+
+    Returns
+    -------
+    files : DICT
+        Dict where the keys are the filenames, "<stem>_<section>.md" and
+        "<stem>_all.md", and the values are the Markdown text.
+    """
+    if not isinstance(doc, ChadaDocument):
+        doc = ChadaDocument(doc)
+    stem = doc.out_base.name
+    header = f"# {_plain_title(doc)}\n\n" if doc.title else ""
+    tables = {s: _markdown_table(doc.data[s]) for s in doc.sections}
+
+    def _contents(current, href):
+        items = []
+        for s, t in _SECTION_TITLES.items():
+            if s == current:
+                items.append(f"**{t}**")
+            elif linked:
+                items.append(f"[{t}]({href(s)})")
+            else:
+                items.append(t)
+        return " · ".join(items)
+
+    files = {}
+    for s in doc.sections:
+        nav = _contents(s, lambda s: f"{stem}_{s}.md")
+        files[f"{stem}_{s}.md"] = f"{header}{nav}\n\n{tables[s]}\n"
+    parts = [f"{header}{_contents(None, lambda s: f'#{s}')}"]
+    for s in doc.sections:
+        parts.append(f'<a id="{s}"></a>\n\n{tables[s]}')
+    files[f"{stem}_all.md"] = "\n\n".join(parts) + "\n"
+    return files
+
+
+def write_exports(doc, formats=("html", "md"), linked=True, output_dir=None):
+    """
+    Export the CHADA tables of a document (see export_html() and
+    export_markdown()) and write them to files. Files which already have
+    the same content are not rewritten.
+
+    Parameters
+    ----------
+    doc : tables.ChadaDocument, STR or pathlib.Path
+        The document, or the path to its json or yaml file.
+    formats : TUPLE or LIST, optional
+        The formats to write, "html" and/or "md".
+        The default is ("html", "md").
+    linked : BOOL, optional
+        See export_html().
+        The default is True.
+    output_dir : STR, pathlib.Path or None, optional
+        The folder for the files. If None, the output folder of the
+        document is used.
+        The default is None.
+
+    Returns
+    -------
+    changed : DICT
+        Dict where the keys are the pathlib.Path of the files and the
+        values are True if the file was written, or False if it already
+        had the same content and was left unchanged.
+
+    Raises
+    ------
+    ValueError
+        Raised if a format is not "html" or "md".
+    """
+    unknown = set(formats) - {"html", "md"}
+    if unknown:
+        raise ValueError(f"Unknown export format(s): {', '.join(sorted(unknown))}.")
+    if not isinstance(doc, ChadaDocument):
+        doc = ChadaDocument(doc)
+    output_dir = pathlib.Path(output_dir or doc.output_path)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    files = {}
+    if "html" in formats:
+        files.update(export_html(doc, linked=linked))
+    if "md" in formats:
+        files.update(export_markdown(doc, linked=linked))
+    changed = {}
+    for name, text in files.items():
+        path = output_dir.joinpath(name)
+        changed[path] = write_text_if_changed(path, text)
+    return changed
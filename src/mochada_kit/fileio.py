@@ -0,0 +1,237 @@
+"""
+Functions for writing output files safely when several processes
+build into the same folders. Files are written to a temporary file
+in the destination folder and then renamed, so that readers only ever
+see complete files, and shared resources can be protected with
+advisory file locks.
+"""  # noqa: D400
+
+import contextlib
+import hashlib
+import os
+import pathlib
+import shutil
+import tempfile
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def write_text_atomic(path, text, encoding="utf-8"):
+    """
+    Write text to a file atomically.
+
+    The text is written to a temporary file in the same folder, which
+    then replaces path in a single step.
+
+    Parameters
+    ----------
+    path : STR or pathlib.Path
+        The path of the file to write.
+    text : STR
+        The text to write.
+    encoding : STR, optional
+        The encoding of the file.
+        The default is "utf-8".
+    """
+    path = pathlib.Path(path)
+    with _atomic_temp_file(path) as tmp_path:
+        pathlib.Path(tmp_path).write_text(text, encoding=encoding)
+
+
+def write_text_if_changed(path, text, encoding="utf-8"):
+    """
+    Write text to a file atomically (see write_text_atomic()), unless the
+    file already has exactly this content.
+
+    Skipping identical writes keeps the modification time of the file,
+    so that tools which rebuild files newer than their outputs (e.g.
+    make, or renderers comparing modification times) do no needless work.
+
+    Parameters
+    ----------
+    path : STR or pathlib.Path
+        The path of the file to write.
+    text : STR
+        The text to write.
+    encoding : STR, optional
+        The encoding of the file.
+        The default is "utf-8".
+
+    Returns
+    -------
+    changed : BOOL
+        True if the file was written, False if it was left unchanged.
+    """
+    path = pathlib.Path(path)
+    # the same line endings as write_text_atomic(), i.e. text mode
+    data = text.replace("\n", os.linesep).encode(encoding)
+    if _has_content(path, data):
+        return False
+    write_bytes_atomic(path, data)
+    return True
+
+
+def _has_content(path, data):
+    # compare sizes first, then content hashes read in chunks
+    try:
+        if path.stat().st_size != len(data):
+            return False
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(2**20), b""):
+                h.update(chunk)
+    except OSError:
+        return False
+    return h.digest() == hashlib.sha256(data).digest()
+
+
+def write_bytes_atomic(path, data):
+    """
+    Write bytes to a file atomically, see write_text_atomic().
+
+    Parameters
+    ----------
+    path : STR or pathlib.Path
+        The path of the file to write.
+    data : BYTES
+        The data to write.
+    """
+    with _atomic_temp_file(pathlib.Path(path)) as tmp_path:
+        pathlib.Path(tmp_path).write_bytes(data)
+
+
+def copy_file_atomic(src_path, dest_path):
+    """
+    Copy a file atomically, see write_text_atomic().
+
+    Parameters
+    ----------
+    src_path : STR or pathlib.Path
+        The file to copy.
+    dest_path : STR or pathlib.Path
+        The path of the copy.
+    """
+    with _atomic_temp_file(pathlib.Path(dest_path)) as tmp_path:
+        shutil.copyfile(src_path, tmp_path)
+
+
+def link_file_atomic(src_path, dest_path, symbolic=False):
+    """
+    Replace dest_path atomically by a hard or symbolic link to src_path.
+
+    Parameters
+    ----------
+    src_path : STR or pathlib.Path
+        The file to link to. A symbolic link points to its absolute path.
+    dest_path : STR or pathlib.Path
+        The path of the link.
+    symbolic : BOOL, optional
+        If True, make a symbolic link, otherwise a hard link.
+        The default is False.
+
+    Raises
+    ------
+    OSError
+        Raised if the link cannot be made, e.g. for a hard link between
+        two file systems or a symbolic link without permission.
+    """
+    dest_path = pathlib.Path(dest_path)
+    tmp_path = dest_path.with_name(f".{dest_path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        if symbolic:
+            os.symlink(pathlib.Path(src_path).absolute(), tmp_path)
+        else:
+            os.link(src_path, tmp_path)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+@contextlib.contextmanager
+def _atomic_temp_file(path):
+    # created with the permissions a new file would normally have, i.e.
+    # 0o666 less the umask which the kernel applies when the file is made
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+@contextlib.contextmanager
+def atomic_output_dir(final_dir):
+    """
+    Provide a temporary folder whose files are moved into final_dir
+    when the context exits without an error.
+
+    This is useful for programs such as plantuml.jar which write their
+    output files themselves. The temporary folder is created inside
+    final_dir, so that each file can be renamed into place in a single
+    step. It is always removed at the end.
+
+    Parameters
+    ----------
+    final_dir : STR or pathlib.Path
+        The folder where the files should finally be placed.
+
+    Yields
+    ------
+    tmp_dir : pathlib.Path
+        The temporary folder.
+    """
+    final_dir = pathlib.Path(final_dir)
+    final_dir.mkdir(parents=True, exist_ok=True)
+    tmp_dir = pathlib.Path(tempfile.mkdtemp(prefix=".mochada_kit-", dir=final_dir))
+    try:
+        yield tmp_dir
+        # the files are created by the writing program with the usual
+        # permissions; only the temporary folder is private
+        for f in tmp_dir.iterdir():
+            if f.is_file():
+                os.replace(f, final_dir.joinpath(f.name))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def file_lock(lock_path):
+    """
+    Hold an exclusive advisory lock on a file while the context is active.
+
+    The lock only excludes other processes which also use file_lock() on
+    the same path. The lock file is created if necessary and is not
+    removed afterwards.
+
+    Parameters
+    ----------
+    lock_path : STR or pathlib.Path
+        The path of the lock file.
+    """
+    lock_path = pathlib.Path(lock_path)
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a+b") as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
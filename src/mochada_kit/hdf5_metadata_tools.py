@@ -5,9 +5,12 @@ highlights.
 """
 
 import json
+import pathlib
 
 import h5py
 
+from mochada_kit.fileio import write_text_if_changed
+
 
 def get_ds_dictionaries(name, node):
     """
@@ -142,6 +145,14 @@ def write_puml_code_for_hdf5_metadata(
         If highlight_style is not None, highlights must be a dict
         for the styles to be applied.
         The default is None.
+
+    Returns
+    -------
+    changed : DICT
+        Dict where the keys are the pathlib.Path of the output files (puml
+        code and, if save_json_and_load is True, json) and the values are
+        True if the file was written, or False if it already had the same
+        content and was left unchanged.
     """
     global ds_dict
 
@@ -164,27 +175,28 @@ def write_puml_code_for_hdf5_metadata(
             h_f += f" {v}"
             highlights_f.append(h_f)
 
-    if save_json_and_load:
-        with open(f"{output_path}.json", "w") as f:
-            json.dump(dic_final, f, indent="  ")
-
-        with open(f"{output_path}.puml", "w") as f:
-            f.write("@startjson\n")
-            if highlight_style:
-                f.write(highlight_style + "\n")
-            for h in highlights_f:
-                f.write(f"#highlight {h}\n")
-            f.write('!$DEF_JSON={"status":"No data found"}\n')
-            f.write(f'!$DATA = %load_json("{output_path}.json", $DEF_JSON)\n')
-            f.write("$DATA")
-            f.write("\n@endjson")
+    lines = ["@startjson"]
+    if highlight_style:
+        lines.append(highlight_style)
+    lines.extend(f"#highlight {h}" for h in highlights_f)
 
+    changed = {}
+    if save_json_and_load:
+        json_path = pathlib.Path(f"{output_path}.json")
+        changed[json_path] = write_text_if_changed(
+            json_path, json.dumps(dic_final, indent="  ")
+        )
+        lines.extend(
+            [
+                '!$DEF_JSON={"status":"No data found"}',
+                f'!$DATA = %load_json("{output_path}.json", $DEF_JSON)',
+                "$DATA",
+            ]
+        )
     else:
-        with open(f"{output_path}.puml", "w") as f:
-            f.write("@startjson\n")
-            if highlight_style:
-                f.write(highlight_style + "\n")
-            for h in highlights_f:
-                f.write(f"#highlight {h}\n")
-            json.dump(dic_final, f, indent="  ")
-            f.write("\n@endjson")
+        lines.append(json.dumps(dic_final, indent="  "))
+
+    lines.append("@endjson")
+    puml_path = pathlib.Path(f"{output_path}.puml")
+    changed[puml_path] = write_text_if_changed(puml_path, "\n".join(lines))
+    return changed
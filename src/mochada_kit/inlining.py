@@ -0,0 +1,219 @@
+"""
+Functions to turn plantuml code which refers to other files into
+a single, self-contained source. The bespoke MOCHADA themes loaded
+with "!theme ... from ...", files loaded with "!include" and,
+optionally, json data loaded with "%load_json" are resolved in Python
+and written directly into the code. The result no longer depends on
+the directory it is run from, so it can be piped to plantuml.jar,
+cached by its content or sent to a remote plantuml server.
+"""  # noqa: D400
+
+import functools
+import json
+import pathlib
+import re
+
+from mochada_kit import _THEMES_DIR
+from mochada_kit.fileio import write_text_atomic
+
+_THEME_RE = re.compile(r"^\s*!theme\s+(\S+)(?:\s+from\s+(.+?))?\s*$")
+_INCLUDE_RE = re.compile(r"^\s*!(include|include_once|include_many)\s+(.+?)\s*$")
+_LOAD_JSON_RE = re.compile(r'%load_json\(\s*"?([^",)]+?)"?\s*(?:,\s*([^)]*?))?\s*\)')
+
+
+@functools.lru_cache(maxsize=128)
+def _read_cached(path, mtime_ns):
+    # keyed on the mtime as well, so that an edited file is read again;
+    # the size is bounded, so that old versions of edited files are
+    # evicted in long-running processes
+    return pathlib.Path(path).read_text(encoding="utf-8")
+
+
+def read_theme(theme_name, themes_dir=None):
+    """
+    Read the plantuml code of a theme.
+
+    The contents of each theme file are read once and shared by all
+    callers, until the file is modified.
+
+    Parameters
+    ----------
+    theme_name : STR
+        The full name of the theme, as written after "!theme",
+        e.g. "MOCHADA-plasma".
+    themes_dir : STR, pathlib.Path or None, optional
+        The folder containing the theme file
+        puml-theme-<theme_name>.puml. If None, the default folder given
+        by _THEMES_DIR is used.
+        The default is None.
+
+    Returns
+    -------
+    code : STR
+        The plantuml code of the theme.
+
+    Raises
+    ------
+    OSError
+        Raised if the theme file does not exist.
+    """
+    themes_dir = pathlib.Path(themes_dir or _THEMES_DIR)
+    theme_path = themes_dir.joinpath(f"puml-theme-{theme_name}.puml").resolve()
+    if not theme_path.exists():
+        raise OSError(f"Cannot find theme {theme_name} at {theme_path}.")
+    return _read_cached(str(theme_path), theme_path.stat().st_mtime_ns)
+
+
+def inline_puml_code(code, base_dir=None, inline_json=False):
+    """
+    Resolve themes, includes and (optionally) json data in plantuml code.
+
+    The following lines are replaced by the contents of the files they
+    refer to:
+
+    - "!theme <name> from <dir>", where <dir> is relative to base_dir
+      or absolute. A MOCHADA theme given without "from <dir>" is taken
+      from the default folder given by _THEMES_DIR. Other themes given
+      without "from" are built into plantuml and are left unchanged.
+    - "!include <file>", "!include_once <file>" and
+      "!include_many <file>", where <file> is relative to base_dir or
+      absolute. Files in the plantuml standard library
+      ("!include <...>"), urls and includes of a single diagram
+      from a file ("!include <file>!<id>") are left unchanged.
+
+    If inline_json is True, each "%load_json(<file>, <default>)" is
+    replaced by the json data in <file> or, if <file> does not exist,
+    by <default>, which is what plantuml itself would load.
+
+    Parameters
+    ----------
+    code : STR
+        The plantuml code.
+    base_dir : STR, pathlib.Path or None, optional
+        The folder relative to which the paths in code are resolved,
+        i.e. the folder which would be the working directory of
+        plantuml.jar. If None, the current working directory is used.
+        The default is None.
+    inline_json : BOOL, optional
+        If True, also resolve "%load_json" calls.
+        The default is False.
+
+    Returns
+    -------
+    code : STR
+        The self-contained plantuml code.
+
+    Raises
+    ------
+    OSError
+        Raised if a theme or an included file does not exist.
+    """
+    base_dir = pathlib.Path(base_dir or ".").absolute()
+    return "\n".join(_inline_lines(code, base_dir, inline_json, set(), ()))
+
+
+def inline_puml_file(code_path, out_path=None, inline_json=False):
+    """
+    Resolve themes, includes and (optionally) json data in a plantuml
+    code file. See inline_puml_code() for details.
+
+    Parameters
+    ----------
+    code_path : STR or pathlib.Path
+        Path to the file containing the plantuml code. The paths in the
+        code are resolved relative to the folder containing this file.
+    out_path : STR, pathlib.Path or None, optional
+        If not None, the self-contained code is written to this path.
+        The default is None.
+    inline_json : BOOL, optional
+        If True, also resolve "%load_json" calls.
+        The default is False.
+
+    Returns
+    -------
+    code : STR
+        The self-contained plantuml code.
+    """
+    code_path = pathlib.Path(code_path).absolute()
+    code = inline_puml_code(
+        code_path.read_text(encoding="utf-8"),
+        base_dir=code_path.parent,
+        inline_json=inline_json,
+    )
+    if out_path:
+        write_text_atomic(out_path, code)
+    return code
+
+
+def _inline_lines(code, base_dir, inline_json, included_once, stack):
+    lines = []
+    for line in code.splitlines():
+        if m := _THEME_RE.match(line):
+            name, themes_dir = m.groups()
+            if themes_dir:
+                themes_dir = base_dir.joinpath(themes_dir.strip().strip('"'))
+            elif not name.startswith("MOCHADA-"):
+                lines.append(line)
+                continue
+            lines.extend(read_theme(name, themes_dir).splitlines())
+            continue
+
+        if m := _INCLUDE_RE.match(line):
+            kind, target = m.groups()
+            target = target.strip('"')
+            # "!include file!1" selects one diagram of file, which is
+            # left to plantuml
+            if (
+                target.startswith("<")
+                or re.match(r"^[a-z]+://", target)
+                or "!" in target
+            ):
+                lines.append(line)
+                continue
+            inc_path = base_dir.joinpath(target).resolve()
+            if not inc_path.exists():
+                raise OSError(f"Cannot find included file {inc_path}.")
+            if inc_path in stack:
+                raise OSError(f"Circular !include of {inc_path}.")
+            if kind == "include_once" and inc_path in included_once:
+                continue
+            included_once.add(inc_path)
+            inc_code = _read_cached(str(inc_path), inc_path.stat().st_mtime_ns)
+            lines.extend(
+                _inline_lines(
+                    _strip_start_end(inc_code),
+                    inc_path.parent,
+                    inline_json,
+                    included_once,
+                    (*stack, inc_path),
+                )
+            )
+            continue
+
+        if inline_json and "%load_json" in line:
+            line = _LOAD_JSON_RE.sub(
+                lambda m: _load_json_literal(base_dir, *m.groups()), line
+            )
+
+        lines.append(line)
+
+    return lines
+
+
+def _strip_start_end(code):
+    # included files may themselves be complete diagrams
+    lines = code.splitlines()
+    if lines and lines[0].strip().startswith("@start"):
+        lines = lines[1:]
+    if lines and lines[-1].strip().startswith("@end"):
+        lines = lines[:-1]
+    return "\n".join(lines)
+
+
+def _load_json_literal(base_dir, json_file, default):
+    json_path = base_dir.joinpath(json_file.strip())
+    if not json_path.is_file():
+        return default if default else "{}"
+    with open(json_path, encoding="utf-8") as f:
+        data = json.load(f)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
@@ -0,0 +1,228 @@
+"""
+Functions to check the hyperlinks between the diagrams in an output
+folder tree, e.g. the "contents" of linked CHADA tables or the links of
+workflow diagrams to metadata and table images. The plantuml code files
+and/or the rendered svg images of the whole tree are read in one pass to
+build the graph of links between diagrams, which is then checked for
+links to files which do not exist, diagrams which no other diagram links
+to and links which lead in a cycle.
+"""  # noqa: D400
+
+import fnmatch
+import html
+import os
+import posixpath
+import re
+import time
+import urllib.parse
+
+_SOURCES = ("puml", "svg")
+_BLOCK_RE = re.compile(
+    r"^[ \t]*@start\w+(?:[ \t]+([^\s(]+))?.*?^[ \t]*@end\w+", re.MULTILINE | re.DOTALL
+)
+_PUML_LINK_RE = re.compile(r"\[\[\s*(?:\{[^}]*\}\s*)?([^\s\]{}|]+)")
+_SVG_LINK_RE = re.compile(r'\shref="([^"]*)"')
+_EXTERNAL_RE = re.compile(r"^(?:[a-zA-Z][a-zA-Z0-9+.-]*:|//)")
+
+
+def _walk(root):
+    # the paths of all files in the tree relative to root (as posix
+    # strings), without hidden files and folders, in one pass
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(root, rel_dir)) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                rel = posixpath.join(rel_dir, entry.name) if rel_dir else entry.name
+                if entry.is_dir():
+                    stack.append(rel)
+                else:
+                    yield rel
+
+
+def _puml_diagrams(text, rel):
+    # the images of a plantuml code file and the raw link targets of each;
+    # plantuml writes the image of "@startjson name" as "name.svg" in the
+    # folder of the code, and the image of an unnamed block after the file
+    folder, stem = posixpath.split(rel)
+    stem = posixpath.splitext(stem)[0]
+    diagrams = {}
+    for m in _BLOCK_RE.finditer(text):
+        image = posixpath.join(folder, f"{m.group(1) or stem}.svg")
+        diagrams.setdefault(image, set()).update(_PUML_LINK_RE.findall(m.group(0)))
+    return diagrams
+
+
+def _svg_links(text):
+    return {html.unescape(t) for t in _SVG_LINK_RE.findall(text)}
+
+
+def _resolve(target, folder):
+    # the path of a link target relative to the root, or None for links
+    # to other sites and anchors in the same image
+    if _EXTERNAL_RE.match(target):
+        return None
+    target = urllib.parse.unquote(target.split("#", 1)[0].split("?", 1)[0])
+    if not target:
+        return None
+    return posixpath.normpath(posixpath.join(folder, target))
+
+
+def _strongly_connected(graph):
+    # the strongly connected components of a graph, by Tarjan's algorithm
+    # without recursion, so that long chains of links do not reach the
+    # recursion limit
+    index, low, on_stack, stack, components = {}, {}, set(), [], []
+    for start in graph:
+        if start in index:
+            continue
+        work = [(start, iter(graph[start]))]
+        index[start] = low[start] = len(index)
+        stack.append(start)
+        on_stack.add(start)
+        while work:
+            node, successors = work[-1]
+            for succ in successors:
+                if succ not in index:
+                    index[succ] = low[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(graph.get(succ, ()))))
+                    break
+                if succ in on_stack:
+                    low[node] = min(low[node], index[succ])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
+def check_links(root_dir, sources=_SOURCES, roots=None):
+    """
+    Check the hyperlinks between the diagrams in a folder tree.
+
+    Each diagram is identified by the path of its svg image. Its links are
+    read from the svg image and/or from the plantuml code file which
+    produces it, assuming that the image is rendered to the folder of the
+    code (the default of running.run_plantuml_code()). A plantuml code
+    file with several named blocks (e.g. from
+    tables.ChadaDocument.write_combined()) produces one diagram per block.
+    Links to other sites (e.g. "https://...") and to anchors are not
+    checked. Hidden files and folders (starting with ".") are ignored.
+
+    Parameters
+    ----------
+    root_dir : STR or pathlib.Path
+        The output folder.
+    sources : TUPLE or LIST, optional
+        What to read: "puml" for plantuml code files and/or "svg" for
+        svg images. With both, a diagram whose image has not been rendered
+        yet is still checked, and a link to it is not dangling.
+        The default is ("puml", "svg").
+    roots : LIST or None, optional
+        Patterns (see fnmatch) of the paths of the diagrams which are
+        entry points, e.g. ["*_overview.svg", "*workflow*.svg"]. They are
+        not reported as orphans.
+        The default is None.
+
+    Returns
+    -------
+    report : DICT
+        Dict with the keys:
+
+        - "diagrams": the number of diagrams.
+        - "links": the number of checked links between different files.
+        - "dangling": list of dicts with the keys "source" (the diagram),
+          "target" (the link as written) and "path" (the path it leads to)
+          for each link to a file which does not exist.
+        - "orphans": sorted list of the diagrams which no other diagram
+          links to, except for those matching roots.
+        - "cycles": list of sorted lists of diagrams which link to each
+          other in a cycle (strongly connected components of more than one
+          diagram). Links of a diagram to itself, e.g. the row of its own
+          section in the contents of linked CHADA tables, are not cycles.
+          Linked CHADA tables form one cycle of five diagrams by design.
+        - "duration": the time taken, in seconds.
+
+        All paths are relative to root_dir, with "/" as separator.
+
+    Raises
+    ------
+    ValueError
+        Raised if sources contains anything but "puml" and "svg".
+    """
+    unknown = set(sources) - set(_SOURCES)
+    if unknown or not sources:
+        raise ValueError(f"sources must be one or both of {list(_SOURCES)}.")
+    start = time.perf_counter()
+    root_dir = os.fspath(root_dir)
+
+    files, raw = set(), {}
+    for rel in _walk(root_dir):
+        files.add(rel)
+        suffix = posixpath.splitext(rel)[1]
+        if suffix[1:] not in sources:
+            continue
+        with open(os.path.join(root_dir, rel), encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        if suffix == ".svg":
+            raw.setdefault(rel, set()).update(_svg_links(text))
+        else:
+            for image, targets in _puml_diagrams(text, rel).items():
+                raw.setdefault(image, set()).update(targets)
+
+    # links to files outside the tree are checked on the file system, once
+    outside = {}
+
+    def _exists(path):
+        if path in raw or path in files:
+            return True
+        if path.startswith("../") or path == "..":
+            if path not in outside:
+                outside[path] = os.path.exists(os.path.join(root_dir, path))
+            return outside[path]
+        return False
+
+    graph, dangling, links = {}, [], 0
+    for diagram, targets in raw.items():
+        folder = posixpath.dirname(diagram)
+        edges = graph.setdefault(diagram, set())
+        for target in sorted(targets):
+            path = _resolve(target, folder)
+            if path is None or path == diagram:
+                continue
+            links += 1
+            if not _exists(path):
+                dangling.append({"source": diagram, "target": target, "path": path})
+            elif path in raw:
+                edges.add(path)
+
+    linked_to = set().union(*graph.values()) if graph else set()
+    orphans = sorted(
+        d
+        for d in graph
+        if d not in linked_to
+        and not any(fnmatch.fnmatchcase(d, p) for p in roots or ())
+    )
+    cycles = sorted(sorted(c) for c in _strongly_connected(graph) if len(c) > 1)
+    return {
+        "diagrams": len(graph),
+        "links": links,
+        "dangling": sorted(dangling, key=lambda d: (d["source"], d["target"])),
+        "orphans": orphans,
+        "cycles": cycles,
+        "duration": round(time.perf_counter() - start, 4),
+    }
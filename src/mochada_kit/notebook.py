@@ -0,0 +1,125 @@
+"""
+Functions to show plantuml diagrams in Jupyter notebooks. The diagrams
+are rendered through a plantuml.jar process which stays running and the
+render cache (see session.render_cached()), so running a cell again, or
+a whole notebook, only runs plantuml for diagrams which have changed.
+"""  # noqa: D400
+
+import base64
+import pathlib
+
+from mochada_kit.session import _START_RE, render_cached
+
+try:
+    from IPython.display import HTML, SVG, Image
+except ImportError:  # IPython is only needed in notebooks
+    HTML = SVG = Image = None
+
+_OUTPUT_TYPES = {"svg": "-tsvg", "png": "-tpng"}
+
+
+def _is_path(puml):
+    if isinstance(puml, pathlib.Path):
+        return True
+    # plantuml code always has several lines or starts with "@start"
+    return (
+        "\n" not in puml
+        and not puml.lstrip().startswith("@")
+        and pathlib.Path(puml).is_file()
+    )
+
+
+def show(
+    puml,
+    output_format="svg",
+    plantuml_path=None,
+    output_dpi=None,
+    skinparam_opts=None,
+    cache_dir=None,
+):
+    """
+    Render plantuml code, or a plantuml code file, for display in a
+    Jupyter notebook.
+
+    This replaces writing the code to a file, calling
+    running.run_plantuml_code() and displaying the image file. The
+    diagram is rendered by a plantuml.jar process which is kept running
+    between calls, and images are cached on disk, so a diagram which has
+    not changed is shown without running plantuml at all.
+
+    Parameters
+    ----------
+    puml : STR or pathlib.Path
+        The plantuml code or the path to a file containing it. Code
+        without "@start..." is placed between "@startuml" and "@enduml".
+    output_format : STR, optional
+        "svg" or "png".
+        The default is "svg".
+    plantuml_path : STR, pathlib.Path or None, optional
+        The full path to the plantuml.jar. If None, the path is taken from
+        the user's config (see running.run_plantuml_code()).
+        The default is None.
+    output_dpi : INT or None, optional
+        The dpi for png output.
+        The default is None.
+    skinparam_opts : DICT or None, optional
+        Skinparams passed to plantuml.jar (see running.run_plantuml_code()).
+        The default is None.
+    cache_dir : STR, pathlib.Path or None, optional
+        The folder of the render cache. If None, config.get_cache_dir() is
+        used.
+        The default is None.
+
+    Returns
+    -------
+    image : IPython.display.SVG, IPython.display.Image or IPython.display.HTML
+        The image, which Jupyter displays if it is the last value of a
+        cell. If the code contains several diagrams, an HTML object
+        containing all of them is returned.
+
+    Raises
+    ------
+    ImportError
+        Raised if IPython is not installed.
+    ValueError
+        Raised if output_format is not "svg" or "png", or if plantuml
+        reports an error in the code.
+    """
+    if SVG is None:
+        raise ImportError("IPython is required to show diagrams in a notebook.")
+    if output_format not in _OUTPUT_TYPES:
+        raise ValueError(f"output_format must be one of {list(_OUTPUT_TYPES)}.")
+
+    if _is_path(puml):
+        code_path = pathlib.Path(puml).absolute()
+        code = code_path.read_text(encoding="utf-8")
+        base_dir = code_path.parent
+    else:
+        code = str(puml)
+        base_dir = None
+        if not _START_RE.search(code):
+            code = f"@startuml\n{code}\n@enduml"
+
+    images = render_cached(
+        code,
+        base_dir=base_dir,
+        plantuml_path=plantuml_path,
+        output_type=_OUTPUT_TYPES[output_format],
+        output_dpi=output_dpi,
+        skinparam_opts=skinparam_opts,
+        cache_dir=cache_dir,
+    )
+
+    if len(images) == 1:
+        if output_format == "svg":
+            return SVG(data=images[0].decode("utf-8"))
+        return Image(data=images[0], format="png")
+
+    if output_format == "svg":
+        parts = [image.decode("utf-8") for image in images]
+    else:
+        parts = [
+            f'<img src="data:image/png;base64,{base64.b64encode(image).decode()}"/>'
+            for image in images
+        ]
+    return HTML("\n".join(f"<div>{p}</div>" for p in parts))
@@ -0,0 +1,337 @@
+"""
+Functions to produce the same diagram in several MOCHADA themes from
+a single run of plantuml.jar. The MOCHADA themes of one family differ
+only in the colours set in their definition block. The diagram is
+therefore rendered once with a reference theme, in which every colour
+of the definition block is replaced by a unique "sentinel" colour, and
+each theme variant is made by swapping the sentinel colours in the svg
+for the colours of that theme.
+"""  # noqa: D400
+
+import pathlib
+import re
+import tempfile
+
+from mochada_kit.fileio import write_text_atomic
+from mochada_kit.inlining import inline_puml_code, read_theme
+from mochada_kit.running import run_plantuml_code
+
+_DEFINITION_RE = re.compile(r"^!\$(\w+)\s*=\s*(.*?)\s*$")
+_HEX_RE = re.compile(r"#[0-9A-Fa-f]{6}\b")
+_THEME_LINE_RE = re.compile(r"^(\s*!theme\s+)MOCHADA-(\S+)(.*)$", re.MULTILINE)
+
+# plantuml colour names used in the MOCHADA themes and their svg values
+_NAMED_COLOURS = {
+    "black": "#000000",
+    "blue": "#0000FF",
+    "forestgreen": "#228B22",
+    "gray": "#808080",
+    "grey": "#808080",
+    "lightblue": "#ADD8E6",
+    "pink": "#FFC0CB",
+    "red": "#FF0000",
+    "technology": "#C9FFC9",
+    "white": "#FFFFFF",
+    "yellow": "#FFFF00",
+}
+
+# variables of the definition block which are not colours
+_NOT_COLOURS = ("PUML_THEME", "THEME")
+
+
+def _split_theme(theme_name):
+    # returns the definition block (as a dict) and the rest of the theme
+    lines = read_theme(f"MOCHADA-{theme_name}").splitlines()
+    definitions, body = {}, []
+    in_block = False
+    for line in lines:
+        m = _DEFINITION_RE.match(line)
+        if m and not body:
+            in_block = True
+            definitions[m.group(1)] = m.group(2).strip('"')
+        elif in_block or body:
+            body.append(line)
+    return definitions, "\n".join(body)
+
+
+def _to_hex(value):
+    if value.startswith("#") and len(value) == 7:
+        return value.upper()
+    return _NAMED_COLOURS.get(value.lower())
+
+
+def theme_colours(theme_name):
+    """
+    Read the colours set in the definition block of a MOCHADA theme.
+
+    Parameters
+    ----------
+    theme_name : STR
+        The part of the theme name after "MOCHADA-", e.g. "plasma".
+
+    Returns
+    -------
+    colours : DICT
+        Dict where the keys are the names of the variables which are set
+        to a colour (e.g. "USER_CASE_BACKGROUNDCOLOR") and the values are
+        lists of one colour, or two colours for a gradient, as upper case
+        hex strings as they appear in svg output. Variables set to another
+        variable are not included, since they change with that variable.
+
+    Raises
+    ------
+    ValueError
+        Raised if a colour name is not known.
+    """
+    definitions, _ = _split_theme(theme_name)
+    colours = {}
+    for k, v in definitions.items():
+        if k in _NOT_COLOURS or v.startswith("$") or re.fullmatch(r"[\d.]+", v):
+            continue
+        hexes = [_to_hex(c) for c in v.split("-")]
+        if None in hexes:
+            raise ValueError(f"Unknown colour {v} for {k} in theme {theme_name}.")
+        colours[k] = hexes
+    return colours
+
+
+def write_reference_theme(theme_name, themes_dir):
+    """
+    Write a reference theme in which each colour of the definition block
+    of a MOCHADA theme is replaced by a unique sentinel colour.
+
+    Parameters
+    ----------
+    theme_name : STR
+        The part of the theme name after "MOCHADA-", e.g. "plasma".
+    themes_dir : STR or pathlib.Path
+        The folder in which to write the reference theme.
+
+    Returns
+    -------
+    reference_name : STR
+        The part of the name of the reference theme after "MOCHADA-".
+    sentinels : DICT
+        Dict where the keys are the variables of theme_colours() and the
+        values are lists of the corresponding sentinel colours.
+    """
+    colours = theme_colours(theme_name)
+    sentinels, n = {}, 0
+    for k, v in colours.items():
+        sentinels[k] = []
+        for _ in v:
+            n += 1
+            sentinels[k].append(f"#FE{n:04X}")
+
+    lines = []
+    for line in read_theme(f"MOCHADA-{theme_name}").splitlines():
+        m = _DEFINITION_RE.match(line)
+        if m and m.group(1) in sentinels:
+            line = f'!${m.group(1)} = "{"-".join(sentinels[m.group(1)])}"'
+        lines.append(line)
+
+    reference_name = f"{theme_name}_reference"
+    write_text_atomic(
+        pathlib.Path(themes_dir).joinpath(f"puml-theme-MOCHADA-{reference_name}.puml"),
+        "\n".join(lines),
+    )
+    return reference_name, sentinels
+
+
+def can_retheme(base_theme, theme_name):
+    """
+    Check whether a diagram rendered in base_theme can be converted to
+    theme_name by swapping colours.
+
+    This requires the two themes to be identical apart from the colours
+    of their definition block, and each colour to be either a single
+    colour or a gradient in both themes.
+
+    Parameters
+    ----------
+    base_theme : STR
+        The part of the name of the rendered theme after "MOCHADA-".
+    theme_name : STR
+        The part of the name of the desired theme after "MOCHADA-".
+
+    Returns
+    -------
+    possible : BOOL
+        True if the conversion is possible.
+    """
+    base_defs, base_body = _split_theme(base_theme)
+    defs, body = _split_theme(theme_name)
+    if body != base_body or base_defs.keys() != defs.keys():
+        return False
+    try:
+        base_colours = theme_colours(base_theme)
+        colours = theme_colours(theme_name)
+    except ValueError:
+        return False
+    return base_colours.keys() == colours.keys() and all(
+        len(v) == len(colours[k]) for k, v in base_colours.items()
+    )
+
+
+def retheme_svg(svg, sentinels, theme_name):
+    """
+    Swap the sentinel colours in an svg for the colours of a theme.
+
+    Parameters
+    ----------
+    svg : STR
+        The svg rendered with the reference theme.
+    sentinels : DICT
+        The sentinel colours, from write_reference_theme().
+    theme_name : STR
+        The part of the name of the desired theme after "MOCHADA-".
+
+    Returns
+    -------
+    svg : STR
+        The svg in the desired theme.
+    """
+    colours = theme_colours(theme_name)
+    mapping = {}
+    for k, v in sentinels.items():
+        for i, sentinel in enumerate(v):
+            mapping[sentinel] = colours[k][i]
+    # the comment holds the encoded source with the reference theme
+    svg = re.sub(r"<!--SRC=\[.*?\]-->", "", svg, flags=re.DOTALL)
+    return _HEX_RE.sub(lambda m: mapping.get(m.group(0).upper(), m.group(0)), svg)
+
+
+def _normalise_svg(svg):
+    # ignore comments and processing instructions, and number the ids
+    # (e.g. of gradients, which plantuml names after their colours)
+    svg = re.sub(r"<!--.*?-->|<\?.*?\?>", "", svg, flags=re.DOTALL)
+    ids = {}
+    for i in re.findall(r'\sid="([^"]+)"', svg):
+        ids.setdefault(i, f"id{len(ids)}")
+    for old, new in ids.items():
+        svg = svg.replace(f'"{old}"', f'"{new}"').replace(f"#{old})", f"#{new})")
+    return svg
+
+
+def render_theme_variants(
+    code_path,
+    theme_names,
+    output_dir=None,
+    plantuml_path=None,
+    validate=None,
+):
+    """
+    Produce the diagram(s) of a plantuml code file as svg images in
+    several MOCHADA themes from a single run of plantuml.jar.
+
+    The code file must load a MOCHADA theme with "!theme MOCHADA-...".
+    It is run once with a reference version of that theme (see
+    write_reference_theme()) and the svg is converted into each of the
+    themes in theme_names by swapping colours. Themes which cannot be
+    produced in this way (see can_retheme()) are rendered by plantuml.jar
+    as usual. The images are named after the code file plus the theme
+    name, e.g. "my_diagram_viridis.svg".
+
+    Parameters
+    ----------
+    code_path : STR or pathlib.Path
+        Path to the file containing the plantuml code.
+    theme_names : LIST
+        List of the parts of the theme names after "MOCHADA-", e.g.
+        ["plasma", "viridis"].
+    output_dir : STR, pathlib.Path or None, optional
+        The folder for the images. If None, the folder containing
+        code_path is used.
+        The default is None.
+    plantuml_path : STR, pathlib.Path or None, optional
+        The full path to the plantuml.jar (see
+        running.run_plantuml_code()).
+        The default is None.
+    validate : LIST or None, optional
+        List of theme names for which the diagram is also rendered by
+        plantuml.jar to check that the converted svg is identical
+        (ignoring comments and ids).
+        The default is None.
+
+    Returns
+    -------
+    report : DICT
+        Dict where the keys are the theme names and the values are dicts
+        with the keys "paths" (list of pathlib.Path of the images),
+        "rethemed" (True if the images were converted, False if they were
+        rendered) and, for the themes in validate, "valid" (True if the
+        converted images match those rendered by plantuml.jar).
+
+    Raises
+    ------
+    ValueError
+        Raised if the code does not load a MOCHADA theme.
+    """
+    code_path = pathlib.Path(code_path).absolute()
+    output_dir = pathlib.Path(output_dir or code_path.parent).absolute()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    code = code_path.read_text(encoding="utf-8")
+
+    themes_used = {m.group(2) for m in _THEME_LINE_RE.finditer(code)}
+    if len(themes_used) != 1:
+        raise ValueError(
+            f"{code_path} must load exactly one MOCHADA theme to be re-themed."
+        )
+    base_theme = themes_used.pop()
+    validate = validate or []
+
+    def _render(theme_line, tmp_dir):
+        # render a self-contained copy of the code with a different theme
+        themed = _THEME_LINE_RE.sub(theme_line, code)
+        themed = inline_puml_code(themed, base_dir=code_path.parent, inline_json=True)
+        tmp_code = pathlib.Path(tmp_dir).joinpath(code_path.name)
+        tmp_code.write_text(themed, encoding="utf-8")
+        run_plantuml_code(tmp_code, plantuml_path=plantuml_path)
+        return {
+            p.name: p.read_text(encoding="utf-8")
+            for p in sorted(pathlib.Path(tmp_dir).glob("*.svg"))
+        }
+
+    def _variant_name(svg_name, theme_name):
+        return f"{pathlib.Path(svg_name).stem}_{theme_name}.svg"
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp = pathlib.Path(tmp_dir)
+        tmp.joinpath("ref").mkdir()
+        reference, sentinels = write_reference_theme(base_theme, tmp)
+        rethemable = [t for t in theme_names if can_retheme(base_theme, t)]
+        if rethemable:
+            ref_svgs = _render(
+                rf"\g<1>MOCHADA-{reference} from {tmp.as_posix()}", tmp / "ref"
+            )
+
+        for theme_name in theme_names:
+            if theme_name in rethemable:
+                svgs = {
+                    n: retheme_svg(s, sentinels, theme_name)
+                    for n, s in ref_svgs.items()
+                }
+            else:
+                render_dir = tmp.joinpath(theme_name)
+                render_dir.mkdir()
+                svgs = _render(rf"\g<1>MOCHADA-{theme_name}", render_dir)
+
+            entry = report[theme_name] = {
+                "paths": [],
+                "rethemed": theme_name in rethemable,
+            }
+            for n, s in svgs.items():
+                path = output_dir.joinpath(_variant_name(n, theme_name))
+                write_text_atomic(path, s)
+                entry["paths"].append(path)
+
+            if theme_name in validate and entry["rethemed"]:
+                check_dir = tmp.joinpath(f"check_{theme_name}")
+                check_dir.mkdir()
+                real = _render(rf"\g<1>MOCHADA-{theme_name}", check_dir)
+                entry["valid"] = real.keys() == svgs.keys() and all(
+                    _normalise_svg(real[n]) == _normalise_svg(svgs[n]) for n in real
+                )
+
+    return report
@@ -3,21 +3,90 @@ Functions to help running plantuml code against the plantuml.jar
 (which is stored on the local system).
 """
 
+import concurrent.futures
+import functools
+import hashlib
+import json
+import math
 import pathlib
+import re
+import signal
+import statistics
 import subprocess
+import sys
+import tempfile
+import time
+import warnings
 
-from mochada_kit.config import read_config
+from mochada_kit.concurrency import AdaptiveLimit, auto_workers, available_cpus
+from mochada_kit.config import get_puml_path
+from mochada_kit.fileio import atomic_output_dir, write_text_atomic
+from mochada_kit.scheduling import longest_first, predict_render_costs
 
-_puml_path = read_config()["puml_path"]
+# plantuml renders at 96 dpi by default and, by default, crops images
+# to at most 4096 pixels in width and height (PLANTUML_LIMIT_SIZE)
+_DEFAULT_DPI = 96
+_PUML_LIMIT_SIZE = 4096
+
+# the heap from which to escalate if no heap was given for the first run
+_DEFAULT_HEAP_MB = 1024
+
+# patterns in the output of java/plantuml.jar for failures worth retrying
+_MEMORY_ERRORS = (
+    "java.lang.OutOfMemoryError",
+    "GC overhead limit exceeded",
+    "Could not reserve enough space",
+    "Cannot allocate memory",
+)
+_TRANSIENT_ERRORS = (
+    "Resource temporarily unavailable",
+    "Too many open files",
+    "Connection reset",
+    "Connection refused",
+)
+# SIGKILL, e.g. from the out-of-memory killer (not defined on Windows)
+_SIGKILL = getattr(signal, "SIGKILL", 9)
+
+_DEFAULT_RETRY_POLICY = {
+    "max_attempts": 3,
+    "backoff": 1.0,
+    "max_backoff": 30.0,
+    "heap_mb": None,
+    "heap_factor": 2,
+    "max_heap_mb": 8192,
+}
+
+_PUML_SUFFIXES = (
+    ".txt",
+    ".tex",
+    ".java",
+    ".htm",
+    ".html",
+    ".c",
+    ".h",
+    ".cpp",
+    ".apt",
+    ".pu",
+    ".puml",
+    ".hpp",
+    ".hh",
+    ".md",
+)
 
 
 def run_plantuml_code(
     code_path,
-    plantuml_path=_puml_path,
+    plantuml_path=None,
     output_dir=None,
     output_type="-tsvg",
     output_dpi=None,
     skinparam_opts=None,
+    shard=None,
+    manifest_path=None,
+    max_pixels=None,
+    retry_policy=None,
+    workers=None,
+    balance_shards=False,
 ):
     """
     Produce diagrams from plantuml code.
@@ -27,8 +96,12 @@ def run_plantuml_code(
     files of plantuml code. This file/these files are then
     run against plantuml.jar to produce diagrams. You can
     specify a path to plantuml.jar or it will be read from
+    the environment variable MOCHADA_KIT_PUML_PATH or from
     the current user's config
-    (found in home/.mochada_kit/config.json).
+    (found in home/.mochada_kit/config.json, or at the path
+    given by the environment variable MOCHADA_KIT_CONFIG).
+    The config is only read when this function is called and
+    it is read again if the config file has been modified.
     You can optionally specify an output directory to store
     the diagrams in a different folder from the code that
     produces them. If the output path is not an absolute path,
@@ -59,8 +132,9 @@ def run_plantuml_code(
         will run them all.
     plantuml_path : STR or pathlib.Path, optional
         The full path to the plantuml.jar. By default, the function
-        tries to take the path from the current user's config,
-        found in the home directory under .CHADA_kit/config.json.
+        tries to take the path from the environment variable
+        MOCHADA_KIT_PUML_PATH and then from the current user's config,
+        found in the home directory under .mochada_kit/config.json.
         If the value has not been set there and was not supplied
         in this function, an error will be raised because the
         function will not be able to find plantuml.jar.
@@ -86,9 +160,9 @@ def run_plantuml_code(
     output_dpi : INT or None, optional
         For png output, you can use this argument to set the dpi
         of the output image e.g. to increase quality. Has no effect
-        for svg output. With png output, the default dpi is 300
-        (this will be the result if output_type="-tpng" and
-        output_dpi=None).
+        for svg output. With png output, plantuml's default of 96 dpi
+        is used if output_dpi=None (and no "dpi" is given in
+        skinparam_opts).
         The default is None.
     skinparam_opts : DICT or None, optional
         Dict where the keys are strings giving the name of
@@ -99,6 +173,71 @@ def run_plantuml_code(
         here:
         https://plantuml-documentation.readthedocs.io/en/latest/formatting/all-skin-params.html.
         The default is None.
+    shard : TUPLE or None, optional
+        Tuple of two ints (index, count). If not None, code_path must be
+        a folder and only the slice of its plantuml code files assigned to
+        shard number index (counting from 0) out of count shards is run.
+        The split is reproducible, and a file stays in its shard when
+        other files are added or removed (see shard_puml_files()), so
+        that several CI runners can each render one shard of the same
+        folder.
+        Each file in the shard is run in its own call to plantuml.jar.
+        The default is None.
+    manifest_path : STR, pathlib.Path or None, optional
+        Path to a json manifest file recording the render time of each
+        plantuml code file. If the file exists, the recorded times are
+        used to start the longest files first and, if balance_shards is
+        True, to balance the shards. After running, the entries for the
+        files which were run are added or updated. Manifests written by
+        different shards can be combined with merge_manifests(). If not
+        None, each file is run in its own call to plantuml.jar, even if
+        shard is None.
+        The default is None.
+    max_pixels : INT or None, optional
+        For png output, the maximum number of pixels (width * height)
+        of each output image, e.g. 50_000_000. Each file is first run
+        with svg output to measure the size of the diagram at the
+        reference of 96 dpi (plantuml's default, at which svg sizes are
+        given). The size of the png image is this size scaled by the dpi
+        used, i.e. the "dpi" in skinparam_opts, output_dpi or else 96,
+        divided by 96. The dpi is then reduced, if necessary, so
+        that the png image stays within this budget and within the 4096
+        pixel limit on width and height which plantuml applies by
+        default. This avoids very large images exhausting the memory of
+        Java or being cropped. Has no effect for svg output.
+        The default is None.
+    retry_policy : DICT or None, optional
+        If not None, failed runs of plantuml.jar which are caused by a lack
+        of memory (e.g. java.lang.OutOfMemoryError) or another transient
+        problem are retried with exponential backoff, and the Java heap is
+        increased after each failure caused by a lack of memory. Other
+        failures, e.g. syntax errors in the plantuml code, are not
+        retried. The keys of the dict override those of the default
+        policy (see run_with_retries()), so an empty dict gives the
+        default policy. If manifest_path is not None, each attempt is
+        recorded in the manifest.
+        The default is None.
+    workers : INT, STR or None, optional
+        The number of plantuml.jar processes to run in parallel, each
+        running one file. The files are started in order of decreasing
+        predicted render time (see scheduling.predict_render_costs()),
+        so that no worker is left running a large diagram at the end.
+        If "auto", the number is chosen from the CPUs and memory
+        available (respecting container limits) and the Java heap given
+        in retry_policy, and is then adapted while the files are running,
+        from the memory used by each process and the throughput achieved
+        (see concurrency.AdaptiveLimit). It never exceeds the number of
+        available CPUs, since plantuml.jar is mostly CPU bound. The files
+        are still started in order of decreasing predicted render time
+        when the number changes. The adaptations are recorded in the
+        manifest. If None or 1, the files are run one after the other.
+        The default is None.
+    balance_shards : BOOL, optional
+        If True, the files are assigned to the shards so that the shards
+        have about the same predicted render time, instead of by a stable
+        hash of their path. A file may then move to another shard when
+        other files are added or removed. Has no effect if shard is None.
+        The default is False.
 
     Raises
     ------
@@ -111,7 +250,12 @@ def run_plantuml_code(
     OSError
         Raised if plantuml_path was not passed AND is not
         set in the users' config.json.
+    TypeError
+        Raised if shard is not None and code_path is not a folder.
     """
+    if not plantuml_path:
+        plantuml_path = get_puml_path()
+
     if not plantuml_path:
         raise OSError(
             "plantuml_path was not passed and is also not defined "
@@ -130,7 +274,8 @@ def run_plantuml_code(
     if not code_path.exists():
         raise OSError("The code_path supplied is not an existing path.")
 
-    cmd = ["java", "-jar", plantuml_path, output_type, code_path]
+    if shard is not None and not code_path.is_dir():
+        raise TypeError("shard can only be used if code_path is a folder.")
 
     if output_dir and isinstance(output_dir, (pathlib.Path, str)):
         output_dir = (
@@ -139,30 +284,604 @@ def run_plantuml_code(
             else output_dir.absolute()
         )
         output_dir.mkdir(exist_ok=True)
-        cmd.insert(4, "-o")
-        cmd.insert(5, output_dir)
     elif output_dir is not None:
         raise TypeError("output_dir must be either pathlib.Path or str.")
 
+    cwd = code_path if code_path.is_dir() else code_path.parent
+
+    fit_png = bool(max_pixels) and output_type == "-tpng"
+    if fit_png and skinparam_opts:
+        # a dpi among the skin parameters would override the fitted one
+        # (as it overrides output_dpi), so it is used as output_dpi instead
+        skinparam_opts = dict(skinparam_opts)
+        for k in [k for k in skinparam_opts if k.lower() == "dpi"]:
+            output_dpi = int(skinparam_opts.pop(k))
+
+    if shard is None and manifest_path is None and not fit_png and not workers:
+        cmd = functools.partial(
+            _plantuml_cmd,
+            plantuml_path,
+            output_type,
+            code_path,
+            output_dpi=output_dpi,
+            skinparam_opts=skinparam_opts,
+        )
+        _run_plantuml_atomic(cmd, cwd, output_dir or cwd, retry_policy=retry_policy)
+        return
+
+    manifest = read_manifest(manifest_path) if manifest_path else {}
+    renders = manifest.setdefault("renders", {})
+
+    files = list_puml_files(code_path) if code_path.is_dir() else [code_path]
+    predicted = predict_render_costs(
+        files, cwd, renders=renders, output_type=output_type, output_dpi=output_dpi
+    )
+    if shard is not None:
+        costs = {k: v[0] for k, v in predicted.items()}
+        files = shard_puml_files(
+            files, shard, costs=costs, base_path=cwd, balance=balance_shards
+        )
+    files = longest_first(files, predicted, cwd)
+
+    def _render(f):
+        start = time.perf_counter()
+        dpi = output_dpi
+        if fit_png:
+            size = estimate_diagram_size(
+                f, plantuml_path, skinparam_opts=skinparam_opts
+            )
+            dpi = fit_dpi_to_pixel_budget(size, max_pixels, output_dpi=output_dpi)
+        cmd = functools.partial(
+            _plantuml_cmd,
+            plantuml_path,
+            output_type,
+            f,
+            output_dpi=dpi,
+            skinparam_opts=skinparam_opts,
+        )
+        key = f.relative_to(cwd).as_posix()
+        entry = renders[key] = {
+            "output_type": output_type,
+            "dpi": dpi,
+            "features": predicted[key][1],
+            "predicted": round(predicted[key][0], 4),
+        }
+        if retry_policy is not None:
+            entry["attempts"] = []
+        _run_plantuml_atomic(
+            cmd,
+            cwd,
+            output_dir or cwd,
+            retry_policy=retry_policy,
+            attempts=entry.get("attempts"),
+        )
+        entry["duration"] = round(time.perf_counter() - start, 4)
+        entry["rendered_at"] = time.time()
+
+    try:
+        if not workers or workers == 1 or len(files) < 2:
+            for f in files:
+                _render(f)
+        elif workers == "auto":
+            pool_size = min(available_cpus(), len(files))
+            heap_mb = (retry_policy or {}).get("heap_mb")
+            limit = AdaptiveLimit(
+                auto_workers(heap_mb=heap_mb, max_workers=pool_size), pool_size
+            )
+            _run_in_pool(_render, files, pool_size, limit=limit)
+            manifest["concurrency"] = limit.history
+        else:
+            _run_in_pool(_render, files, min(int(workers), len(files)))
+    finally:
+        if manifest_path:
+            write_manifest(manifest, manifest_path)
+
+
+def _run_in_pool(func, files, pool_size, limit=None):
+    # the files are submitted in order and, with a limit, each only once it
+    # may run, so that they start in this order whatever the limit is
+    with concurrent.futures.ThreadPoolExecutor(pool_size) as pool:
+        futures = []
+        for f in files:
+            if limit is not None:
+                limit.acquire()
+            future = pool.submit(func, f)
+            if limit is not None:
+                future.add_done_callback(lambda _: limit.release())
+            futures.append(future)
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+
+
+def _run_plantuml_atomic(cmd, cwd, final_dir, retry_policy=None, attempts=None):
+    # plantuml writes into a temporary folder from which the diagrams are
+    # renamed into final_dir, so that readers never see partial files
+    with atomic_output_dir(final_dir) as tmp_dir:
+        cmd = functools.partial(cmd, output_dir=tmp_dir)
+        if retry_policy is None:
+            subprocess.run(
+                cmd(), shell=False, stderr=subprocess.STDOUT, check=True, cwd=cwd
+            )
+        else:
+            run_with_retries(cmd, cwd, retry_policy, attempts=attempts)
+
+
+def _plantuml_cmd(
+    plantuml_path,
+    output_type,
+    target,
+    output_dir=None,
+    output_dpi=None,
+    skinparam_opts=None,
+    heap_mb=None,
+):
+    cmd = ["java", "-jar", plantuml_path, output_type]
+
+    if heap_mb:
+        cmd.insert(1, f"-Xmx{int(heap_mb)}m")
+
+    if output_dir:
+        cmd.extend(["-o", output_dir])
+
     if output_dpi:
-        cmd.insert(-1, f"-Sdpi={output_dpi}")
+        cmd.append(f"-Sdpi={output_dpi}")
 
     if skinparam_opts:
         for k, v in skinparam_opts.items():
-            cmd.insert(-1, f"-S{k}={v}")
+            cmd.append(f"-S{k}={v}")
 
-    cwd = code_path if code_path.is_dir() else code_path.parent
+    cmd.append(target)
+    return cmd
+
+
+def classify_render_failure(returncode, output):
+    """
+    Classify a failed run of plantuml.jar.
+
+    Parameters
+    ----------
+    returncode : INT
+        The return code of the java process.
+    output : STR
+        The combined stdout and stderr of the java process.
+
+    Returns
+    -------
+    reason : STR or None
+        "memory" if the run failed for lack of memory (including the
+        process being killed with SIGKILL, e.g. by the out-of-memory
+        killer), "transient" if it failed for another temporary reason,
+        or None if it is not worth retrying, including the process being
+        stopped by another signal, e.g. SIGTERM or SIGINT when a job is
+        cancelled.
+    """
+    # a return code of 128 + n is given by a shell or a wrapper when its
+    # child is killed by signal n
+    if returncode in (-_SIGKILL, 128 + _SIGKILL):
+        return "memory"
+    if returncode < 0:
+        return None
+    if any(e in output for e in _MEMORY_ERRORS):
+        return "memory"
+    if any(e in output for e in _TRANSIENT_ERRORS):
+        return "transient"
+    return None
+
+
+def run_with_retries(cmd, cwd, retry_policy=None, attempts=None):
+    """
+    Run plantuml.jar, retrying failures caused by a lack of memory
+    or other transient problems.
+
+    The default policy is:
+
+    - "max_attempts": 3 (the total number of runs),
+    - "backoff": 1.0 (seconds to wait before the first retry, doubled for
+      each further retry),
+    - "max_backoff": 30.0 (the longest wait in seconds),
+    - "heap_mb": None (the maximum Java heap for the first run in MB;
+      None uses the Java default),
+    - "heap_factor": 2 (the heap is multiplied by this after a failure
+      caused by a lack of memory, starting from 1024 MB if heap_mb
+      is None),
+    - "max_heap_mb": 8192 (the heap is never increased beyond this).
+
+    Parameters
+    ----------
+    cmd : CALLABLE
+        Function taking the keyword argument heap_mb and returning the
+        command to run as a list.
+    cwd : STR or pathlib.Path
+        The working directory for the command.
+    retry_policy : DICT or None, optional
+        Dict overriding any of the keys of the default policy.
+        The default is None.
+    attempts : LIST or None, optional
+        If not None, a dict describing each attempt (heap_mb, returncode,
+        reason and duration) is appended to this list.
+        The default is None.
+
+    Raises
+    ------
+    subprocess.CalledProcessError
+        Raised if the last attempt fails or a failure is not worth
+        retrying.
+    """
+    policy = {**_DEFAULT_RETRY_POLICY, **(retry_policy or {})}
+    attempts = attempts if attempts is not None else []
+    heap_mb = policy["heap_mb"]
+    backoff = policy["backoff"]
+
+    for attempt in range(1, policy["max_attempts"] + 1):
+        start = time.perf_counter()
+        args = cmd(heap_mb=heap_mb)
+        result = subprocess.run(
+            args,
+            shell=False,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors="replace",
+            cwd=cwd,
+        )
+        sys.stdout.write(result.stdout)
+
+        reason = None
+        if result.returncode != 0:
+            reason = classify_render_failure(result.returncode, result.stdout)
+        attempts.append(
+            {
+                "heap_mb": heap_mb,
+                "returncode": result.returncode,
+                "reason": reason,
+                "duration": round(time.perf_counter() - start, 4),
+            }
+        )
+
+        if result.returncode == 0:
+            return
+        if reason is None or attempt == policy["max_attempts"]:
+            raise subprocess.CalledProcessError(
+                result.returncode, args, output=result.stdout
+            )
+
+        if reason == "memory":
+            heap_mb = min(
+                (heap_mb or _DEFAULT_HEAP_MB) * policy["heap_factor"],
+                policy["max_heap_mb"],
+            )
+        time.sleep(min(backoff, policy["max_backoff"]))
+        backoff *= 2
+
+
+def estimate_diagram_size(code_path, plantuml_path=None, skinparam_opts=None):
+    """
+    Estimate the size of the diagram(s) produced by a plantuml code file.
+
+    The code is run once with svg output into a temporary folder and
+    the size is read from the resulting svg file(s). This is much
+    cheaper than producing a large png image.
+
+    Parameters
+    ----------
+    code_path : STR or pathlib.Path
+        Path to a file containing plantuml code.
+    plantuml_path : STR, pathlib.Path or None, optional
+        The full path to the plantuml.jar. If None, it is read from the
+        environment or the user's config (see run_plantuml_code()).
+        The default is None.
+    skinparam_opts : DICT or None, optional
+        Skin parameters to apply, as in run_plantuml_code().
+        The default is None.
+
+    Returns
+    -------
+    size : TUPLE
+        Tuple of two floats (width, height) giving the size in pixels
+        at 96 dpi (plantuml's default), whatever "dpi" is given in
+        skinparam_opts. If the code file produces several diagrams, the
+        size of the largest one is returned.
+    """
+    plantuml_path = plantuml_path or get_puml_path()
+    code_path = pathlib.Path(code_path).absolute()
+    # measure at the reference dpi, to which fit_dpi_to_pixel_budget() scales
+    skinparam_opts = {
+        k: v for k, v in (skinparam_opts or {}).items() if k.lower() != "dpi"
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cmd = _plantuml_cmd(
+            plantuml_path,
+            "-tsvg",
+            code_path,
+            output_dir=tmp_dir,
+            skinparam_opts=skinparam_opts,
+        )
+        subprocess.run(
+            cmd,
+            shell=False,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.STDOUT,
+            check=True,
+            cwd=code_path.parent,
+        )
+        sizes = [read_svg_size(p) for p in pathlib.Path(tmp_dir).glob("*.svg")]
+
+    return max(sizes, key=lambda s: s[0] * s[1], default=(0.0, 0.0))
+
+
+def read_svg_size(svg_path):
+    """
+    Read the width and height of an svg image from its root element.
+
+    Parameters
+    ----------
+    svg_path : STR or pathlib.Path
+        Path to the svg file.
+
+    Returns
+    -------
+    size : TUPLE
+        Tuple of two floats (width, height) in pixels, or (0.0, 0.0)
+        if they cannot be found.
+    """
+    with open(svg_path, encoding="utf-8", errors="replace") as f:
+        head = f.read(4096)
+
+    if not (m := re.search(r"<svg\b[^>]*>", head)):
+        return (0.0, 0.0)
+    tag = m.group(0)
+
+    w = re.search(r'\swidth="([\d.]+)(?:px)?"', tag)
+    h = re.search(r'\sheight="([\d.]+)(?:px)?"', tag)
+    if w and h:
+        return (float(w.group(1)), float(h.group(1)))
+
+    viewbox = r'viewBox="[\d.-]+[\s,]+[\d.-]+[\s,]+([\d.]+)[\s,]+([\d.]+)"'
+    if vb := re.search(viewbox, tag):
+        return (float(vb.group(1)), float(vb.group(2)))
+
+    return (0.0, 0.0)
+
+
+def fit_dpi_to_pixel_budget(size, max_pixels, output_dpi=None):
+    """
+    Choose the dpi for png output so that the image stays within a
+    pixel budget and within the maximum image size of plantuml.
+
+    Parameters
+    ----------
+    size : TUPLE
+        Tuple (width, height) of the diagram in pixels at 96 dpi, e.g.
+        from estimate_diagram_size().
+    max_pixels : INT
+        The maximum number of pixels (width * height) of the png image.
+    output_dpi : INT or None, optional
+        The requested dpi. If None, plantuml's default of 96 is assumed.
+        The default is None.
+
+    Returns
+    -------
+    dpi : INT or None
+        The requested dpi if the image fits within the budget (None if
+        no dpi was requested), otherwise the largest dpi which fits.
+    """
+    width, height = size
+    requested = output_dpi or _DEFAULT_DPI
+    if width <= 0 or height <= 0:
+        return output_dpi
+
+    max_dpi = min(
+        _DEFAULT_DPI * math.sqrt(max_pixels / (width * height)),
+        _DEFAULT_DPI * _PUML_LIMIT_SIZE / max(width, height),
+    )
+    if requested <= max_dpi:
+        return output_dpi
+
+    dpi = max(1, math.floor(max_dpi))
+    warnings.warn(
+        f"Reducing dpi from {requested} to {dpi} to keep a diagram of "
+        f"{width:.0f}x{height:.0f} px (at {_DEFAULT_DPI} dpi) within "
+        f"{max_pixels} pixels.",
+        stacklevel=2,
+    )
+    return dpi
+
+
+def list_puml_files(code_folder):
+    """
+    List the plantuml code files in a folder, in the same way as
+    plantuml.jar does when it is given a folder.
+
+    Parameters
+    ----------
+    code_folder : STR or pathlib.Path
+        Path to a folder containing plantuml code files.
+
+    Returns
+    -------
+    files : LIST
+        Sorted list of pathlib.Path pointing to the files in code_folder
+        which have one of the extensions recognised by plantuml.jar.
+    """
+    return sorted(
+        f
+        for f in pathlib.Path(code_folder).iterdir()
+        if f.is_file() and f.suffix in _PUML_SUFFIXES
+    )
+
+
+def shard_puml_files(files, shard, costs=None, base_path=None, balance=False):
+    """
+    Select the plantuml code files belonging to one shard of a batch.
+
+    By default, each file is assigned to a shard by a stable hash of its
+    path relative to base_path (or its name), so that a file stays in the
+    same shard when other files are added or removed, and the render
+    times recorded by each shard remain useful in the next run.
+
+    With balance=True, the files are instead assigned greedily, most
+    expensive first, each going to the shard with the lowest total cost
+    so far. The cost of a file is its render time from costs. Files with
+    no recorded cost are given the median of the known costs (or 1 if
+    there are none). Ties are broken by the stable hash. The shards are
+    then balanced, but adding or removing a file may move many others to
+    other shards.
+
+    Either way, every runner calling this function with the same files
+    (and costs) gets the same, non-overlapping assignment.
+
+    Parameters
+    ----------
+    files : LIST
+        List of pathlib.Path pointing to the plantuml code files.
+    shard : TUPLE
+        Tuple of two ints (index, count), where index is the number of the
+        shard to return (counting from 0) and count is the total number
+        of shards.
+    costs : DICT or None, optional
+        Dict where the keys are the posix paths of the files relative to
+        base_path and the values are the render times in seconds, as
+        recorded in the "renders" of a manifest.
+        The default is None.
+    base_path : STR, pathlib.Path or None, optional
+        The folder to which the keys of costs are relative. If None,
+        the keys are the file names.
+        The default is None.
+    balance : BOOL, optional
+        If True, balance the shards by the costs, see above.
+        The default is False.
+
+    Returns
+    -------
+    selected : LIST
+        Sorted list of pathlib.Path of the files in the requested shard.
 
-    subprocess.run(cmd, shell=False, stderr=subprocess.STDOUT, check=True, cwd=cwd)
+    Raises
+    ------
+    ValueError
+        Raised if shard is not a valid (index, count) pair.
+    """
+    index, count = shard
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"shard must satisfy 0 <= index < count, got {shard}.")
+
+    costs = costs or {}
+
+    def _key(f):
+        f = pathlib.Path(f).absolute()
+        if base_path:
+            return f.relative_to(pathlib.Path(base_path).absolute()).as_posix()
+        return f.name
+
+    if not balance:
+        return sorted(
+            pathlib.Path(f)
+            for f in files
+            if int(hashlib.sha1(_key(f).encode()).hexdigest(), 16) % count == index
+        )
+
+    default_cost = statistics.median(costs.values()) if costs else 1.0
+
+    def _sort_key(f):
+        k = _key(f)
+        digest = hashlib.sha1(k.encode()).hexdigest()
+        return (-costs.get(k, default_cost), digest)
+
+    loads = [0.0] * count
+    selected = []
+    for f in sorted(files, key=_sort_key):
+        target = min(range(count), key=lambda i: (loads[i], i))
+        loads[target] += costs.get(_key(f), default_cost)
+        if target == index:
+            selected.append(pathlib.Path(f))
+
+    return sorted(selected)
 
 
-def run_all_gallery_puml_code(output_type="-tsvg"):
+def read_manifest(manifest_path):
+    """
+    Read a json render manifest, if it exists.
+
+    Parameters
+    ----------
+    manifest_path : STR or pathlib.Path
+        Path to the json manifest file.
+
+    Returns
+    -------
+    manifest : DICT
+        The contents of the manifest, or a new manifest with no
+        entries if the file does not exist.
+    """
+    manifest_path = pathlib.Path(manifest_path)
+    if not manifest_path.exists():
+        return {"renders": {}}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, manifest_path):
+    """
+    Write a render manifest to a json file.
+
+    Parameters
+    ----------
+    manifest : DICT
+        The manifest, as returned by read_manifest().
+    manifest_path : STR or pathlib.Path
+        Path to the json manifest file.
+    """
+    manifest_path = pathlib.Path(manifest_path)
+    manifest_path.parent.mkdir(exist_ok=True, parents=True)
+    write_text_atomic(manifest_path, json.dumps(manifest, indent="  ", sort_keys=True))
+
+
+def merge_manifests(manifest_paths, out_path=None):
+    """
+    Merge the render manifests written by several shards.
+
+    If the same file appears in more than one manifest, the most
+    recently rendered entry is kept.
+
+    Parameters
+    ----------
+    manifest_paths : LIST
+        List of STR or pathlib.Path pointing to json manifest files.
+    out_path : STR, pathlib.Path or None, optional
+        If not None, the merged manifest is written to this path.
+        The default is None.
+
+    Returns
+    -------
+    merged : DICT
+        The merged manifest.
+    """
+    merged = {"renders": {}}
+    for p in manifest_paths:
+        for k, v in read_manifest(p).get("renders", {}).items():
+            old = merged["renders"].get(k)
+            if old is None or v.get("rendered_at", 0) >= old.get("rendered_at", 0):
+                merged["renders"][k] = v
+
+    if out_path:
+        write_manifest(merged, out_path)
+
+    return merged
+
+
+def run_all_gallery_puml_code(
+    output_type="-tsvg", shard=None, manifest_path=None, balance_shards=False
+):
     """
     Run all the plantuml code in gallery/puml_code against
     plantuml.jar generating .svg diagrams, which are stored in gallery.
 
     To save the diagrams as .png files, change output_type to "-tpng".
 
+    To split the work between several CI runners, give each runner a
+    different shard, e.g. shard=(0, 4) ... shard=(3, 4), and a manifest_path
+    (see run_plantuml_code()).
+
     Parameters
     ----------
     output_type : STR, optional
@@ -176,6 +895,17 @@ def run_all_gallery_puml_code(output_type="-tsvg"):
         - "-tpng" --> png image
 
         The default is "-tsvg".
+    shard : TUPLE or None, optional
+        Tuple of two ints (index, count) selecting one shard of the
+        gallery to run. If None, all the gallery is run.
+        The default is None.
+    manifest_path : STR, pathlib.Path or None, optional
+        Path to a json manifest file recording the render times, which
+        are used to balance the shards if balance_shards is True.
+        The default is None.
+    balance_shards : BOOL, optional
+        See run_plantuml_code().
+        The default is False.
     """
     c_p = (
         pathlib.Path(__file__)
@@ -183,4 +913,11 @@ def run_all_gallery_puml_code(output_type="-tsvg"):
         .resolve()
     )
 
-    run_plantuml_code(c_p, output_dir="../", output_type=output_type)
+    run_plantuml_code(
+        c_p,
+        output_dir="../",
+        output_type=output_type,
+        shard=shard,
+        manifest_path=manifest_path,
+        balance_shards=balance_shards,
+    )
@@ -0,0 +1,269 @@
+"""
+Functions to predict how long plantuml.jar will take to run a code
+file, so that a batch of files can be scheduled longest-first across a
+pool of workers. The prediction uses the render time recorded for the
+same file in a manifest, if there is one, and otherwise a linear model
+of simple features of the code (number of lines, number of elements
+and size of loaded json data), fitted to the render times of all the
+files in the manifest.
+"""  # noqa: D400
+
+import pathlib
+import re
+
+# seconds per unit of each feature, used until enough renders have been
+# recorded to fit the model: starting java, lines, elements, json kB
+_DEFAULT_COEFFS = (1.0, 0.002, 0.01, 0.005)
+_FEATURES = ("lines", "elements", "json_kb")
+_MIN_FIT_RENDERS = 8
+
+# lines which become an element of the diagram: json keys, arrows,
+# highlights and uml elements such as rectangle, component, note etc.
+_ELEMENT_RE = re.compile(
+    r'^\s*("[^"]*"\s*:|#highlight\b|\S.*(?:-+>|<-+)|'
+    r"(?:rectangle|component|node|card|file|folder|frame|package|"
+    r"database|note|label|object|entity|class|usecase|actor)\b)"
+)
+_LOAD_JSON_RE = re.compile(r'%load_json\(\s*"?([^",)]+?)"?\s*[,)]')
+
+
+def puml_features(code_path):
+    """
+    Extract the features used to predict the render time of a plantuml
+    code file.
+
+    Parameters
+    ----------
+    code_path : STR or pathlib.Path
+        Path to the file containing the plantuml code.
+
+    Returns
+    -------
+    features : DICT
+        Dict with the keys "lines" (number of lines), "elements" (number
+        of lines which produce an element of the diagram) and "json_kb"
+        (size of the json files loaded with "%load_json" in kB).
+    """
+    code_path = pathlib.Path(code_path)
+    code = code_path.read_text(encoding="utf-8", errors="replace")
+    lines = code.splitlines()
+
+    json_bytes = 0
+    for m in _LOAD_JSON_RE.finditer(code):
+        json_path = code_path.parent.joinpath(m.group(1).strip())
+        if json_path.is_file():
+            json_bytes += json_path.stat().st_size
+
+    return {
+        "lines": len(lines),
+        "elements": sum(1 for line in lines if _ELEMENT_RE.match(line)),
+        "json_kb": round(json_bytes / 1024, 3),
+    }
+
+
+def _dpi_factor(output_type, output_dpi):
+    # the time spent drawing a png grows with its number of pixels
+    if output_type == "-tpng" and output_dpi:
+        return (output_dpi / 96) ** 2
+    return 1.0
+
+
+def fit_cost_model(renders, output_type="-tsvg"):
+    """
+    Fit the linear model of render time to the renders in a manifest.
+
+    Parameters
+    ----------
+    renders : DICT
+        The "renders" of a manifest (see running.read_manifest()). Only
+        entries with the given output_type, a "duration" and "features"
+        are used.
+    output_type : STR, optional
+        The output type flag passed to plantuml.jar.
+        The default is "-tsvg".
+
+    Returns
+    -------
+    coeffs : TUPLE
+        The seconds for starting java and per line, per element and per
+        kB of json. The default coefficients are returned if there are
+        too few renders to fit the model.
+    """
+    samples = []
+    for entry in renders.values():
+        if (
+            entry.get("output_type") != output_type
+            or "duration" not in entry
+            or "features" not in entry
+        ):
+            continue
+        f = entry["features"]
+        scale = _dpi_factor(output_type, entry.get("dpi"))
+        row = [1.0] + [f.get(k, 0) * scale for k in _FEATURES]
+        samples.append((row, entry["duration"]))
+
+    if len(samples) < _MIN_FIT_RENDERS:
+        return _DEFAULT_COEFFS
+
+    # least squares via the normal equations, with a little damping so
+    # that features which never vary do not make the system singular
+    n = len(_FEATURES) + 1
+    ata = [[sum(r[i] * r[j] for r, _ in samples) for j in range(n)] for i in range(n)]
+    atb = [sum(r[i] * t for r, t in samples) for i in range(n)]
+    for i in range(n):
+        ata[i][i] += 1e-6 * (ata[i][i] or 1.0)
+    coeffs = _solve(ata, atb)
+
+    # negative costs make no sense
+    return tuple(max(c, 0.0) for c in coeffs)
+
+
+def _solve(a, b):
+    # Gaussian elimination with partial pivoting
+    n = len(b)
+    m = [a[i][:] + [b[i]] for i in range(n)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        m[col], m[pivot] = m[pivot], m[col]
+        if m[col][col] == 0:
+            continue
+        for r in range(col + 1, n):
+            factor = m[r][col] / m[col][col]
+            for c in range(col, n + 1):
+                m[r][c] -= factor * m[col][c]
+    x = [0.0] * n
+    for r in range(n - 1, -1, -1):
+        if m[r][r] != 0:
+            s = sum(m[r][c] * x[c] for c in range(r + 1, n))
+            x[r] = (m[r][n] - s) / m[r][r]
+    return x
+
+
+def predict_render_cost(
+    features, output_type="-tsvg", output_dpi=None, coeffs=None, history=None
+):
+    """
+    Predict the render time of a plantuml code file.
+
+    Parameters
+    ----------
+    features : DICT
+        The features of the file, from puml_features().
+    output_type : STR, optional
+        The output type flag passed to plantuml.jar.
+        The default is "-tsvg".
+    output_dpi : INT or None, optional
+        The dpi for png output.
+        The default is None.
+    coeffs : TUPLE or None, optional
+        The coefficients of the model, from fit_cost_model(). If None,
+        the default coefficients are used.
+        The default is None.
+    history : DICT or None, optional
+        The manifest entry of a previous render of the same file. If it
+        has the same output type and unchanged features, its duration is
+        used as the prediction.
+        The default is None.
+
+    Returns
+    -------
+    cost : FLOAT
+        The predicted render time in seconds.
+    """
+    if (
+        history
+        and "duration" in history
+        and history.get("output_type") == output_type
+        and history.get("features", features) == features
+    ):
+        return history["duration"] * (
+            _dpi_factor(output_type, output_dpi)
+            / _dpi_factor(output_type, history.get("dpi"))
+        )
+
+    coeffs = coeffs or _DEFAULT_COEFFS
+    scale = _dpi_factor(output_type, output_dpi)
+    return coeffs[0] + scale * sum(
+        coeffs[i + 1] * features.get(k, 0) for i, k in enumerate(_FEATURES)
+    )
+
+
+def predict_render_costs(
+    files, base_path, renders=None, output_type="-tsvg", output_dpi=None
+):
+    """
+    Predict the render times of several plantuml code files.
+
+    Parameters
+    ----------
+    files : LIST
+        List of pathlib.Path pointing to the plantuml code files.
+    base_path : STR or pathlib.Path
+        The folder to which the keys of renders are relative.
+    renders : DICT or None, optional
+        The "renders" of a manifest, used as history and to fit the model.
+        The default is None.
+    output_type : STR, optional
+        The output type flag passed to plantuml.jar.
+        The default is "-tsvg".
+    output_dpi : INT or None, optional
+        The dpi for png output.
+        The default is None.
+
+    Returns
+    -------
+    costs : DICT
+        Dict where the keys are the posix paths of the files relative to
+        base_path and the values are tuples (predicted time in seconds,
+        features).
+    """
+    renders = renders or {}
+    base_path = pathlib.Path(base_path).absolute()
+    coeffs = fit_cost_model(renders, output_type=output_type)
+
+    costs = {}
+    for f in files:
+        key = pathlib.Path(f).absolute().relative_to(base_path).as_posix()
+        features = puml_features(f)
+        costs[key] = (
+            predict_render_cost(
+                features,
+                output_type=output_type,
+                output_dpi=output_dpi,
+                coeffs=coeffs,
+                history=renders.get(key),
+            ),
+            features,
+        )
+    return costs
+
+
+def longest_first(files, costs, base_path):
+    """
+    Order files by decreasing predicted render time.
+
+    Submitting the files to a pool of workers in this order keeps one
+    worker from still running a large diagram after all others have
+    finished, which minimises the total time of the batch.
+
+    Parameters
+    ----------
+    files : LIST
+        List of pathlib.Path pointing to the plantuml code files.
+    costs : DICT
+        The predicted render times, from predict_render_costs().
+    base_path : STR or pathlib.Path
+        The folder to which the keys of costs are relative.
+
+    Returns
+    -------
+    files : LIST
+        The files, longest first. Files with equal costs keep their order.
+    """
+    base_path = pathlib.Path(base_path).absolute()
+
+    def _cost(f):
+        key = pathlib.Path(f).absolute().relative_to(base_path).as_posix()
+        return costs[key][0] if key in costs else 0.0
+
+    return sorted(files, key=_cost, reverse=True)
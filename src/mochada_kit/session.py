@@ -0,0 +1,418 @@
+"""
+Functions to render plantuml code without starting java for every
+diagram. A PlantumlSession keeps one plantuml.jar process running in
+"-pipe" mode, which reads diagrams from its standard input and writes
+the images to its standard output, so that only the first diagram pays
+for starting java. Rendered images are also kept in a cache on disk,
+addressed by a hash of the self-contained code and the render options,
+so that rendering the same diagram again does not run plantuml at all.
+"""  # noqa: D400
+
+import atexit
+import hashlib
+import json
+import os
+import pathlib
+import re
+import subprocess
+import threading
+
+import mochada_kit as mck
+from mochada_kit.config import get_cache_dir, get_puml_path
+from mochada_kit.fileio import write_bytes_atomic, write_text_atomic
+from mochada_kit.inlining import inline_puml_code
+from mochada_kit.running import _plantuml_cmd
+
+_DELIMITER = b"___MOCHADA_KIT_END_OF_IMAGE___"
+_START_RE = re.compile(r"^\s*@start\w+", re.MULTILINE)
+# with -pipeNoStderr, plantuml writes "ERROR", the line number and the
+# message to standard output, next to the image of the error
+_ERROR_RE = re.compile(rb"(?:^|\n)ERROR\r?\n(\d+)\r?\n([^\r\n]*)")
+_EXTENSIONS = {"-tsvg": "svg", "-tpng": "png"}
+
+# sessions shared by render_cached(), one per combination of options
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class PlantumlSession:
+    """
+    A plantuml.jar process which stays running and renders diagrams
+    sent to it one after the other.
+
+    The process is started by the first call to render() and stopped by
+    close(), which is also called when the session is used as a context
+    manager. A session may be shared by several threads, which then
+    take turns.
+
+    Parameters
+    ----------
+    plantuml_path : STR, pathlib.Path or None, optional
+        The full path to the plantuml.jar. If None, the path is taken from
+        the user's config (see running.run_plantuml_code()).
+        The default is None.
+    output_type : STR, optional
+        The output type flag passed to plantuml.jar, "-tsvg" or "-tpng".
+        The default is "-tsvg".
+    output_dpi : INT or None, optional
+        The dpi for png output.
+        The default is None.
+    skinparam_opts : DICT or None, optional
+        Skinparams passed to plantuml.jar (see running.run_plantuml_code()).
+        The default is None.
+
+    Raises
+    ------
+    OSError
+        Raised if plantuml_path was not passed AND is not
+        set in the users' config.json.
+    """
+
+    def __init__(
+        self,
+        plantuml_path=None,
+        output_type="-tsvg",
+        output_dpi=None,
+        skinparam_opts=None,
+    ):
+        self.plantuml_path = plantuml_path or get_puml_path()
+        if not self.plantuml_path:
+            raise OSError(
+                "plantuml_path was not passed and is also not defined "
+                "in the user's .mochada_kit/config.json."
+            )
+        self.output_type = output_type
+        self.output_dpi = output_dpi
+        self.skinparam_opts = skinparam_opts
+        self._process = None
+        self._buffer = b""
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        """Return the session."""
+        return self
+
+    def __exit__(self, *exc):
+        """Stop the plantuml.jar process."""
+        self.close()
+        return False
+
+    def _start(self):
+        cmd = _plantuml_cmd(
+            self.plantuml_path,
+            self.output_type,
+            "-pipe",
+            output_dpi=self.output_dpi,
+            skinparam_opts=self.skinparam_opts,
+        )
+        cmd.extend(["-pipedelimitor", _DELIMITER.decode(), "-pipeNoStderr"])
+        cmd.extend(["-charset", "UTF-8"])
+        self._process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._buffer = b""
+
+    def _read_image(self):
+        # read up to and including the next delimiter line
+        while True:
+            end = self._buffer.find(_DELIMITER)
+            if end >= 0:
+                # the line break after the previous delimiter may only
+                # arrive with this image; a png never starts with one
+                image = self._buffer[:end].lstrip(b"\r\n")
+                self._buffer = self._buffer[end + len(_DELIMITER) :]
+                return image.rstrip(b"\r\n") if self.output_type == "-tsvg" else image
+            chunk = os.read(self._process.stdout.fileno(), 65536)
+            if not chunk:
+                raise RuntimeError("plantuml.jar stopped while rendering a diagram.")
+            self._buffer += chunk
+
+    def render(self, code):
+        """
+        Render plantuml code.
+
+        Parameters
+        ----------
+        code : STR
+            The plantuml code, containing one or more diagrams, each
+            starting with "@start..." and ending with "@end...". Files
+            are included relative to the current working directory, so
+            self-contained code (see inlining.inline_puml_code()) is best.
+
+        Returns
+        -------
+        images : LIST
+            List of the images as bytes, one per diagram.
+
+        Raises
+        ------
+        ValueError
+            Raised if code contains no diagram or plantuml reports an
+            error in a diagram.
+        RuntimeError
+            Raised if plantuml.jar stops unexpectedly.
+        """
+        n_diagrams = len(_START_RE.findall(code))
+        if not n_diagrams:
+            raise ValueError("The plantuml code does not contain any diagram.")
+
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                self._start()
+            # plantuml writes the image of each diagram while it is still
+            # reading the next ones, so the code is written by another
+            # thread; otherwise both processes could block on full pipes
+            errors = []
+            writer = threading.Thread(
+                target=_write_input,
+                args=(self._process.stdin, code.encode("utf-8") + b"\n", errors),
+                daemon=True,
+            )
+            writer.start()
+            try:
+                images = [self._read_image() for _ in range(n_diagrams)]
+            except (OSError, RuntimeError):
+                # kill the process first, so that the writer is not left
+                # blocked; the next render() starts a new process
+                self._process.kill()
+                writer.join()
+                self.close()
+                raise
+            writer.join()
+            if errors:
+                self.close()
+                raise errors[0]
+
+        for image in images:
+            if m := _ERROR_RE.search(image):
+                line, message = (
+                    g.decode("utf-8", errors="replace") for g in m.groups()
+                )
+                raise ValueError(
+                    f"plantuml reported an error at line {line}: {message}"
+                )
+        return images
+
+    def close(self):
+        """Stop the plantuml.jar process, if it is running."""
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+            process.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+        finally:
+            process.stdout.close()
+
+
+def _write_input(stdin, data, errors):
+    # write the code to plantuml, keeping any error for render()
+    try:
+        stdin.write(data)
+        stdin.flush()
+    except OSError as e:
+        errors.append(e)
+
+
+def get_session(
+    plantuml_path=None, output_type="-tsvg", output_dpi=None, skinparam_opts=None
+):
+    """
+    Get a PlantumlSession shared by all callers using the same options.
+
+    The sessions are closed when Python exits.
+
+    Parameters
+    ----------
+    plantuml_path : STR, pathlib.Path or None, optional
+        See PlantumlSession.
+        The default is None.
+    output_type : STR, optional
+        See PlantumlSession.
+        The default is "-tsvg".
+    output_dpi : INT or None, optional
+        See PlantumlSession.
+        The default is None.
+    skinparam_opts : DICT or None, optional
+        See PlantumlSession.
+        The default is None.
+
+    Returns
+    -------
+    session : PlantumlSession
+        The shared session.
+    """
+    plantuml_path = plantuml_path or get_puml_path()
+    key = (
+        str(plantuml_path),
+        output_type,
+        output_dpi,
+        tuple(sorted((skinparam_opts or {}).items())),
+    )
+    with _sessions_lock:
+        if key not in _sessions:
+            _sessions[key] = PlantumlSession(
+                plantuml_path,
+                output_type=output_type,
+                output_dpi=output_dpi,
+                skinparam_opts=skinparam_opts,
+            )
+        return _sessions[key]
+
+
+@atexit.register
+def close_sessions():
+    """Stop the plantuml.jar processes of all shared sessions."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def render_key(
+    code, plantuml_path=None, output_type="-tsvg", output_dpi=None, skinparam_opts=None
+):
+    """
+    Compute the key under which the images of plantuml code are cached.
+
+    The key changes with the code, the render options, the version of
+    mochada_kit and the plantuml.jar file.
+
+    Parameters
+    ----------
+    code : STR
+        The self-contained plantuml code.
+    plantuml_path : STR, pathlib.Path or None, optional
+        The full path to the plantuml.jar, or None to use the user's
+        config.
+        The default is None.
+    output_type : STR, optional
+        The output type flag passed to plantuml.jar.
+        The default is "-tsvg".
+    output_dpi : INT or None, optional
+        The dpi for png output.
+        The default is None.
+    skinparam_opts : DICT or None, optional
+        Skinparams passed to plantuml.jar.
+        The default is None.
+
+    Returns
+    -------
+    key : STR
+        The sha256 hex digest.
+    """
+    jar = pathlib.Path(plantuml_path or get_puml_path() or "")
+    try:
+        stat = jar.stat()
+        jar_id = [str(jar.absolute()), stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        jar_id = [str(jar)]
+    options = {
+        "mochada_kit": mck.__version__,
+        "plantuml": jar_id,
+        "output_type": output_type,
+        "dpi": output_dpi,
+        "skinparams": skinparam_opts or {},
+    }
+    h = hashlib.sha256(json.dumps(options, sort_keys=True).encode("utf-8"))
+    h.update(code.encode("utf-8"))
+    return h.hexdigest()
+
+
+def render_cached(
+    code,
+    base_dir=None,
+    plantuml_path=None,
+    output_type="-tsvg",
+    output_dpi=None,
+    skinparam_opts=None,
+    cache_dir=None,
+):
+    """
+    Render plantuml code through a shared session and the render cache.
+
+    Themes, included files and json data are first written into the code
+    (see inlining.inline_puml_code()), so a change in any of them changes
+    the cache key. Images found in the cache are returned without running
+    plantuml.jar; others are rendered with the shared session (see
+    get_session()) and stored in the cache.
+
+    Parameters
+    ----------
+    code : STR
+        The plantuml code.
+    base_dir : STR, pathlib.Path or None, optional
+        The folder to which relative paths in the code refer. If None,
+        the current working directory is used.
+        The default is None.
+    plantuml_path : STR, pathlib.Path or None, optional
+        The full path to the plantuml.jar, or None to use the user's
+        config.
+        The default is None.
+    output_type : STR, optional
+        The output type flag passed to plantuml.jar, "-tsvg" or "-tpng".
+        The default is "-tsvg".
+    output_dpi : INT or None, optional
+        The dpi for png output.
+        The default is None.
+    skinparam_opts : DICT or None, optional
+        Skinparams passed to plantuml.jar.
+        The default is None.
+    cache_dir : STR, pathlib.Path or None, optional
+        The folder of the cache. If None, config.get_cache_dir() is used.
+        The default is None.
+
+    Returns
+    -------
+    images : LIST
+        List of the images as bytes, one per diagram in the code.
+
+    Raises
+    ------
+    ValueError
+        Raised if output_type is not supported, or see
+        PlantumlSession.render().
+    """
+    if output_type not in _EXTENSIONS:
+        raise ValueError(f"output_type must be one of {list(_EXTENSIONS)}.")
+
+    code = inline_puml_code(code, base_dir=base_dir, inline_json=True)
+    key = render_key(
+        code,
+        plantuml_path=plantuml_path,
+        output_type=output_type,
+        output_dpi=output_dpi,
+        skinparam_opts=skinparam_opts,
+    )
+    cache_dir = pathlib.Path(cache_dir or get_cache_dir()).joinpath(key[:2])
+    index_path = cache_dir.joinpath(f"{key}.json")
+
+    # the index is written last, so if it exists all images exist
+    try:
+        names = json.loads(index_path.read_text(encoding="utf-8"))
+        return [cache_dir.joinpath(n).read_bytes() for n in names]
+    except (OSError, ValueError):
+        pass
+
+    session = get_session(
+        plantuml_path,
+        output_type=output_type,
+        output_dpi=output_dpi,
+        skinparam_opts=skinparam_opts,
+    )
+    images = session.render(code)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    names = []
+    for i, image in enumerate(images):
+        name = f"{key}_{i}.{_EXTENSIONS[output_type]}"
+        write_bytes_atomic(cache_dir.joinpath(name), image)
+        names.append(name)
+    write_text_atomic(index_path, json.dumps(names))
+    return images
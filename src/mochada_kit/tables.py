@@ -10,13 +10,50 @@ formatting must be applied using the CREOLE or html syntax for plantuml
 shown here: https://plantuml.com/creole
 """  # noqa: D400
 
+import functools
+import io
 import json
+import logging
 import pathlib
-import shutil
+import re
 
 import yaml
 
 from mochada_kit import _THEMES_DIR
+from mochada_kit.config import get_theme_store_dir
+from mochada_kit.fileio import copy_file_atomic, file_lock, write_text_if_changed
+from mochada_kit.themestore import place_theme
+from mochada_kit.validation import check_chada
+
+# the safe loader only constructs plain python objects, and is much
+# faster if PyYAML was built with libyaml
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+_logger = logging.getLogger(__name__)
+
+# the sections of the CHADA tables with their titles and names
+_SECTION_TITLES = {
+    "overview": "Overview",
+    "user_case": "1. User Case",
+    "experiment": "2. Experiment",
+    "raw_data": "3. Raw Data",
+    "data_processing": "4. Data Processing",
+}
+_SECTION_NAMES = {
+    "overview": "Overview",
+    "user_case": "User Case",
+    "experiment": "Experiment",
+    "raw_data": "Raw Data",
+    "data_processing": "Data Processing",
+}
+
+# streams of CHADA records: one json object per line, or yaml documents
+# separated by "---"
+_STREAM_TYPES = {".jsonl": "jsonl", ".ndjson": "jsonl", ".yaml": "yaml", ".yml": "yaml"}
+_UNSAFE_NAME_RE = re.compile(r"[^\w.-]+")
 
 
 def get_lines_from_keys(keys):
@@ -93,6 +130,7 @@ def write_chada_tables_plantuml(
     copy_theme_to_local=False,
     linked=True,
     scale=None,
+    single_file=False,
 ):
     """
     Write a plantuml code file specifying a json diagram for each of
@@ -197,12 +235,36 @@ def write_chada_tables_plantuml(
         - "1/3" (to set the aspect ratio)
         - "1024 width" (to set the width to 1024 pixels)
         - "100*200" (to set the output size to 100 by 200 pixels).
+    single_file : BOOL, optional
+        If True, write all five diagrams to one puml code file, named like
+        the json plus _tables.puml, as consecutive blocks. Each block is
+        named after the file it would otherwise be written to (e.g.
+        "@startjson my_tables_overview"), so that one run of plantuml.jar
+        produces the same images (e.g. my_tables_overview.svg) as running
+        the five separate files.
+        The default is False.
+
+    Returns
+    -------
+    changed : DICT
+        Dict where the keys are the pathlib.Path of the puml code files
+        and the values are True if the file was written, or False if it
+        already had the same content and was left unchanged (keeping its
+        modification time, so that it need not be rendered again).
+
+    Raises
+    ------
+    ValueError
+        Raised if the data does not have the structure of CHADA tables
+        (see validation.validate_chada()), unless it is loaded by plantuml
+        (load_path).
     """
-    t_d, out_base, top, bottom = handle_paths(
-        data_path,
-        out_path=out_path,
-        load_path=load_path,
-        out_name=out_name,
+    data_path, data_type, output_path, j_name, out_base = _resolve_paths(
+        data_path, out_path=out_path, load_path=load_path, out_name=out_name
+    )
+    top, bottom = _top_and_bottom(
+        output_path,
+        j_name,
         title=title,
         theme_name=theme_name,
         copy_theme_to_local=copy_theme_to_local,
@@ -211,46 +273,31 @@ def write_chada_tables_plantuml(
 
     if linked:
         keys = [
-            f'"[[{data_path.stem}_overview.svg{{View Overview table}} Overview]]"',
-            (
-                f'"[[{data_path.stem}_user_case.svg{{View User Case table}}'
-                ' 1. User Case]]"'
-            ),
-            (
-                f'"[[{data_path.stem}_experiment.svg{{View Experiment table}}'
-                ' 2. Experiment]]"'
-            ),
-            f'"[[{data_path.stem}_raw_data.svg{{View Raw Data table}} 3. Raw Data]]"',
-            (
-                f'"[[{data_path.stem}_data_processing.svg{{View Data Processing table}}'
-                ' 4. Data Processing]]"'
-            ),
+            f'"[[{data_path.stem}_{s}.svg{{View {_SECTION_NAMES[s]} table}} {t}]]"'
+            for s, t in _SECTION_TITLES.items()
         ]
     else:
-        keys = [
-            '"Overview"',
-            '"1. User Case"',
-            '"2. Experiment"',
-            '"3. Raw Data"',
-            '"4. Data Processing"',
-        ]
-
-    highlights, single_HL, mid = get_lines_from_keys(keys)
+        keys = [f'"{t}"' for t in _SECTION_TITLES.values()]
 
-    for i, j in enumerate(single_HL):
-        mid_n = list(mid)
+    highlights, single_HL, _ = get_lines_from_keys(keys)
+    values = _section_values(data_path, data_type, load_path, "    ")
 
-        if load_path:
-            mid_n[i + 1] = mid_n[i + 1].split(": ")[0] + f": $DATA.{j},"
-        else:
-            q = json.dumps(t_d[j], indent="    ", ensure_ascii=False)
-            mid_n[i + 1] = mid_n[i + 1].split(": ")[0] + f": {q},"
+    codes = {
+        f"{out_base.name}_{j}": _assemble(
+            top, highlights, [single_HL[j]], _contents(keys, values, (j,)), bottom
+        )
+        for j in _SECTION_TITLES
+    }
 
-        if i == 4:
-            mid_n[i + 1] = mid_n[i + 1][:-1]
+    if single_file:
+        path = pathlib.Path(str(out_base) + "_tables.puml")
+        return {path: write_text_if_changed(path, _combine(codes))}
 
-        t_a = "\n".join(top + highlights + [single_HL[j]] + mid_n + bottom)
-        pathlib.Path(str(out_base) + f"_{j}.puml").write_text(t_a)
+    changed = {}
+    for name, t_a in codes.items():
+        path = out_base.parent.joinpath(f"{name}.puml")
+        changed[path] = write_text_if_changed(path, t_a)
+    return changed
 
 
 def write_chada_tables_whole_plantuml(
@@ -339,40 +386,47 @@ def write_chada_tables_whole_plantuml(
         - "1/3" (to set the aspect ratio)
         - "1024 width" (to set the width to 1024 pixels)
         - "100*200" (to set the output size to 100 by 200 pixels).
+
+    Returns
+    -------
+    changed : DICT
+        Dict where the keys are the pathlib.Path of the puml code files
+        and the values are True if the file was written, or False if it
+        already had the same content and was left unchanged (keeping its
+        modification time, so that it need not be rendered again).
+
+    Raises
+    ------
+    ValueError
+        Raised if the data does not have the structure of CHADA tables
+        (see validation.validate_chada()), unless it is loaded by plantuml
+        (load_path).
     """
-    t_d, out_base, top, bottom = handle_paths(
-        data_path,
-        out_path=out_path,
-        load_path=load_path,
-        out_name=out_name,
+    data_path, data_type, output_path, j_name, out_base = _resolve_paths(
+        data_path, out_path=out_path, load_path=load_path, out_name=out_name
+    )
+    top, bottom = _top_and_bottom(
+        output_path,
+        j_name,
         title=title,
         theme_name=theme_name,
         copy_theme_to_local=copy_theme_to_local,
         scale=scale,
     )
 
-    keys = [
-        '"Overview"',
-        '"1. User Case"',
-        '"2. Experiment"',
-        '"3. Raw Data"',
-        '"4. Data Processing"',
-    ]
-
-    highlights, single_HL, mid = get_lines_from_keys(keys)
-
-    for i, j in enumerate(single_HL):
-        if load_path:
-            mid[i + 1] = mid[i + 1].split(": ")[0] + f": $DATA.{j},"
-        else:
-            q = json.dumps(t_d[j], indent="    ", ensure_ascii=False)
-            mid[i + 1] = mid[i + 1].split(": ")[0] + f": {q},"
+    keys = [f'"{t}"' for t in _SECTION_TITLES.values()]
+    highlights, single_HL, _ = get_lines_from_keys(keys)
+    values = _section_values(data_path, data_type, load_path, "    ")
 
-        if i == 4:
-            mid[i + 1] = mid[i + 1][:-1]
-
-    t_a = "\n".join(top + highlights + list(single_HL.values()) + mid + bottom)
-    pathlib.Path(str(out_base) + ".puml").write_text(t_a)
+    t_a = _assemble(
+        top,
+        highlights,
+        single_HL.values(),
+        _contents(keys, values, _SECTION_TITLES),
+        bottom,
+    )
+    path = pathlib.Path(str(out_base) + ".puml")
+    return {path: write_text_if_changed(path, t_a)}
 
 
 def write_chada_tables_single_plantuml(
@@ -476,35 +530,594 @@ def write_chada_tables_single_plantuml(
         - "1/3" (to set the aspect ratio)
         - "1024 width" (to set the width to 1024 pixels)
         - "100*200" (to set the output size to 100 by 200 pixels).
+
+    Returns
+    -------
+    changed : DICT
+        Dict where the keys are the pathlib.Path of the puml code files
+        and the values are True if the file was written, or False if it
+        already had the same content and was left unchanged (keeping its
+        modification time, so that it need not be rendered again).
+
+    Raises
+    ------
+    ValueError
+        Raised if the data does not have the structure of CHADA tables
+        (see validation.validate_chada()), unless it is loaded by plantuml
+        (load_path).
     """
-    t_d, out_base, top, bottom = handle_paths(
-        data_path,
-        out_path=out_path,
-        load_path=load_path,
-        out_name=out_name,
+    data_path, data_type, output_path, j_name, out_base = _resolve_paths(
+        data_path, out_path=out_path, load_path=load_path, out_name=out_name
+    )
+    top, bottom = _top_and_bottom(
+        output_path,
+        j_name,
         title=title,
         theme_name=theme_name,
         copy_theme_to_local=copy_theme_to_local,
         scale=scale,
     )
 
-    highlights = {
-        "overview": '#highlight "Overview" <<overview>>',
-        "user_case": '#highlight "1. User Case" <<user_case>>',
-        "experiment": '#highlight "2. Experiment" <<experiment>>',
-        "raw_data": '#highlight "3. Raw Data" <<raw_data>>',
-        "data_processing": '#highlight "4. Data Processing" <<data_processing>>',
+    values = _section_values(data_path, data_type, load_path, "  ")
+
+    changed = {}
+    for i, j in _SECTION_TITLES.items():
+        t_a = _assemble(top, [f'#highlight "{j}" <<{i}>>', values[i]], bottom)
+        path = pathlib.Path(str(out_base) + f"_{i}.puml")
+        changed[path] = write_text_if_changed(path, t_a)
+    return changed
+
+
+def _contents(keys, values, shown):
+    # the lines of the "contents" element, where the sections in "shown"
+    # have their values and all other sections are empty
+    lines = ["{"]
+    for i, s in enumerate(_SECTION_TITLES):
+        value = values[s] if s in shown else '" "'
+        comma = "," if i < len(_SECTION_TITLES) - 1 else ""
+        lines.append(f"  {keys[i]} : {value}{comma}")
+    lines.append("}")
+    return lines
+
+
+def _assemble(*blocks):
+    # join blocks of lines into the puml code in a single buffer
+    buffer = io.StringIO()
+    first = True
+    for block in blocks:
+        for line in block:
+            if not first:
+                buffer.write("\n")
+            buffer.write(line)
+            first = False
+    return buffer.getvalue()
+
+
+def _combine(codes):
+    # join several diagrams into one puml code file, naming each block so
+    # that plantuml names its image after the key instead of numbering it
+    return "\n\n".join(
+        re.sub(r"^(@start\w+)", rf"\1 {name}", code, count=1)
+        for name, code in codes.items()
+    )
+
+
+def _section_values(data_path, data_type, load_path, indent):
+    # the code for the value of each section: a reference to the
+    # dynamically loaded json, or the serialised json of the section
+    if load_path:
+        return {s: f"$DATA.{s}" for s in _SECTION_TITLES}
+    data_path = data_path.absolute()
+    return _serialised_sections(
+        data_path, data_path.stat().st_mtime_ns, data_type, indent
+    )
+
+
+@functools.lru_cache(maxsize=64)
+def _serialised_sections(data_path, mtime_ns, data_type, indent):
+    # mtime_ns is part of the cache key, so that a modified file is
+    # read again; the returned dict is shared and must not be modified
+    t_d = _load_data(data_path, data_type)
+    check_chada(t_d, data_path)
+    return {
+        s: json.dumps(t_d[s], indent=indent, ensure_ascii=False)
+        for s in _SECTION_TITLES
     }
 
-    for i, j in highlights.items():
-        if load_path:
-            mid_n = [f"$DATA.{i}"]
+
+class ChadaDocument:
+    """
+    The data of a single json or yaml file of CHADA tables, from which
+    the plantuml code of all table diagrams can be generated.
+
+    The file is read and checked once, when the ChadaDocument is
+    created, and the json of each section is serialised at most once
+    for each indent used, so that all diagrams are produced from the same
+    data without reading the file again. The diagrams are those of
+    write_chada_tables_plantuml() (five "linked" diagrams),
+    write_chada_tables_whole_plantuml() (one "whole" diagram) and
+    write_chada_tables_single_plantuml() (five "single" diagrams).
+
+    Parameters
+    ----------
+    data_path : STR or pathlib.Path
+        Absolute path or path relative to the current working directory
+        pointing to a json or yaml file containing the CHADA data.
+        If data_path points to a json file, the format of the file must be
+        based on mochada_kit/templates/chada_tables_template.json.
+        If data_path points to a yaml file, the format of the file must be
+        based on mochada_kit/templates/chada_tables_template.yaml.
+    out_path : STR, pathlib.Path or None, optional
+        The folder where the plantuml code files will be saved, see
+        handle_paths().
+        The default is None.
+    load_path : STR, pathlib.Path or None, optional
+        If not None, the json data is loaded dynamically by plantuml
+        instead of being written into the puml code, see handle_paths().
+        The default is None.
+    out_name : STR or None, optional
+        The start of the filenames of the puml code. If None, the stem of
+        data_path is used.
+        The default is None.
+    title : STR, LIST or None, optional
+        A title for the diagrams, see handle_paths().
+        The default is None.
+    theme_name : STR, optional
+        The part of the name of a bespoke MOCHADA theme after "MOCHADA-".
+        This can be overridden for each kind of diagram.
+        The default is 'plasma'.
+    copy_theme_to_local : BOOL, optional
+        If True, copy the theme(s) to a "themes" folder in the output
+        folder, see handle_paths().
+        The default is False.
+    scale : STR, INT or FLOAT, optional
+        A parameter which helps to scale the diagram for png output, see
+        handle_paths().
+        The default is None.
+    data : DICT or None, optional
+        The CHADA data, if it has already been read, e.g. a record of a
+        stream (see iter_chada_records()). data_path is then not read, but
+        still determines the output folder and, unless out_name is given,
+        the filenames, and load_path is ignored.
+        The default is None.
+
+    Raises
+    ------
+    ValueError
+        Raised if the data does not have the structure of CHADA tables,
+        listing all errors (see validation.validate_chada()).
+    """
+
+    sections = tuple(_SECTION_TITLES)
+
+    def __init__(
+        self,
+        data_path,
+        out_path=None,
+        load_path=None,
+        out_name=None,
+        title=None,
+        theme_name="plasma",
+        copy_theme_to_local=False,
+        scale=None,
+        data=None,
+    ):
+        if data is not None:
+            load_path = None
+        (
+            self.data_path,
+            self.data_type,
+            self.output_path,
+            self.j_name,
+            self.out_base,
+        ) = _resolve_paths(
+            data_path, out_path=out_path, load_path=load_path, out_name=out_name
+        )
+        self.title = title
+        self.theme_name = theme_name
+        self.copy_theme_to_local = copy_theme_to_local
+        self.scale = scale
+
+        if data is None:
+            data = _load_data(self.data_path, self.data_type)
+        self.data = data
+        check_chada(self.data, self.data_path)
+
+        self._serialised = {}
+        self._frames = {}
+
+    def section_code(self, section, indent):
+        """
+        Return the code for the value of one section of the json diagram.
+
+        Parameters
+        ----------
+        section : STR
+            One of ChadaDocument.sections, e.g. "experiment".
+        indent : STR
+            The indent of the serialised json.
+
+        Returns
+        -------
+        code : STR
+            The serialised json of the section, or a reference to the
+            dynamically loaded json data.
+        """
+        if self.j_name:
+            return f"$DATA.{section}"
+        key = (section, indent)
+        if key not in self._serialised:
+            self._serialised[key] = json.dumps(
+                self.data[section], indent=indent, ensure_ascii=False
+            )
+        return self._serialised[key]
+
+    def _frame(self, theme_name):
+        # the top and bottom lines, once per theme
+        theme_name = theme_name or self.theme_name
+        if theme_name not in self._frames:
+            self._frames[theme_name] = _top_and_bottom(
+                self.output_path,
+                self.j_name,
+                title=self.title,
+                theme_name=theme_name,
+                copy_theme_to_local=self.copy_theme_to_local,
+                scale=self.scale,
+            )
+        return self._frames[theme_name]
+
+    def _contents(self, keys, shown):
+        # the "contents" element with the sections in "shown" joined to it
+        values = {s: self.section_code(s, "    ") for s in shown}
+        return _contents(keys, values, shown)
+
+    def _contents_keys(self, linked):
+        # the keys of the "contents" element, with or without hyperlinks
+        # to the images of the linked diagrams
+        if not linked:
+            return list(_SECTION_TITLES.values())
+        stem = self.out_base.name
+        return [
+            f"[[{stem}_{s}.svg{{View {_SECTION_NAMES[s]} table}} {t}]]"
+            for s, t in _SECTION_TITLES.items()
+        ]
+
+    def linked_puml(self, linked=True, theme_name=None):
+        """
+        Generate the plantuml code of write_chada_tables_plantuml().
+
+        Parameters
+        ----------
+        linked : BOOL, optional
+            If True, add hyperlinks to the svg images of the other diagrams
+            to the "contents" element. The images are expected to have the
+            names of the puml code files written by write_all().
+            The default is True.
+        theme_name : STR or None, optional
+            The theme, if it differs from the theme of the document.
+            The default is None.
+
+        Returns
+        -------
+        code : DICT
+            Dict where the keys are the sections and the values are the
+            plantuml code of the diagram showing the contents and that
+            section.
+        """
+        keys = [f'"{k}"' for k in self._contents_keys(linked)]
+        highlights, single_HL, _ = get_lines_from_keys(keys)
+        top, bottom = self._frame(theme_name)
+
+        return {
+            s: _assemble(
+                top, highlights, [single_HL[s]], self._contents(keys, (s,)), bottom
+            )
+            for s in self.sections
+        }
+
+    def whole_puml(self, theme_name=None):
+        """
+        Generate the plantuml code of write_chada_tables_whole_plantuml().
+
+        Parameters
+        ----------
+        theme_name : STR or None, optional
+            The theme, if it differs from the theme of the document.
+            The default is None.
+
+        Returns
+        -------
+        code : STR
+            The plantuml code of the diagram showing the contents and all
+            sections.
+        """
+        keys = [f'"{t}"' for t in _SECTION_TITLES.values()]
+        highlights, single_HL, _ = get_lines_from_keys(keys)
+        top, bottom = self._frame(theme_name)
+        contents = self._contents(keys, self.sections)
+        return _assemble(top, highlights, single_HL.values(), contents, bottom)
+
+    def single_puml(self, theme_name=None):
+        """
+        Generate the plantuml code of write_chada_tables_single_plantuml().
+
+        Parameters
+        ----------
+        theme_name : STR or None, optional
+            The theme, if it differs from the theme of the document.
+            The default is None.
+
+        Returns
+        -------
+        code : DICT
+            Dict where the keys are the sections and the values are the
+            plantuml code of the diagram showing only that section.
+        """
+        top, bottom = self._frame(theme_name)
+        return {
+            s: _assemble(
+                top, [f'#highlight "{t}" <<{s}>>', self.section_code(s, "  ")], bottom
+            )
+            for s, t in _SECTION_TITLES.items()
+        }
+
+    def puml_variants(self, linked=True, theme_names=None):
+        """
+        Generate the plantuml code of all eleven diagrams.
+
+        Parameters
+        ----------
+        linked : BOOL, optional
+            See linked_puml().
+            The default is True.
+        theme_names : DICT or None, optional
+            Dict which may set the theme of the diagrams of each kind, with
+            the keys "linked", "whole" and "single", e.g.
+            {"whole": "plasma_wide", "single": "plasma_A4w"}. Other diagrams
+            use the theme of the document.
+            The default is None.
+
+        Returns
+        -------
+        code : DICT
+            Dict where the keys are the filenames of the puml code and the
+            values are the plantuml code. The filenames start with the stem
+            of the output (out_name, or the stem of data_path), followed by
+            "_<section>.puml" for the linked diagrams, "_all.puml" for the
+            whole diagram and "_single_<section>.puml" for the single
+            diagrams.
+        """
+        theme_names = theme_names or {}
+        stem = self.out_base.name
+
+        variants = {}
+        for s, code in self.linked_puml(linked, theme_names.get("linked")).items():
+            variants[f"{stem}_{s}.puml"] = code
+        variants[f"{stem}_all.puml"] = self.whole_puml(theme_names.get("whole"))
+        for s, code in self.single_puml(theme_names.get("single")).items():
+            variants[f"{stem}_single_{s}.puml"] = code
+        return variants
+
+    def write_all(self, linked=True, theme_names=None):
+        """
+        Write the plantuml code files of all eleven diagrams to the output
+        folder. Files which already have the same content are not
+        rewritten, so that they keep their modification time.
+
+        Parameters
+        ----------
+        linked : BOOL, optional
+            See linked_puml().
+            The default is True.
+        theme_names : DICT or None, optional
+            See puml_variants().
+            The default is None.
+
+        Returns
+        -------
+        changed : DICT
+            Dict where the keys are the pathlib.Path of the puml code files
+            and the values are True if the file was written, or False if it
+            already had the same content and was left unchanged.
+        """
+        changed = {}
+        for name, code in self.puml_variants(linked, theme_names).items():
+            path = self.output_path.joinpath(name)
+            changed[path] = write_text_if_changed(path, code)
+        return changed
+
+    def write_combined(self, linked=True, theme_names=None, kinds=None):
+        """
+        Write the plantuml code of several diagrams to one file, so that
+        they are produced by a single run of plantuml.jar.
+
+        Each diagram is a block of the file named after the file it is
+        written to by write_all() (e.g. "@startjson my_tables_overview"),
+        so plantuml.jar names the images in the same way as for those files
+        (e.g. my_tables_overview.svg) and the hyperlinks between them work.
+
+        Parameters
+        ----------
+        linked : BOOL, optional
+            See linked_puml().
+            The default is True.
+        theme_names : DICT or None, optional
+            See puml_variants().
+            The default is None.
+        kinds : LIST or None, optional
+            The kinds of diagrams to include: any of "linked", "whole" and
+            "single". If None, all eleven diagrams are included.
+            The default is None.
+
+        Returns
+        -------
+        changed : DICT
+            Dict where the key is the pathlib.Path of the puml code file,
+            named like the output plus _tables.puml, and the value is True
+            if the file was written, or False if it was left unchanged.
+        """
+        kinds = kinds or ("linked", "whole", "single")
+        stem = self.out_base.name
+        names = {
+            "linked": [f"{stem}_{s}.puml" for s in self.sections],
+            "whole": [f"{stem}_all.puml"],
+            "single": [f"{stem}_single_{s}.puml" for s in self.sections],
+        }
+        wanted = [name for kind in kinds for name in names[kind]]
+        variants = self.puml_variants(linked, theme_names)
+        codes = {name[: -len(".puml")]: variants[name] for name in wanted}
+
+        path = self.output_path.joinpath(f"{stem}_tables.puml")
+        return {path: write_text_if_changed(path, _combine(codes))}
+
+
+def iter_chada_records(stream_path):
+    """
+    Read the CHADA records of a stream one at a time.
+
+    The stream is either a JSON Lines file (".jsonl" or ".ndjson"), with
+    one json object per line, or a yaml file (".yaml" or ".yml") with
+    one or more documents separated by "---". Each record has the same
+    format as a json or yaml file of CHADA tables. The records are read
+    lazily, so the memory used does not grow with the size of the stream.
+
+    Parameters
+    ----------
+    stream_path : STR or pathlib.Path
+        The JSON Lines or yaml file.
+
+    Yields
+    ------
+    record : DICT
+        The data of each record, in the order of the stream. Empty lines
+        and empty yaml documents are skipped.
+
+    Raises
+    ------
+    ValueError
+        Raised if the file type is not supported, or a line of a JSON
+        Lines file is not valid json.
+    """
+    stream_path = pathlib.Path(stream_path)
+    stream_type = _STREAM_TYPES.get(stream_path.suffix.lower())
+    if stream_type is None:
+        raise ValueError(
+            f"{stream_path} is not a stream of CHADA records; the file type "
+            f"must be one of {', '.join(_STREAM_TYPES)}."
+        )
+    with open(stream_path, encoding="utf-8") as f:
+        if stream_type == "jsonl":
+            for n, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"{stream_path}, line {n}: {e}") from e
         else:
-            q = json.dumps(t_d[i], indent="  ", ensure_ascii=False)
-            mid_n = [f"{q}"]
+            for record in yaml.load_all(f, Loader=_YamlLoader):
+                if record is not None:
+                    yield record
+
+
+def _record_name(record, name_field, index, stem):
+    # the stem of the output files of a record: the value of name_field
+    # (a key, or keys joined by "." for a nested field), made safe for
+    # filenames, or the stem of the stream and the number of the record
+    if name_field is None:
+        return f"{stem}_{index:05d}"
+    value = record
+    for key in name_field.split("."):
+        if not isinstance(value, dict) or key not in value:
+            raise ValueError(f"Record {index} has no field {name_field}.")
+        value = value[key]
+    name = _UNSAFE_NAME_RE.sub("_", str(value)).strip("._")
+    if not name:
+        raise ValueError(f"Record {index} has an empty {name_field}.")
+    return name
+
+
+def write_chada_stream(
+    stream_path,
+    out_path=None,
+    name_field=None,
+    linked=True,
+    single_file=False,
+    theme_names=None,
+    **kwargs,
+):
+    """
+    Write the plantuml code of the CHADA table diagrams of every record
+    of a stream (see iter_chada_records()), one record at a time.
 
-        t_a = "\n".join(top + [j] + mid_n + bottom)
-        pathlib.Path(str(out_base) + f"_{i}.puml").write_text(t_a)
+    This is a generator: the records are read, converted and written as
+    the results are consumed, e.g. by a for loop or list(), so the memory
+    used does not depend on the number of records.
+
+    Parameters
+    ----------
+    stream_path : STR or pathlib.Path
+        The JSON Lines or yaml file.
+    out_path : STR, pathlib.Path or None, optional
+        The folder where the plantuml code files will be saved, see
+        handle_paths(). If None, the folder containing stream_path is
+        used.
+        The default is None.
+    name_field : STR or None, optional
+        The field of each record whose value is the start of the filenames
+        of its puml code, e.g. "id" or "overview.id" for a field nested in
+        a section. Characters other than letters, digits, ".", "-" and "_"
+        are replaced by "_". If None, the records are named after the
+        stream and their number, e.g. "export_00001".
+        The default is None.
+    linked : BOOL, optional
+        See ChadaDocument.linked_puml().
+        The default is True.
+    single_file : BOOL, optional
+        If True, write the diagrams of each record to one puml code file,
+        see ChadaDocument.write_combined().
+        The default is False.
+    theme_names : DICT or None, optional
+        See ChadaDocument.puml_variants().
+        The default is None.
+    **kwargs
+        Further arguments of ChadaDocument: title, theme_name,
+        copy_theme_to_local and scale.
+
+    Yields
+    ------
+    name : STR
+        The name of the record.
+    changed : DICT
+        The puml code files of the record, see ChadaDocument.write_all().
+
+    Raises
+    ------
+    ValueError
+        Raised if a record does not contain CHADA tables, or has no (or
+        the same) name_field as an earlier record.
+    """
+    stream_path = pathlib.Path(stream_path).absolute()
+    names = set()
+    # the records share the output folder and options, so the top and
+    # bottom lines are made (and the theme copied) once
+    frames = {}
+    for index, record in enumerate(iter_chada_records(stream_path), 1):
+        name = _record_name(record, name_field, index, stream_path.stem)
+        if name in names:
+            raise ValueError(f"Record {index} has the same name as another: {name}.")
+        names.add(name)
+        try:
+            doc = ChadaDocument(
+                stream_path, out_path=out_path, out_name=name, data=record, **kwargs
+            )
+        except ValueError as e:
+            raise ValueError(f"Record {index} ({name}): {e}") from e
+        doc._frames = frames
+        if single_file:
+            yield name, doc.write_combined(linked=linked, theme_names=theme_names)
+        else:
+            yield name, doc.write_all(linked=linked, theme_names=theme_names)
 
 
 def handle_paths(
@@ -605,6 +1218,28 @@ def handle_paths(
     bottom : LIST
         List of strings to be written at the bottom of the puml code.
     """
+    data_path, data_type, output_path, j_name, out_base = _resolve_paths(
+        data_path, out_path=out_path, load_path=load_path, out_name=out_name
+    )
+
+    if return_out_base_only:
+        return out_base
+
+    themes_dir = _themes_dir(output_path, theme_name, copy_theme_to_local)
+    top, bottom = _frame_lines(themes_dir, j_name, _title_key(title), theme_name, scale)
+    top, bottom = list(top), list(bottom)
+
+    t_d = None
+    if not load_path:
+        t_d = _load_data(data_path, data_type)
+
+    return (t_d, out_base, top, bottom)
+
+
+def _resolve_paths(data_path, out_path=None, load_path=None, out_name=None):
+    # returns data_path, the data type, the output folder, the path from
+    # which plantuml loads the json (None to write the data into the
+    # puml code) and the stem of the output puml code file
     if not isinstance(data_path, pathlib.Path):
         data_path = pathlib.Path(data_path)
 
@@ -612,6 +1247,9 @@ def handle_paths(
         data_type = "yaml"
     elif data_path.suffix == ".json":
         data_type = "json"
+    else:
+        # e.g. a stream of records, which is never loaded by plantuml
+        data_type = None
 
     if not out_path:
         # write puml code to same folder as json/yaml
@@ -642,38 +1280,63 @@ def handle_paths(
     else:
         out_base = output_path.joinpath(out_name)
 
-    if return_out_base_only:
-        return out_base
+    return data_path, data_type, output_path, j_name, out_base
+
+
+def _top_and_bottom(
+    output_path,
+    j_name,
+    title=None,
+    theme_name="plasma",
+    copy_theme_to_local=False,
+    scale=None,
+):
+    # returns the code at the top and bottom of the puml code, each joined
+    # into a single block for _assemble()
+    themes_dir = _themes_dir(output_path, theme_name, copy_theme_to_local)
+    return _frame_blocks(themes_dir, j_name, _title_key(title), theme_name, scale)
 
+
+def _themes_dir(output_path, theme_name, copy_theme_to_local):
+    # the folder from which the puml code loads the theme, which is
+    # placed in the output folder first if copy_theme_to_local is True
+    if output_path.match("gallery/puml_code"):
+        return "../../themes"
+    if copy_theme_to_local:
+        copy_theme_to_local_folder(theme_name, output_path)
+        return "themes"
+    return _THEMES_DIR
+
+
+def _title_key(title):
+    # the title as a hashable tuple of lines, or None
+    if not title:
+        return None
+    return (title,) if isinstance(title, str) else tuple(title)
+
+
+@functools.lru_cache(maxsize=256)
+def _frame_lines(themes_dir, j_name, title, theme_name, scale):
+    # the lines at the top and bottom of the puml code, built once for
+    # each combination of options
     json_lines = [
         '!$DEF_JSON = {"error" : "no data loaded"}',
         f"!$DATA = %load_json({j_name}, $DEF_JSON)",
     ]
 
-    if output_path.match("gallery/puml_code"):
-        themes_dir = "../../themes"
-    else:
-        if copy_theme_to_local:
-            copy_theme_to_local_folder(theme_name, output_path)
-            themes_dir = "themes"
-        else:
-            themes_dir = _THEMES_DIR
-
     if not title:
         top = [
             "@startjson",
             rf"!theme MOCHADA-{theme_name} from {themes_dir}",
         ]
 
-        if load_path and data_type == "json":
+        if j_name:
             top.insert(len(top), json_lines[0])
             top.insert(len(top), json_lines[1])
 
         bottom = ["@endjson"]
 
     else:
-        if isinstance(title, str):
-            title = [title]
         top = [
             "@startuml",
             "title",
@@ -684,7 +1347,7 @@ def handle_paths(
             rf"!theme MOCHADA-{theme_name} from {themes_dir}",
         ]
 
-        if load_path and data_type == "json":
+        if j_name:
             top.insert(1, json_lines[0])
             top.insert(2, json_lines[1])
 
@@ -693,22 +1356,40 @@ def handle_paths(
     if scale:
         top.insert(1, f"scale {scale}")
 
-    t_d = None
-    if not load_path:
-        with open(data_path) as f:
-            if data_type == "json":
-                t_d = json.load(f)
-            elif data_type == "yaml":
-                t_d = yaml.load(f, Loader=yaml.Loader)
+    return tuple(top), tuple(bottom)
 
-    return (t_d, out_base, top, bottom)
 
+@functools.lru_cache(maxsize=256)
+def _frame_blocks(themes_dir, j_name, title, theme_name, scale):
+    # the lines of _frame_lines() joined once
+    top, bottom = _frame_lines(themes_dir, j_name, title, theme_name, scale)
+    return ("\n".join(top),), ("\n".join(bottom),)
 
-def copy_theme_to_local_folder(theme_name, output_path):
+
+def _load_data(data_path, data_type):
+    with open(data_path) as f:
+        if data_type == "json":
+            return json.load(f)
+        elif data_type == "yaml":
+            return yaml.load(f, Loader=_YamlLoader)
+
+
+def copy_theme_to_local_folder(theme_name, output_path, mode=None):
     """
     Make a directory "themes" in output_path, then
-    copies the theme "theme_name" from __THEMES_DIR__
-    to output_path/themes.
+    place the theme "theme_name" from __THEMES_DIR__
+    in output_path/themes.
+
+    By default, the theme is copied atomically while holding a lock on
+    the "themes" folder, so that several processes can safely call
+    this function for the same output_path. An existing copy is kept.
+
+    If a shared theme store is configured (see
+    config.get_theme_store_dir()) or mode is given, the theme is placed
+    from the store instead (see themestore.place_theme()), so that many
+    output folders do not each hold a copy and all of them can be
+    updated with themestore.sync_themes(). If the store cannot be used,
+    the error is logged and the theme is copied.
 
     Parameters
     ----------
@@ -720,13 +1401,36 @@ def copy_theme_to_local_folder(theme_name, output_path):
     output_path : pathlib.Path
         Specifies the folder where the plantuml code file will be
         saved. Absolute or relative paths can be supplied.
+    mode : STR or None, optional
+        How the theme is placed from the store: "hardlink", "symlink",
+        "copy" or "auto", see themestore.place_theme(). If None, the theme
+        is placed with "auto" if a store is configured, and copied
+        otherwise.
+        The default is None.
+
+    Raises
+    ------
+    ValueError
+        Raised if mode is given but no theme store is configured.
     """
+    if mode is not None or get_theme_store_dir() is not None:
+        try:
+            place_theme(theme_name, output_path, mode=mode or "auto")
+            return
+        except OSError as e:
+            _logger.warning(
+                "Cannot place the theme %s from the theme store, copying it "
+                "instead: %s",
+                theme_name,
+                e,
+            )
+
     local_themes_dir = output_path.joinpath("themes")
-    if not local_themes_dir.exists():
-        local_themes_dir.mkdir()
+    local_themes_dir.mkdir(parents=True, exist_ok=True)
 
     theme_file = f"puml-theme-MOCHADA-{theme_name}.puml"
     theme_path = pathlib.Path(_THEMES_DIR).joinpath(theme_file)
     dest_path = local_themes_dir.joinpath(theme_file)
-    if not dest_path.exists():
-        shutil.copy(theme_path, dest_path)
+    with file_lock(local_themes_dir.joinpath(".lock")):
+        if not dest_path.exists():
+            copy_file_atomic(theme_path, dest_path)
@@ -0,0 +1,289 @@
+"""
+Functions to place MOCHADA themes in output folders from a shared,
+content-addressed store instead of copying them into every folder. The
+store keeps each version of a theme file once, named after the sha256
+of its content, and a theme is placed in an output folder as a hard
+link (or a symbolic link, or as a copy if neither is possible) to the
+stored file. The placements are recorded in the store, so that all of
+them can be updated in one step when the source theme changes.
+"""  # noqa: D400
+
+import contextlib
+import functools
+import hashlib
+import os
+import pathlib
+import re
+
+from mochada_kit import _THEMES_DIR
+from mochada_kit.config import get_theme_store_dir
+from mochada_kit.fileio import (
+    copy_file_atomic,
+    file_lock,
+    link_file_atomic,
+    write_bytes_atomic,
+    write_text_atomic,
+)
+
+_MODES = ("hardlink", "symlink", "copy")
+_REGISTRY = "placements.txt"
+_THEME_FILE_RE = re.compile(r"puml-theme-MOCHADA-(.+)\.puml")
+
+
+def _store_dir(store_dir):
+    store_dir = store_dir or get_theme_store_dir()
+    if store_dir is None:
+        raise ValueError(
+            "No theme store is configured. Pass store_dir, or set "
+            "MOCHADA_KIT_THEME_STORE or the key 'theme_store' in the "
+            "configuration file."
+        )
+    return pathlib.Path(store_dir).absolute()
+
+
+def store_theme(theme_name, store_dir=None):
+    """
+    Add the current version of a MOCHADA theme to the theme store.
+
+    Parameters
+    ----------
+    theme_name : STR
+        The part of the theme name after "MOCHADA-", e.g. "plasma".
+    store_dir : STR, pathlib.Path or None, optional
+        The folder of the store. If None, the configured store is used
+        (see config.get_theme_store_dir()).
+        The default is None.
+
+    Returns
+    -------
+    stored_path : pathlib.Path
+        The stored file, "objects/<ab>/<sha256>.puml" in the store. It is
+        read-only, since hard links to it share its content.
+
+    Raises
+    ------
+    ValueError
+        Raised if store_dir is None and no store is configured.
+    """
+    theme_path = pathlib.Path(_THEMES_DIR).joinpath(
+        f"puml-theme-MOCHADA-{theme_name}.puml"
+    )
+    stat = theme_path.stat()
+    digest, data = _theme_content(theme_path, stat.st_mtime_ns, stat.st_size)
+    stored_path = _store_dir(store_dir).joinpath(
+        "objects", digest[:2], f"{digest}.puml"
+    )
+    if not stored_path.exists():
+        stored_path.parent.mkdir(parents=True, exist_ok=True)
+        write_bytes_atomic(stored_path, data)
+        os.chmod(stored_path, 0o444)
+    return stored_path
+
+
+@functools.lru_cache(maxsize=64)
+def _theme_content(theme_path, mtime_ns, size):
+    # the modification time and size are part of the cache key, so that
+    # a modified theme is read again
+    data = theme_path.read_bytes()
+    return hashlib.sha256(data).hexdigest(), data
+
+
+def _is_placed(dest_path, stored_path, mode):
+    # whether dest_path already is a placement of stored_path
+    try:
+        if mode == "copy":
+            return (
+                not dest_path.is_symlink()
+                and dest_path.stat().st_size == stored_path.stat().st_size
+                and dest_path.read_bytes() == stored_path.read_bytes()
+            )
+        return dest_path.is_symlink() == (mode == "symlink") and os.path.samefile(
+            dest_path, stored_path
+        )
+    except OSError:
+        return False
+
+
+def _place(stored_path, dest_path, modes):
+    # place stored_path at dest_path with the first mode which works
+    for i, mode in enumerate(modes):
+        try:
+            if mode == "copy":
+                copy_file_atomic(stored_path, dest_path)
+            else:
+                link_file_atomic(stored_path, dest_path, symbolic=mode == "symlink")
+            return mode
+        except OSError:
+            if i == len(modes) - 1:
+                raise
+    return None
+
+
+def _read_registry(store_dir):
+    # the placements as a dict of path: mode; later lines win
+    placements = {}
+    with contextlib.suppress(FileNotFoundError):
+        for line in store_dir.joinpath(_REGISTRY).read_text("utf-8").splitlines():
+            mode, _, path = line.partition("\t")
+            if mode in _MODES and path:
+                placements[path] = mode
+    return placements
+
+
+def place_theme(theme_name, output_path, mode="auto", store_dir=None):
+    """
+    Place a MOCHADA theme in the "themes" folder of an output folder,
+    linked to the theme store.
+
+    The theme is placed as "themes/puml-theme-MOCHADA-<theme_name>.puml",
+    like a copy made by tables.copy_theme_to_local_folder(), and the
+    placement is recorded in the store so that sync_themes() can update
+    it. A theme which is already placed is left as it is; any other file
+    of the same name, e.g. an earlier copy, is replaced. Hard links share
+    their content with the store, so placed themes are read-only and must
+    not be edited; copy a theme instead to change it.
+
+    Parameters
+    ----------
+    theme_name : STR
+        The part of the theme name after "MOCHADA-", e.g. "plasma".
+    output_path : STR or pathlib.Path
+        The folder where the plantuml code files are saved.
+    mode : STR, optional
+        "hardlink", "symlink" or "copy", or "auto" to try them in this
+        order. Hard links are files in their own right, so the output
+        folder still works when it is moved or archived, but they are
+        only possible on the file system of the store; symbolic links may
+        need special permissions on Windows.
+        The default is "auto".
+    store_dir : STR, pathlib.Path or None, optional
+        The folder of the store. If None, the configured store is used
+        (see config.get_theme_store_dir()).
+        The default is None.
+
+    Returns
+    -------
+    mode : STR
+        The mode of the placement, "hardlink", "symlink" or "copy".
+
+    Raises
+    ------
+    ValueError
+        Raised if mode is not known, or if store_dir is None and no store
+        is configured.
+    OSError
+        Raised if the theme cannot be placed in any of the modes.
+    """
+    if mode != "auto" and mode not in _MODES:
+        raise ValueError(f"mode must be 'auto' or one of {list(_MODES)}.")
+    modes = _MODES if mode == "auto" else (mode,)
+    store_dir = _store_dir(store_dir)
+    stored_path = store_theme(theme_name, store_dir)
+
+    local_themes_dir = pathlib.Path(output_path).absolute().joinpath("themes")
+    local_themes_dir.mkdir(parents=True, exist_ok=True)
+    dest_path = local_themes_dir.joinpath(f"puml-theme-MOCHADA-{theme_name}.puml")
+    for m in modes:
+        if _is_placed(dest_path, stored_path, m):
+            return m
+
+    with file_lock(store_dir.joinpath(".lock")):
+        # stored again in case sync_themes() has just pruned it
+        stored_path = store_theme(theme_name, store_dir)
+        placed = _place(stored_path, dest_path, modes)
+        with open(store_dir.joinpath(_REGISTRY), "a", encoding="utf-8") as f:
+            f.write(f"{placed}\t{dest_path}\n")
+    return placed
+
+
+def list_placements(store_dir=None):
+    """
+    List the themes placed from the theme store.
+
+    Parameters
+    ----------
+    store_dir : STR, pathlib.Path or None, optional
+        The folder of the store. If None, the configured store is used
+        (see config.get_theme_store_dir()).
+        The default is None.
+
+    Returns
+    -------
+    placements : DICT
+        Dict where the keys are the paths of the placed theme files as
+        strings and the values are their modes.
+
+    Raises
+    ------
+    ValueError
+        Raised if store_dir is None and no store is configured.
+    """
+    return _read_registry(_store_dir(store_dir))
+
+
+def sync_themes(store_dir=None, prune=True):
+    """
+    Update all themes placed from the theme store to the current version
+    of their source theme.
+
+    Each placement keeps its mode. Placements whose file or folder no
+    longer exists, or whose source theme no longer exists, are removed
+    from the record and not created again.
+
+    Parameters
+    ----------
+    store_dir : STR, pathlib.Path or None, optional
+        The folder of the store. If None, the configured store is used
+        (see config.get_theme_store_dir()).
+        The default is None.
+    prune : BOOL, optional
+        If True, remove stored files which are neither used by a recorded
+        placement nor hard linked anywhere else.
+        The default is True.
+
+    Returns
+    -------
+    report : DICT
+        Dict where the keys are the paths of the placed theme files as
+        strings and the values are "updated", "unchanged" or "removed".
+
+    Raises
+    ------
+    ValueError
+        Raised if store_dir is None and no store is configured.
+    """
+    store_dir = _store_dir(store_dir)
+    report, placements, used = {}, {}, set()
+    with file_lock(store_dir.joinpath(".lock")):
+        for path, mode in _read_registry(store_dir).items():
+            dest_path = pathlib.Path(path)
+            m = _THEME_FILE_RE.fullmatch(dest_path.name)
+            if not m or not (dest_path.exists() or dest_path.is_symlink()):
+                report[path] = "removed"
+                continue
+            try:
+                stored_path = store_theme(m.group(1), store_dir)
+            except FileNotFoundError:
+                report[path] = "removed"
+                continue
+            if _is_placed(dest_path, stored_path, mode):
+                report[path] = "unchanged"
+            else:
+                # fall back to a copy, e.g. if the folder has been moved to
+                # another file system
+                mode = _place(stored_path, dest_path, (mode, "copy"))
+                report[path] = "updated"
+            placements[path] = mode
+            used.add(stored_path)
+
+        write_text_atomic(
+            store_dir.joinpath(_REGISTRY),
+            "".join(f"{mode}\t{path}\n" for path, mode in placements.items()),
+        )
+
+        if prune:
+            for stored_path in store_dir.glob("objects/*/*.puml"):
+                if stored_path not in used and stored_path.stat().st_nlink == 1:
+                    os.chmod(stored_path, 0o644)
+                    stored_path.unlink()
+    return report
@@ -0,0 +1,230 @@
+"""
+Functions to check that the data of a json or yaml file has the
+structure of the CHADA tables templates, before any plantuml code is
+generated from it. The expected structure is derived from
+templates/CHADA_TABLES_TEMPLATE.json and
+templates/chada_tables_template.yaml, which must agree, and compiled
+once, so that many documents can be checked quickly. Every problem of
+a document is reported, not only the first.
+"""  # noqa: D400
+
+import functools
+import json
+import pathlib
+
+import yaml
+
+from mochada_kit import _THEMES_DIR
+
+_TEMPLATES_DIR = pathlib.Path(_THEMES_DIR).parent.joinpath("templates")
+_JSON_TEMPLATE = "CHADA_TABLES_TEMPLATE.json"
+_YAML_TEMPLATE = "chada_tables_template.yaml"
+
+# the types of values a section is expected to have: an object of key/value
+# rows, or a string, e.g. " " for a section which has not been filled in;
+# other values are drawn as their json
+_SECTION_TYPES = (dict, str)
+
+
+def _type_name(value):
+    # the json name of the type of a value
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, dict):
+        return "object"
+    if isinstance(value, list):
+        return "array"
+    return type(value).__name__
+
+
+def _path(*keys):
+    # an unambiguous path to a value, e.g. $["experiment"]["2.4 Detector"]
+    return "$" + "".join(f"[{json.dumps(str(k), ensure_ascii=False)}]" for k in keys)
+
+
+def _problem(path, expected, found, severity="error"):
+    return {"path": path, "expected": expected, "found": found, "severity": severity}
+
+
+@functools.lru_cache(maxsize=8)
+def compile_chada_schema(templates_dir=None):
+    """
+    Derive the expected structure of CHADA data from the json and yaml
+    templates.
+
+    Parameters
+    ----------
+    templates_dir : STR, pathlib.Path or None, optional
+        The folder containing CHADA_TABLES_TEMPLATE.json and
+        chada_tables_template.yaml. If None, the templates of mochada_kit
+        are used.
+        The default is None.
+
+    Returns
+    -------
+    schema : DICT
+        Dict where the keys are the sections in the order of the templates
+        and the values are dicts with the keys "title" (the key of the
+        first row, e.g. "2. Experiment"), "keys" (tuple of the keys of the
+        rows) and "key_set" (frozenset of the same keys). The result is
+        cached and must not be modified.
+
+    Raises
+    ------
+    ValueError
+        Raised if the two templates do not have the same structure.
+    """
+    templates_dir = pathlib.Path(templates_dir or _TEMPLATES_DIR)
+    with open(templates_dir.joinpath(_JSON_TEMPLATE), encoding="utf-8") as f:
+        template = json.load(f)
+    with open(templates_dir.joinpath(_YAML_TEMPLATE), encoding="utf-8") as f:
+        yaml_template = yaml.safe_load(f)
+
+    schema = {}
+    for section, rows in template.items():
+        keys = tuple(rows)
+        yaml_rows = yaml_template.get(section)
+        if not isinstance(yaml_rows, dict) or tuple(yaml_rows) != keys:
+            raise ValueError(
+                f"The json and yaml templates differ in the section {section}."
+            )
+        schema[section] = {"title": keys[0], "keys": keys, "key_set": frozenset(keys)}
+    if set(yaml_template) != set(schema):
+        raise ValueError("The json and yaml templates have different sections.")
+    return schema
+
+
+def validate_chada(data, schema=None):
+    """
+    Check CHADA data against the structure of the templates.
+
+    Errors are problems with which the tables cannot be drawn: data which
+    is not an object and a missing section. Warnings are differences from
+    the template which are drawn as they are: a section which is neither
+    an object nor a string (e.g. an array or null, drawn as its json), a
+    section object which is empty or whose first row is not the title of
+    the section (e.g. "2. Experiment"), so that no row is highlighted,
+    rows of the template which are missing, rows which are not in the
+    template and keys which are not sections.
+
+    Parameters
+    ----------
+    data : DICT
+        The data read from a json or yaml file.
+    schema : DICT or None, optional
+        The expected structure, from compile_chada_schema(). If None, the
+        structure of the templates of mochada_kit is used.
+        The default is None.
+
+    Returns
+    -------
+    problems : LIST
+        List of dicts, one per problem, with the keys "path" (e.g.
+        '$["experiment"]'), "expected", "found" and "severity" ("error" or
+        "warning"). The list is empty if the data is valid.
+    """
+    schema = schema or compile_chada_schema()
+    if not isinstance(data, dict):
+        return [_problem("$", "object", _type_name(data))]
+
+    problems = []
+    for section, expected in schema.items():
+        path = _path(section)
+        if section not in data:
+            problems.append(_problem(path, "object or string", "missing"))
+            continue
+        rows = data[section]
+        if not isinstance(rows, _SECTION_TYPES):
+            problems.append(
+                _problem(path, "object or string", _type_name(rows), "warning")
+            )
+            continue
+        if isinstance(rows, str):
+            continue
+        if not rows:
+            problems.append(
+                _problem(
+                    path, f'first row "{expected["title"]}"', "empty object", "warning"
+                )
+            )
+            continue
+        first = next(iter(rows))
+        if first != expected["title"]:
+            problems.append(
+                _problem(
+                    _path(section, first),
+                    f'first row "{expected["title"]}"',
+                    f'first row "{first}"',
+                    "warning",
+                )
+            )
+        for key in expected["keys"]:
+            if key not in rows:
+                problems.append(
+                    _problem(_path(section, key), "row", "missing", "warning")
+                )
+        for key in rows:
+            if key not in expected["key_set"]:
+                problems.append(
+                    _problem(
+                        _path(section, key), "no row", "row not in template", "warning"
+                    )
+                )
+
+    for key in data:
+        if key not in schema:
+            problems.append(
+                _problem(_path(key), "no key", "key which is not a section", "warning")
+            )
+    return problems
+
+
+def format_problems(problems):
+    """
+    Describe problems found by validate_chada() as text.
+
+    Parameters
+    ----------
+    problems : LIST
+        The problems.
+
+    Returns
+    -------
+    text : STR
+        One line per problem, e.g.
+        'error: $["raw_data"]: expected object or string, found missing'.
+    """
+    return "\n".join(
+        f"{p['severity']}: {p['path']}: expected {p['expected']}, found {p['found']}"
+        for p in problems
+    )
+
+
+def check_chada(data, source):
+    """
+    Raise an error listing all errors in CHADA data, see validate_chada().
+
+    Parameters
+    ----------
+    data : DICT
+        The data read from a json or yaml file.
+    source : STR or pathlib.Path
+        The file (or other source) of the data, for the error message.
+
+    Raises
+    ------
+    ValueError
+        Raised if the data has any errors. Warnings are ignored.
+    """
+    errors = [p for p in validate_chada(data) if p["severity"] == "error"]
+    if errors:
+        raise ValueError(
+            f"{source} does not have the structure of CHADA tables:\n"
+            f"{format_problems(errors)}"
+        )
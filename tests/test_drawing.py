@@ -0,0 +1,45 @@
+"""Tests of mochada_kit.drawing."""
+
+import json
+import pathlib
+
+import pytest
+
+from mochada_kit.drawing import chada_svg_variants, draw_json_svg, parse_creole
+from mochada_kit.tables import ChadaDocument
+
+DATA_DIR = pathlib.Path(__file__).parents[1].joinpath("data")
+
+
+@pytest.fixture
+def chada_data():
+    """Return the data of the SEM-EBSD example."""
+    with open(DATA_DIR.joinpath("chada_tables_SEM-EBSD.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("value", [" ", "", "TBD later"])
+def test_string_section(chada_data, value):
+    """A section which is a string is drawn as a single value."""
+    chada_data["raw_data"] = value
+    doc = ChadaDocument(DATA_DIR.joinpath("string_section.json"), data=chada_data)
+    svgs = chada_svg_variants(doc)
+    assert len(svgs) == 11
+    single = svgs["string_section_single_raw_data.svg"]
+    assert single.count("<text") == (1 if value else 0)
+    assert value.replace(" ", "&#160;") in single
+
+
+@pytest.mark.parametrize("value", ["", 3, None, {}, []])
+def test_scalar_and_empty_data(value):
+    """Scalars and empty objects or arrays are drawn without errors."""
+    assert draw_json_svg(value).startswith("<svg ")
+
+
+@pytest.mark.parametrize("text", ["[[]]", "[[ ]]", "a [[  ]] b"])
+def test_empty_link(text):
+    """An empty link is drawn as plain text."""
+    lines = parse_creole(text)
+    assert "".join(run for run, _ in lines[0]) == text
+    assert all(style["href"] is None for _, style in lines[0])
+    assert draw_json_svg({"a": text}).startswith("<svg ")
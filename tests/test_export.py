@@ -0,0 +1,61 @@
+"""Tests of mochada_kit.export."""
+
+import json
+import pathlib
+
+import pytest
+
+from mochada_kit.export import (
+    _creole_html,
+    _creole_markdown,
+    export_html,
+    export_markdown,
+)
+from mochada_kit.tables import ChadaDocument
+
+DATA_DIR = pathlib.Path(__file__).parents[1].joinpath("data")
+
+
+@pytest.fixture
+def chada_data():
+    """Return the data of the SEM-EBSD example."""
+    with open(DATA_DIR.joinpath("chada_tables_SEM-EBSD.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("value", [" ", "", "TBD later"])
+def test_string_section(chada_data, value):
+    """A section which is a string is exported as a single cell."""
+    chada_data["raw_data"] = value
+    doc = ChadaDocument(DATA_DIR.joinpath("string_section.json"), data=chada_data)
+    page = export_html(doc)["string_section_raw_data.html"]
+    assert f'<tr class="chada-raw_data"><td>{value}</td></tr>' in page
+    markdown = export_markdown(doc)["string_section_raw_data.md"]
+    table = markdown.split("\n\n", 1)[1].strip().splitlines()
+    assert table == ["|   |   |", "| --- | --- |", f"|  | {value.strip()} |"]
+
+
+@pytest.mark.parametrize(
+    "href",
+    [
+        "javascript:alert(1)",
+        "JavaScript:alert(1)",
+        "\x01javascript:alert(1)",
+        "data:text/html,<script>alert(1)</script>",
+        "vbscript:msgbox",
+    ],
+)
+def test_unsafe_links_are_text(href):
+    """Links with other schemes than http, https and mailto are plain text."""
+    text = f"[[{href} label]]"
+    assert "<a " not in _creole_html(text)
+    assert "](" not in _creole_markdown(text)
+
+
+@pytest.mark.parametrize(
+    "href",
+    ["https://example.org", "http://example.org", "mailto:a@b.c", "x_raw_data.svg"],
+)
+def test_safe_links(href):
+    """Links to http, https and mailto urls and relative links are kept."""
+    assert f'<a href="{href}"' in _creole_html(f"[[{href} label]]")
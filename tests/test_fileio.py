@@ -0,0 +1,24 @@
+"""Tests of mochada_kit.fileio."""
+
+import os
+import stat
+
+import pytest
+
+from mochada_kit.fileio import atomic_output_dir, write_text_atomic
+
+
+@pytest.mark.skipif(os.name != "posix", reason="permissions of posix systems")
+@pytest.mark.parametrize("umask", [0o022, 0o077, 0o002])
+def test_umask_at_write_time(tmp_path, umask):
+    """Files get 0o666 less the umask which is set when they are written."""
+    old = os.umask(umask)
+    try:
+        write_text_atomic(tmp_path / "a.txt", "a")
+        with atomic_output_dir(tmp_path / "out") as tmp_dir:
+            (tmp_dir / "b.txt").write_text("b")
+    finally:
+        os.umask(old)
+    for path in (tmp_path / "a.txt", tmp_path / "out" / "b.txt"):
+        assert stat.S_IMODE(path.stat().st_mode) == 0o666 & ~umask
+    assert [p.name for p in tmp_path.iterdir() if p.name.startswith(".")] == []
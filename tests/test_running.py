@@ -0,0 +1,128 @@
+"""Tests of mochada_kit.running."""
+
+import pathlib
+import signal
+import threading
+import time
+
+import pytest
+
+from mochada_kit import concurrency, running
+from mochada_kit.running import (
+    _run_in_pool,
+    classify_render_failure,
+    fit_dpi_to_pixel_budget,
+    shard_puml_files,
+)
+
+FILES = [pathlib.Path(f"diagrams/d{i:03d}.puml") for i in range(200)]
+
+
+def _assignment(files, count, **kwargs):
+    return {
+        f: index
+        for index in range(count)
+        for f in shard_puml_files(files, (index, count), **kwargs)
+    }
+
+
+@pytest.mark.parametrize("count", [1, 3, 8])
+def test_shards_cover_files_once(count):
+    """Each file is in exactly one shard."""
+    shards = [shard_puml_files(FILES, (i, count)) for i in range(count)]
+    assert sorted(f for s in shards for f in s) == sorted(FILES)
+    assert all(shards) or count > len(FILES)
+
+
+def test_shards_are_stable():
+    """Adding or removing files does not move the other files."""
+    before = _assignment(FILES, 4)
+    added = FILES + [pathlib.Path(f"diagrams/new{i}.puml") for i in range(20)]
+    after = _assignment(added, 4)
+    assert all(after[f] == before[f] for f in FILES)
+    after = _assignment(FILES[::2], 4)
+    assert all(after[f] == before[f] for f in FILES[::2])
+
+
+def test_balanced_shards():
+    """With balance=True, the shards have about the same cost."""
+    costs = {f.name: float(i % 17 + 1) for i, f in enumerate(FILES)}
+    totals = [
+        sum(costs[f.name] for f in shard_puml_files(FILES, (i, 4), costs, balance=True))
+        for i in range(4)
+    ]
+    assert max(totals) - min(totals) <= max(costs.values())
+
+
+def test_pool_keeps_order_when_limit_changes(monkeypatch):
+    """Files start in the given order while the adaptive limit grows."""
+    monkeypatch.setattr(concurrency, "peak_child_rss_mb", lambda: None)
+    limit = concurrency.AdaptiveLimit(1, 4)
+    lock = threading.Lock()
+    started = []
+    running = [0, 0]
+
+    def _job(f):
+        with lock:
+            started.append(f)
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.001 * (f % 5))
+        with lock:
+            running[0] -= 1
+
+    files = list(range(60))
+    _run_in_pool(_job, files, 4, limit=limit)
+    assert started == files
+    assert limit.limit > 1
+    assert 1 < running[1] <= 4
+
+
+@pytest.mark.parametrize(
+    "returncode, output, reason",
+    [
+        (-9, "", "memory"),  # SIGKILL, which Windows does not define
+        (137, "", "memory"),
+        (1, "java.lang.OutOfMemoryError: Java heap space", "memory"),
+        (1, "Too many open files", "transient"),
+        (-signal.SIGTERM, "", None),
+        (-signal.SIGINT, "Too many open files", None),
+        (1, "Syntax Error?", None),
+    ],
+)
+def test_classify_render_failure(returncode, output, reason):
+    """Only lack of memory and temporary problems are worth retrying."""
+    assert classify_render_failure(returncode, output) == reason
+
+
+def test_fit_dpi_scales_from_96_dpi():
+    """The budget is computed at the requested dpi, from sizes at 96 dpi."""
+    # 960x960 px at 96 dpi is 3000x3000 px at 300 dpi
+    assert fit_dpi_to_pixel_budget((960, 960), 9_000_000, output_dpi=300) == 300
+    with pytest.warns(UserWarning, match="from 300 to 150"):
+        assert fit_dpi_to_pixel_budget((960, 960), 2_250_000, output_dpi=300) == 150
+    assert fit_dpi_to_pixel_budget((960, 960), 921_600) is None
+
+
+def test_skinparam_dpi_is_fitted(tmp_path, monkeypatch):
+    """A dpi given as a skin parameter is fitted to the budget as well."""
+    code = tmp_path / "diagram.puml"
+    code.write_text("@startuml\nA -> B\n@enduml\n", encoding="utf-8")
+    commands = []
+    monkeypatch.setattr(running, "estimate_diagram_size", lambda *a, **k: (960, 960))
+    monkeypatch.setattr(
+        running,
+        "_run_plantuml_atomic",
+        lambda cmd, *a, **k: commands.append(cmd(output_dir="out")),
+    )
+    with pytest.warns(UserWarning, match="from 300 to 150"):
+        running.run_plantuml_code(
+            code,
+            plantuml_path="plantuml.jar",
+            output_type="-tpng",
+            skinparam_opts={"dpi": 300, "svgLinkTarget": "_top"},
+            max_pixels=2_250_000,
+        )
+    (cmd,) = commands
+    assert [c for c in map(str, cmd) if c.lower().startswith("-sdpi")] == ["-Sdpi=150"]
+    assert "-SsvgLinkTarget=_top" in cmd
@@ -0,0 +1,54 @@
+"""Tests of mochada_kit.session."""
+
+import subprocess
+import sys
+import threading
+
+from mochada_kit.session import _DELIMITER, PlantumlSession
+
+# a stand-in for plantuml.jar in -pipe mode, which writes a large "image"
+# for each diagram as soon as it has read it, like plantuml does
+FAKE_PLANTUML = f"""
+import sys
+for line in sys.stdin.buffer:
+    if line.startswith(b"@end"):
+        sys.stdout.buffer.write(b"<svg>" + b"x" * 300000 + b"</svg>\\n")
+        sys.stdout.buffer.write({_DELIMITER!r} + b"\\n")
+        sys.stdout.buffer.flush()
+"""
+
+
+class FakeSession(PlantumlSession):
+    """A session running FAKE_PLANTUML instead of plantuml.jar."""
+
+    def _start(self):
+        self._process = subprocess.Popen(
+            [sys.executable, "-c", FAKE_PLANTUML],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._buffer = b""
+
+
+def test_large_input_and_output_do_not_deadlock():
+    """Many large diagrams are rendered without both processes blocking."""
+    diagram = "@startuml\n" + "' padding\n" * 20000 + "@enduml\n"
+    code = diagram * 10
+    result = []
+    session = FakeSession(plantuml_path="plantuml.jar")
+    thread = threading.Thread(
+        target=lambda: result.append(session.render(code)), daemon=True
+    )
+    thread.start()
+    thread.join(timeout=60)
+    deadlocked = thread.is_alive()
+    if deadlocked:
+        # unblock the render thread before closing the session
+        session._process.kill()
+        thread.join()
+    session.close()
+    assert not deadlocked, "render() deadlocked"
+    images = result[0]
+    assert len(images) == 10
+    assert all(i.startswith(b"<svg>") and i.endswith(b"</svg>") for i in images)
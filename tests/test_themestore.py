@@ -0,0 +1,70 @@
+"""Tests of mochada_kit.themestore and tables.copy_theme_to_local_folder()."""
+
+import logging
+import os
+
+import pytest
+
+from mochada_kit.tables import copy_theme_to_local_folder
+from mochada_kit.themestore import list_placements, place_theme
+
+THEME_FILE = "puml-theme-MOCHADA-plasma.puml"
+
+
+@pytest.fixture(autouse=True)
+def config(tmp_path, monkeypatch):
+    """Use an empty configuration and no theme store."""
+    monkeypatch.setenv("MOCHADA_KIT_CONFIG", str(tmp_path / "config.json"))
+    monkeypatch.delenv("MOCHADA_KIT_THEME_STORE", raising=False)
+
+
+def test_copy_by_default(tmp_path):
+    """Without a configured store, the theme is a plain copy."""
+    out = tmp_path / "out"
+    copy_theme_to_local_folder("plasma", out)
+    theme = out / "themes" / THEME_FILE
+    assert theme.is_file() and not theme.is_symlink()
+    assert theme.stat().st_nlink == 1
+    assert os.access(theme, os.W_OK)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["out"]
+
+
+def test_existing_copy_is_kept(tmp_path):
+    """An existing (e.g. edited) copy is not replaced."""
+    out = tmp_path / "out"
+    theme = out / "themes" / THEME_FILE
+    theme.parent.mkdir(parents=True)
+    theme.write_text("edited", encoding="utf-8")
+    copy_theme_to_local_folder("plasma", out)
+    assert theme.read_text(encoding="utf-8") == "edited"
+
+
+def test_store_when_configured(tmp_path, monkeypatch):
+    """With a configured store, the theme is placed and recorded."""
+    store = tmp_path / "store"
+    monkeypatch.setenv("MOCHADA_KIT_THEME_STORE", str(store))
+    out = tmp_path / "out"
+    copy_theme_to_local_folder("plasma", out)
+    theme = out / "themes" / THEME_FILE
+    assert str(theme.absolute()) in list_placements()
+    assert theme.stat().st_nlink == 2
+
+
+def test_store_error_is_logged(tmp_path, monkeypatch, caplog):
+    """If the store cannot be used, the error is logged and the theme copied."""
+    store = tmp_path / "store"
+    store.write_text("not a folder", encoding="utf-8")
+    monkeypatch.setenv("MOCHADA_KIT_THEME_STORE", str(store))
+    out = tmp_path / "out"
+    with caplog.at_level(logging.WARNING, logger="mochada_kit.tables"):
+        copy_theme_to_local_folder("plasma", out)
+    assert "Cannot place the theme plasma" in caplog.text
+    assert (out / "themes" / THEME_FILE).is_file()
+
+
+def test_no_store_configured(tmp_path):
+    """The store functions need a store."""
+    with pytest.raises(ValueError, match="No theme store is configured"):
+        place_theme("plasma", tmp_path)
+    with pytest.raises(ValueError, match="No theme store is configured"):
+        copy_theme_to_local_folder("plasma", tmp_path, mode="hardlink")
@@ -0,0 +1,50 @@
+"""Tests of mochada_kit.validation."""
+
+import json
+import pathlib
+
+import pytest
+
+from mochada_kit.tables import ChadaDocument, write_chada_tables_plantuml
+from mochada_kit.validation import validate_chada
+
+DATA_DIR = pathlib.Path(__file__).parents[1].joinpath("data")
+
+
+@pytest.fixture
+def chada_data():
+    """Return the data of the SEM-EBSD example."""
+    with open(DATA_DIR.joinpath("chada_tables_SEM-EBSD.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _severities(problems):
+    return {p["path"]: p["severity"] for p in problems}
+
+
+def test_valid(chada_data):
+    """The example has no problems."""
+    assert validate_chada(chada_data) == []
+
+
+def test_missing_section_is_error(chada_data):
+    """A missing section is an error, which the writers raise."""
+    del chada_data["experiment"]
+    assert _severities(validate_chada(chada_data)) == {'$["experiment"]': "error"}
+    with pytest.raises(ValueError, match="experiment"):
+        ChadaDocument(DATA_DIR.joinpath("x.json"), data=chada_data)
+
+
+@pytest.mark.parametrize(
+    "rows", [{}, {"Experiment": "first row renamed"}, ["a", "b"], 3, None]
+)
+def test_first_row_is_warning(chada_data, rows, tmp_path):
+    """A section without its title as first row or of another type is drawn."""
+    chada_data["experiment"] = rows
+    problems = validate_chada(chada_data)
+    assert problems
+    assert all(p["severity"] == "warning" for p in problems)
+    data_path = tmp_path / "renamed.json"
+    data_path.write_text(json.dumps(chada_data), encoding="utf-8")
+    changed = write_chada_tables_plantuml(data_path)
+    assert len(changed) == 5